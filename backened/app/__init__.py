@@ -1,17 +1,45 @@
 from flask import Flask
+from config import MAX_UPLOAD_BYTES, WARM_UP_SERVICES, METRICS_DIRECTORY, METRICS_FLUSH_SECONDS
 from flask_cors import CORS 
 from modules.document_processing import document_bp
 from modules.chatbot import chatbot_bp
 from modules.audio_processing import audio_bp
+from modules.metrics import metrics_bp, registry
+from modules.jobs import job_queue
+from modules.uploads import UploadRequest
+from modules.services import warm_up
 
-def create_app():
+
+def start_background():
+    """Starts what every serving process runs for itself: queued ingestion jobs and the service warm-up.
+
+    Under a preloading server this runs in each worker after the fork (see gunicorn.conf.py).
+    """
+    if METRICS_DIRECTORY:
+        registry.share(METRICS_DIRECTORY, METRICS_FLUSH_SECONDS)
+    # Pick up ingestion jobs that were queued or interrupted before a restart
+    job_queue.resume()
+    timings = warm_up(WARM_UP_SERVICES)
+    if timings:
+        print(f"Warmed up services: {timings}")
+
+
+def create_app(background=True):
     app = Flask(__name__)
 
+    # Uploads are spooled once, straight into the upload directory, and capped in size
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
     CORS(app)
     
     # Register Blueprints
     app.register_blueprint(document_bp, url_prefix='/document')
     app.register_blueprint(chatbot_bp, url_prefix='/chatbot')
     app.register_blueprint(audio_bp, url_prefix='/speech')
+    app.register_blueprint(metrics_bp)
+
+    if background:
+        start_background()
 
     return app
\ No newline at end of file
@@ -3,4 +3,142 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
\ No newline at end of file
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+# Startup
+# Services built when a serving process starts instead of on first request: "all", "none" or a comma-separated list
+WARM_UP_SERVICES = os.getenv('WARM_UP_SERVICES', 'none')
+
+# Embedding cache
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'docs/embedding_cache.sqlite3')
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+
+# Ingestion jobs
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'docs/jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+UPLOAD_DIRECTORY = os.getenv('UPLOAD_DIRECTORY', 'docs/uploads/')
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+
+# Embedding pipeline
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '128'))
+EMBED_BATCH_TOKENS = int(os.getenv('EMBED_BATCH_TOKENS', '50000'))
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', '6'))
+
+# Ask pipeline
+ASK_WORKERS = int(os.getenv('ASK_WORKERS', '32'))
+
+# Metrics
+# Requests and jobs slower than this are logged with their stage breakdown (0 disables the log)
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '0'))
+# Worker processes of one server write their metrics here so that /metrics adds them all up (unset: this process only)
+METRICS_DIRECTORY = os.getenv('METRICS_DIRECTORY', '')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+# Semantic answer cache
+INDEX_VERSION_PATH = os.getenv('INDEX_VERSION_PATH', 'docs/index_version')
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000'))
+
+# Conversation sessions
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', 'docs/sessions.sqlite3')
+SESSION_WINDOW = int(os.getenv('SESSION_WINDOW', '5'))
+SESSION_MAX_HISTORY = int(os.getenv('SESSION_MAX_HISTORY', '200'))
+SESSION_IDLE_TIMEOUT = int(os.getenv('SESSION_IDLE_TIMEOUT', '3600'))
+
+# Moderation
+MODERATION_CACHE_SIZE = int(os.getenv('MODERATION_CACHE_SIZE', '10000'))
+MODERATION_MIN_CHARS = int(os.getenv('MODERATION_MIN_CHARS', '3'))
+MODERATION_REMOTE_OUTPUT = os.getenv('MODERATION_REMOTE_OUTPUT', 'true').lower() == 'true'
+
+# Translation
+TRANSLATION_CACHE_PATH = os.getenv('TRANSLATION_CACHE_PATH', 'docs/translations.sqlite3')
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', '5000'))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv('TRANSLATION_CACHE_MAX_ENTRIES', '100000'))
+TRANSLATION_BATCH_WINDOW_MS = int(os.getenv('TRANSLATION_BATCH_WINDOW_MS', '10'))
+TRANSLATION_MAX_BATCH = int(os.getenv('TRANSLATION_MAX_BATCH', '8'))
+
+# Retrieval
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')
+RETRIEVAL_K = int(os.getenv('RETRIEVAL_K', '4'))
+KEYWORD_INDEX_PATH = os.getenv('KEYWORD_INDEX_PATH', 'docs/keyword_index.sqlite3')
+
+# Document collections
+COLLECTION_DIRECTORY = os.getenv('COLLECTION_DIRECTORY', 'docs/collections/')
+COLLECTION_IDLE_SECONDS = int(os.getenv('COLLECTION_IDLE_SECONDS', '600'))
+COLLECTION_MAX_OPEN = int(os.getenv('COLLECTION_MAX_OPEN', '32'))
+# Caps the memory of loaded Chroma collections, unloading the least recently used first (0 keeps all loaded)
+CHROMA_MEMORY_LIMIT_BYTES = int(os.getenv('CHROMA_MEMORY_LIMIT_BYTES', '0'))
+
+# Vector index
+# "chroma" searches the Chroma collections; "quantized" searches memory-mapped, quantized copies of their vectors
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma')
+VECTOR_INDEX_DIRECTORY = os.getenv('VECTOR_INDEX_DIRECTORY', 'docs/vector_index/')
+# "int8" (a quarter of the float32 size) or "float16" (half)
+VECTOR_INDEX_DTYPE = os.getenv('VECTOR_INDEX_DTYPE', 'int8')
+# Candidates per result that are rescored with the full-precision vectors
+VECTOR_INDEX_RESCORE_FACTOR = int(os.getenv('VECTOR_INDEX_RESCORE_FACTOR', '8'))
+
+# Context packing
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.8'))
+
+# Question rephrasing
+REPHRASE_SIMILARITY_THRESHOLD = float(os.getenv('REPHRASE_SIMILARITY_THRESHOLD', '0.9'))
+REPHRASE_MIN_WORDS = int(os.getenv('REPHRASE_MIN_WORDS', '4'))
+
+# Bulk ingestion
+BULK_PARSE_WORKERS = int(os.getenv('BULK_PARSE_WORKERS', str(os.cpu_count() or 2)))
+BULK_INDEX_WORKERS = int(os.getenv('BULK_INDEX_WORKERS', '4'))
+# Directory ingestion over the API is limited to paths under this root (disabled when unset)
+BULK_INGEST_ROOT = os.getenv('BULK_INGEST_ROOT')
+# Zip archives that would extract to more than this, in bytes or files, are rejected
+ARCHIVE_MAX_BYTES = int(os.getenv('ARCHIVE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+ARCHIVE_MAX_FILES = int(os.getenv('ARCHIVE_MAX_FILES', '10000'))
+
+# Web crawling
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', '8'))
+# Upper bounds for the depth and page count a crawl request may ask for
+CRAWL_MAX_DEPTH = int(os.getenv('CRAWL_MAX_DEPTH', '3'))
+CRAWL_MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', '200'))
+CRAWL_TIMEOUT = float(os.getenv('CRAWL_TIMEOUT', '15'))
+CRAWL_USER_AGENT = os.getenv('CRAWL_USER_AGENT', 'AInfoQuery/1.0 (+https://github.com/juma-paul/ai-info-query)')
+
+# Video transcription
+TRANSCRIPTION_MODEL = os.getenv('TRANSCRIPTION_MODEL', 'whisper-1')
+TRANSCRIPT_CACHE_PATH = os.getenv('TRANSCRIPT_CACHE_PATH', 'docs/transcripts.sqlite3')
+TRANSCRIPTION_CONCURRENCY = int(os.getenv('TRANSCRIPTION_CONCURRENCY', '8'))
+# Audio is cut at the quietest moment between the minimum and maximum segment length
+TRANSCRIPTION_SEGMENT_SECONDS = float(os.getenv('TRANSCRIPTION_SEGMENT_SECONDS', '300'))
+TRANSCRIPTION_MIN_SEGMENT_SECONDS = float(os.getenv('TRANSCRIPTION_MIN_SEGMENT_SECONDS', '120'))
+TRANSCRIPTION_MAX_RETRIES = int(os.getenv('TRANSCRIPTION_MAX_RETRIES', '4'))
+
+# Text to speech
+TTS_MODEL = os.getenv('TTS_MODEL', 'tts-1')
+TTS_VOICE = os.getenv('TTS_VOICE', 'shimmer')
+TTS_CACHE_DIRECTORY = os.getenv('TTS_CACHE_DIRECTORY', 'docs/tts_cache/')
+TTS_CACHE_MAX_ENTRIES = int(os.getenv('TTS_CACHE_MAX_ENTRIES', '5000'))
+TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', '3'))
+
+# Voice sessions
+VOICE_SAMPLE_RATE = int(os.getenv('VOICE_SAMPLE_RATE', '16000'))
+VOICE_LANGUAGE_CODE = os.getenv('VOICE_LANGUAGE_CODE', 'en-US')
+VOICE_ENERGY_THRESHOLD = float(os.getenv('VOICE_ENERGY_THRESHOLD', '300'))
+VOICE_PAUSE_SECONDS = float(os.getenv('VOICE_PAUSE_SECONDS', '0.8'))
+VOICE_MAX_UTTERANCE_SECONDS = float(os.getenv('VOICE_MAX_UTTERANCE_SECONDS', '30'))
+VOICE_IDLE_TIMEOUT = int(os.getenv('VOICE_IDLE_TIMEOUT', '120'))
+VOICE_WORKERS = int(os.getenv('VOICE_WORKERS', '8'))
+
+# Wake word detection
+WAKE_WORD_DIRECTORY = os.getenv('WAKE_WORD_DIRECTORY', 'docs/wake_words/')
+# Highest average DTW cost (0-2) at which a keyword template counts as a match; scores
+# up to the confirm threshold are double-checked with cloud recognition
+WAKE_WORD_THRESHOLD = float(os.getenv('WAKE_WORD_THRESHOLD', '0.3'))
+WAKE_WORD_CONFIRM_THRESHOLD = float(os.getenv('WAKE_WORD_CONFIRM_THRESHOLD', '0.45'))
+# Recording templates over the API needs this token in the X-Wake-Word-Token header (disabled when unset)
+WAKE_WORD_ENROLL_TOKEN = os.getenv('WAKE_WORD_ENROLL_TOKEN')
+# Templates kept per keyword, oldest removed first, and the longest recording accepted as one
+WAKE_WORD_MAX_TEMPLATES = int(os.getenv('WAKE_WORD_MAX_TEMPLATES', '20'))
+WAKE_WORD_MAX_TEMPLATE_SECONDS = float(os.getenv('WAKE_WORD_MAX_TEMPLATE_SECONDS', '3'))
@@ -0,0 +1,41 @@
+import os, shutil
+
+# Run from backened/app: gunicorn -c gunicorn.conf.py
+wsgi_app = 'wsgi:app'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+# Voice sessions live in the memory of the worker that started them and their requests are not
+# routed back to it, so one worker is the default; raise it only for servers without voice
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+# Answers and voice events are streamed, so every worker serves several requests at once
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# Import the app once in the master so the workers share its memory copy-on-write
+preload_app = True
+
+# Every worker writes its metrics here, so /metrics reports the whole server whichever worker answers
+os.environ.setdefault('METRICS_DIRECTORY', 'docs/metrics/')
+# Conversations are kept in SQLite, so every worker sees the whole window of a session
+os.environ.setdefault('SESSION_BACKEND', 'sqlite')
+
+
+def when_ready(server):
+    # Still in the master, before any worker is forked: import the libraries that services load
+    # lazily and build the plain-data services. Clients, connections and threads are left to the workers.
+    from modules.services import preload_modules, warm_up
+    # Counts written by the workers of an earlier run would otherwise be added to this run's
+    shutil.rmtree(os.environ['METRICS_DIRECTORY'], ignore_errors=True)
+    server.log.info('Preloaded modules: %s', preload_modules())
+    server.log.info('Preloaded services: %s', warm_up('all', fork_safe_only=True))
+
+
+def post_fork(server, worker):
+    from __init__ import start_background
+    start_background()
+
+
+def worker_exit(server, worker):
+    # Counts since the last periodic write would be lost with the worker
+    from modules.metrics import registry
+    registry.flush()
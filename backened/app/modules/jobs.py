@@ -0,0 +1,215 @@
+import os, json, sqlite3, threading, time, uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from config import JOB_DB_PATH, JOB_WORKERS
+from .metrics import record_request
+
+
+class Job:
+    """Handle passed to job handlers for reporting progress, counts and stage timings."""
+
+    def __init__(self, queue, job_id, kind):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.result = {}
+        self.timings = {}
+
+    def update(self, progress=None, **result):
+        self.result.update(result)
+        self.queue._save(self.id, progress=progress, result=self.result, timings=self.timings)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(self.timings.get(name, 0.0) + time.perf_counter() - start, 4)
+            self.queue._save(self.id, timings=self.timings)
+
+
+class JobQueue:
+    """Durable job queue backed by SQLite and executed on a bounded thread pool.
+
+    The database is opened on first use, so a preloading server can import the queue
+    and register its handlers before forking without sharing a connection.
+    """
+
+    def __init__(self, path, max_workers=2):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._handlers = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+
+    @property
+    def _conn(self):
+        if self._db is None:
+            # Separate from _lock, which callers already hold while they use the connection
+            with self._open_lock:
+                if self._db is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute(
+                        'CREATE TABLE IF NOT EXISTS jobs ('
+                        'id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, '
+                        'progress REAL, result TEXT, timings TEXT, error TEXT, owner TEXT, '
+                        'created_at REAL NOT NULL, started_at REAL, finished_at REAL)'
+                    )
+                    conn.commit()
+                    self._db = conn
+        return self._db
+
+    def handler(self, kind):
+        """Registers the function that runs jobs of the given kind."""
+        def register(func):
+            self._handlers[kind] = func
+            return func
+        return register
+
+    def enqueue(self, kind, payload):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, payload, status, progress, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(payload), 'queued', 0.0, time.time())
+            )
+            self._conn.commit()
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, kind, status, progress, result, timings, error, created_at, started_at, finished_at '
+                'FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job_id, kind, status, progress, result, timings, error, created_at, started_at, finished_at = row
+        return {
+            'id': job_id,
+            'kind': kind,
+            'status': status,
+            'progress': progress,
+            'result': json.loads(result) if result else {},
+            'timings': json.loads(timings) if timings else {},
+            'error': error,
+            'created_at': created_at,
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'queued_seconds': round(started_at - created_at, 4) if started_at else None,
+            'run_seconds': round(finished_at - started_at, 4) if finished_at and started_at else None,
+        }
+
+    def resume(self):
+        """Resubmits queued jobs and jobs whose worker process is gone, e.g. after a restart."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, status, owner FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+
+        for job_id, status, owner in rows:
+            if status == 'running':
+                if _owner_alive(owner):
+                    continue
+                # Every worker resumes at startup; only the one whose reset matches the owner it read requeues
+                # the job, so a job another worker already reset and claimed is not run twice
+                with self._lock:
+                    cursor = self._conn.execute(
+                        "UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND status = 'running' AND owner IS ?",
+                        (job_id, owner)
+                    )
+                    self._conn.commit()
+                if cursor.rowcount != 1:
+                    continue
+            self._executor.submit(self._run, job_id)
+
+    def _save(self, job_id, **fields):
+        fields = {key: value for key, value in fields.items() if value is not None}
+        for key in ('result', 'timings'):
+            if key in fields:
+                fields[key] = json.dumps(fields[key])
+        if not fields:
+            return
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        with self._lock:
+            self._conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _claim(self, job_id):
+        # Claim atomically so that several processes sharing the database never run a job twice
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, started_at = ? WHERE id = ? AND status = 'queued'",
+                (process_token(), time.time(), job_id)
+            )
+            self._conn.commit()
+            if cursor.rowcount == 0:
+                return None
+            return self._conn.execute('SELECT kind, payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def _run(self, job_id):
+        claimed = self._claim(job_id)
+        if claimed is None:
+            return
+
+        kind, payload = claimed
+        job = Job(self, job_id, kind)
+        start = time.perf_counter()
+        status = 'failed'
+        try:
+            handler = self._handlers[kind]
+            result = handler(job, **json.loads(payload)) or {}
+            job.result.update(result)
+            self._save(job_id, status='done', progress=1.0, result=job.result,
+                       timings=job.timings, finished_at=time.time())
+            status = 'done'
+        except Exception as e:
+            print(f"Error in job {job_id} ({kind}): {e}")
+            self._save(job_id, status='failed', error=str(e), result=job.result,
+                       timings=job.timings, finished_at=time.time())
+        finally:
+            timings = {stage: seconds * 1000 for stage, seconds in job.timings.items()}
+            record_request(f'job_{kind}', timings, (time.perf_counter() - start) * 1000, status, job_id=job_id)
+
+
+def process_token(pid=None):
+    """Identifies a process by its pid and start time, so a pid handed out again after a restart is another owner."""
+    pid = pid or os.getpid()
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+        # The start time is the 22nd field, counted after the command name, which may contain spaces
+        started = stat[stat.rindex(b')') + 2:].split()[19].decode()
+    except (OSError, ValueError, IndexError):
+        # No /proc (e.g. macOS): only the pid is compared
+        started = ''
+    return f'{pid}:{started}'
+
+
+def _owner_alive(owner):
+    # Owners written as a bare pid predate the start time and belong to processes from before an upgrade
+    if not isinstance(owner, str) or ':' not in owner:
+        return False
+    pid, started = owner.split(':', 1)
+    if not _process_alive(int(pid)):
+        return False
+    return not started or process_token(int(pid)) == owner
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+job_queue = JobQueue(JOB_DB_PATH, max_workers=JOB_WORKERS)
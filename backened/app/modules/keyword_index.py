@@ -0,0 +1,113 @@
+import os, re, json, sqlite3, threading
+from langchain_core.documents import Document
+
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Chroma pages through at most this many records per call when rebuilding
+REBUILD_PAGE_SIZE = 1000
+
+
+class KeywordIndex:
+    """Local BM25 inverted index over the ingested chunks, backed by SQLite FTS5.
+
+    It is kept in step with Chroma at ingest time and answers keyword queries
+    without any embedding call.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL,
+                content TEXT NOT NULL, metadata TEXT NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                content, content='chunks', content_rowid='rowid', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END;
+        ''')
+        self._conn.commit()
+
+    def add(self, records):
+        """Adds or replaces (chunk_id, text, metadata) records."""
+        records = list(records)
+        if not records:
+            return
+        with self._lock:
+            self._conn.executemany('DELETE FROM chunks WHERE chunk_id = ?', [(record[0],) for record in records])
+            self._conn.executemany(
+                'INSERT INTO chunks (chunk_id, content, metadata) VALUES (?, ?, ?)',
+                [(chunk_id, text, json.dumps(metadata)) for chunk_id, text, metadata in records]
+            )
+            self._conn.commit()
+
+    def delete(self, chunk_ids):
+        with self._lock:
+            self._conn.executemany('DELETE FROM chunks WHERE chunk_id = ?', [(chunk_id,) for chunk_id in chunk_ids])
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+
+    def search(self, query, k=4, sources=None):
+        """Returns the k chunks with the best BM25 score for the query terms, optionally only from ``sources``."""
+        terms = TERM_PATTERN.findall(query)
+        if not terms or sources is not None and not sources:
+            return []
+        # Quote every term so user input is never parsed as FTS5 query syntax
+        match = ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        where, params = 'chunks_fts MATCH ?', [match]
+        if sources is not None:
+            where += " AND json_extract(chunks.metadata, '$.source') IN ({})".format(', '.join('?' * len(sources)))
+            params.extend(sources)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT chunks.content, chunks.metadata, bm25(chunks_fts) AS score '
+                'FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid '
+                f'WHERE {where} ORDER BY score LIMIT ?',
+                (*params, k)
+            ).fetchall()
+        return [Document(page_content=content, metadata=json.loads(metadata)) for content, metadata, _ in rows]
+
+    def get(self, chunk_ids):
+        """Returns the chunks with the given ids, in the same order. Unknown ids are skipped."""
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({})'.format(', '.join('?' * len(chunk_ids))),
+                chunk_ids
+            ).fetchall()
+        found = {chunk_id: (content, metadata) for chunk_id, content, metadata in rows}
+        return [
+            Document(page_content=found[chunk_id][0], metadata=json.loads(found[chunk_id][1]))
+            for chunk_id in chunk_ids if chunk_id in found
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def rebuild(self, collection):
+        """Fills the index from an existing Chroma collection, e.g. one created before this index existed."""
+        offset = 0
+        while True:
+            page = collection.get(include=['documents', 'metadatas'], limit=REBUILD_PAGE_SIZE, offset=offset)
+            if not page['ids']:
+                break
+            self.add(
+                (chunk_id, text, metadata or {})
+                for chunk_id, text, metadata in zip(page['ids'], page['documents'], page['metadatas'])
+            )
+            offset += len(page['ids'])
@@ -0,0 +1,410 @@
+import os, re, json, time, uuid, bisect, threading
+from contextlib import contextmanager
+from flask import Blueprint, Response
+from langchain_core.callbacks import BaseCallbackHandler
+from config import SLOW_REQUEST_MS
+from .tokens import count_tokens
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Seconds; covers cache hits (milliseconds) up to slow LLM and ingestion calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRIC_NAME_PATTERN = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_string(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, states=None):
+        """Renders this process's values, or the sum of ``states`` collected from several processes."""
+        values = {}
+        for state in [self.state()] if states is None else states:
+            for key, value in state:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        values = sorted(values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{_label_string(self.labelnames, key)} {value}' for key, value in values)
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, rendered the way Prometheus client libraries do."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    def state(self):
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._series.items()]
+
+    def render(self, states=None):
+        """Renders this process's series, or the sum of ``states`` collected from several processes."""
+        merged = {}
+        for state in [self.state()] if states is None else states:
+            for key, counts, total in state:
+                previous_counts, previous_total = merged.get(tuple(key), ([0] * len(counts), 0.0))
+                merged[tuple(key)] = ([a + b for a, b in zip(previous_counts, counts)], previous_total + total)
+        series = sorted((key, counts, total) for key, (counts, total) in merged.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                labels = _label_string(self.labelnames + ('le',), key + (le,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _label_string(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Holds the process's metrics and renders them in the Prometheus text format.
+
+    Besides counters and histograms, modules can register the ``stats()`` function they
+    already expose; its numeric values are rendered as gauges.
+
+    Under a server with several worker processes, ``share`` makes every worker write its
+    metrics to a common directory, so whichever worker serves /metrics renders counters
+    and histograms summed over all of them, including workers that have exited. Gauges
+    describe one process's caches and services, so they are rendered per live worker,
+    with a ``worker`` label.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._stats = []
+        self._lock = threading.Lock()
+        self.directory = None
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_stats(self, prefix, stats):
+        with self._lock:
+            self._stats.append((prefix, stats))
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def share(self, directory, interval=5.0):
+        """Writes this process's metrics to ``directory`` every ``interval`` seconds and before each render."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+        def flush_periodically():
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        threading.Thread(target=flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def flush(self):
+        if self.directory is None:
+            return
+        with self._lock:
+            metrics = list(self._metrics)
+        snapshot = {
+            'pid': os.getpid(),
+            'metrics': {metric.name: metric.state() for metric in metrics},
+            'gauges': list(self._gauges()),
+        }
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+
+    def _gauges(self):
+        with self._lock:
+            stats = list(self._stats)
+        for prefix, func in stats:
+            try:
+                values = func()
+            except Exception as e:
+                print(f"Error collecting {prefix} statistics: {e}")
+                continue
+            yield from _flatten(prefix, values)
+
+    def _snapshots(self):
+        self.flush()
+        snapshots = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                continue
+        return snapshots
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        if self.directory is None:
+            for metric in metrics:
+                lines.extend(metric.render())
+            for name, value in self._gauges():
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+            return '\n'.join(lines) + '\n'
+
+        snapshots = self._snapshots()
+        for metric in metrics:
+            lines.extend(metric.render([snapshot['metrics'].get(metric.name, []) for snapshot in snapshots]))
+        gauges = {}
+        for snapshot in snapshots:
+            if _process_alive(snapshot['pid']):
+                for name, value in snapshot['gauges']:
+                    gauges.setdefault(name, []).append((snapshot['pid'], value))
+        for name, values in gauges.items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(f'{name}{_label_string(("worker",), (pid,))} {value}' for pid, value in sorted(values))
+        return '\n'.join(lines) + '\n'
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _flatten(prefix, values):
+    for key, value in values.items():
+        name = METRIC_NAME_PATTERN.sub('_', f'{prefix}_{key}')
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (bool, int, float)):
+            yield name, float(value)
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'aiq_request_seconds', 'Duration of instrumented requests and jobs.', ['route', 'status']
+)
+STAGE_SECONDS = registry.histogram(
+    'aiq_stage_seconds', 'Duration of each stage of a request or job.', ['route', 'stage']
+)
+SLOW_REQUESTS = registry.counter(
+    'aiq_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS.', ['route']
+)
+EXTERNAL_CALLS = registry.counter(
+    'aiq_external_calls_total', 'Calls to external APIs.', ['service', 'status']
+)
+EXTERNAL_SECONDS = registry.histogram(
+    'aiq_external_call_seconds', 'Duration of calls to external APIs.', ['service']
+)
+LLM_TOKENS = registry.counter(
+    'aiq_llm_tokens_total', 'Tokens sent to and generated by chat models (estimated when not reported).',
+    ['model', 'kind']
+)
+EMBEDDED_TEXTS = registry.counter(
+    'aiq_embedded_texts_total', 'Texts sent to the embedding API, after the embedding cache.'
+)
+
+
+@contextmanager
+def external_call(service):
+    """Counts and times one call to an external API."""
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        EXTERNAL_CALLS.inc(service=service, status=status)
+        EXTERNAL_SECONDS.observe(time.perf_counter() - start, service=service)
+
+
+def count_usage(model, usage):
+    """Adds the token usage reported by an OpenAI completion."""
+    if usage is not None:
+        LLM_TOKENS.inc(usage.prompt_tokens, model=model, kind='prompt')
+        LLM_TOKENS.inc(usage.completion_tokens, model=model, kind='completion')
+
+
+class StageTimer:
+    """Records the duration of each stage of a request, including stages run on other threads."""
+
+    def __init__(self):
+        self.timings = {}
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def run(self, name, func, *args):
+        with self.stage(name):
+            return func(*args)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, duration_ms):
+        # A stage that runs more than once in a request, e.g. two LLM calls, is summed
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + duration_ms
+
+    def elapsed(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        with self._lock:
+            timings = list(self.timings.items())
+        return ', '.join(f'{name};dur={duration:.1f}' for name, duration in timings)
+
+
+class StageCallbackHandler(BaseCallbackHandler):
+    """Times the stages inside the LangChain retrieval chain and counts chat-model calls and tokens.
+
+    ``stages`` maps run names to stage names; retriever runs are recorded as ``retrieve``.
+    Streaming responses carry no token usage, so their tokens are estimated.
+    """
+
+    def __init__(self, timer, stages=None):
+        self.timer = timer
+        self.stages = stages or {}
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _begin(self, run_id, stage, **extra):
+        with self._lock:
+            self._runs[run_id] = (stage, time.perf_counter(), extra)
+
+    def _finish(self, run_id):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        stage, start, extra = run
+        elapsed = time.perf_counter() - start
+        if stage:
+            self.timer.add(stage, elapsed * 1000)
+        return elapsed, extra
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        stage = self.stages.get(kwargs.get('name'))
+        if stage:
+            self._begin(run_id, stage)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._begin(run_id, 'retrieve')
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get('invocation_params') or {}
+        model = params.get('model_name') or params.get('model') or ''
+        prompt_tokens = sum(count_tokens(str(message.content)) for batch in messages for message in batch)
+        self._begin(run_id, None, model=model, prompt_tokens=prompt_tokens)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        finished = self._finish(run_id)
+        if finished is None:
+            return
+        elapsed, extra = finished
+        model = extra.get('model', '')
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = usage.get('prompt_tokens') or extra.get('prompt_tokens', 0)
+        completion_tokens = usage.get('completion_tokens')
+        if completion_tokens is None:
+            completion_tokens = sum(
+                count_tokens(generation.text) for batch in response.generations for generation in batch
+            )
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind='prompt')
+        LLM_TOKENS.inc(completion_tokens, model=model, kind='completion')
+        EXTERNAL_CALLS.inc(service='chat', status='ok')
+        EXTERNAL_SECONDS.observe(elapsed, service='chat')
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        finished = self._finish(run_id)
+        if finished is not None:
+            EXTERNAL_CALLS.inc(service='chat', status='error')
+            EXTERNAL_SECONDS.observe(finished[0], service='chat')
+
+
+def record_request(route, timings_ms, total_ms, status='ok', **context):
+    """Observes a finished request or job and logs its stage breakdown when it was slow."""
+    REQUEST_SECONDS.observe(total_ms / 1000, route=route, status=status)
+    for stage, duration in timings_ms.items():
+        STAGE_SECONDS.observe(duration / 1000, route=route, stage=stage)
+
+    if SLOW_REQUEST_MS and total_ms >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(route=route)
+        breakdown = {stage: round(duration, 1) for stage, duration in timings_ms.items()}
+        entry = {'route': route, 'status': status, 'total_ms': round(total_ms, 1), 'stages_ms': breakdown, **context}
+        print(f"Slow request: {json.dumps(entry)}")
+
+
+def record_timer(route, timer, status='ok', **context):
+    record_request(route, dict(timer.timings), timer.elapsed(), status, **context)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
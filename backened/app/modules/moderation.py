@@ -0,0 +1,118 @@
+import re, hashlib, threading
+from config import OPENAI_API_KEY, MODERATION_CACHE_SIZE, MODERATION_MIN_CHARS, MODERATION_REMOTE_OUTPUT
+from .lru import LRUCache
+from .metrics import external_call, registry
+from .services import service, preload
+
+preload('openai')
+
+
+@service('moderation_client')
+def client():
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+INJECTION_KEYWORDS = [
+    "ignore all rules", "ignore previous instructions", "bypass", "pretend", "as if",
+    "you are now", "disregard", "change the system", "disregard all", "do not follow", "reset"
+]
+
+# All injection keywords in one precompiled alternation, matched in a single pass
+INJECTION_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in INJECTION_KEYWORDS), re.IGNORECASE)
+
+# Curly braces (template injection) and basic SQL injection tokens, sanitized in a single pass
+SANITIZE_PATTERN = re.compile(r"[{}]|DROP|SELECT|INSERT|UPDATE|DELETE|--|\bUNION\b|\bFROM\b", re.IGNORECASE)
+
+INJECTION_MESSAGE = "Your request includes potentially harmful manipulations and cannot be processed."
+MODERATION_ERROR_MESSAGE = "An error occurred while processing your request. Please try again later."
+
+# Remote moderation verdicts keyed by a hash of the content and its type
+moderation_cache = LRUCache(MODERATION_CACHE_SIZE)
+
+moderation_counts = {'remote': 0, 'cached': 0, 'skipped': 0}
+_counts_lock = threading.Lock()
+
+
+def _count(kind):
+    with _counts_lock:
+        moderation_counts[kind] += 1
+
+
+def moderate_content(content, content_type="input"):
+    try:
+        with external_call('moderation'):
+            response = client().moderations.create(input=content, model="omni-moderation-2024-09-26")
+        if response.results and response.results[0].flagged:
+            categories = response.results[0].categories.model_dump(by_alias=True)
+            flagged_categories = ', '.join(category for category, flagged in categories.items() if flagged)
+            if content_type == "input":
+                message = f"I cannot assist with that request as it violates ethical guidelines related to: {flagged_categories}. Please feel free to ask a constructive or appropriate question."
+            else:
+                message = f"The response generated might not be appropriate to share as it violates guidelines related to: {flagged_categories}. If you have another question, feel free to ask."
+            return False, message
+    except Exception:
+        return False, MODERATION_ERROR_MESSAGE
+    return True, None
+
+
+def detect_prompt_injection(content):
+    if INJECTION_PATTERN.search(content):
+        return False, INJECTION_MESSAGE
+    return True, None
+
+
+def _sanitize_match(match):
+    token = match.group(0)
+    # Double curly braces so they are not treated as template fields, drop SQL tokens
+    return token * 2 if token in '{}' else ''
+
+
+def sanitize_input(input_text):
+    return SANITIZE_PATTERN.sub(_sanitize_match, input_text)
+
+
+def needs_remote_moderation(content, content_type="input"):
+    """Applies the moderation policy: very short texts and, optionally, outputs stay local."""
+    if len(content.strip()) < MODERATION_MIN_CHARS:
+        return False
+    if content_type == "output" and not MODERATION_REMOTE_OUTPUT:
+        return False
+    return True
+
+
+def sanitize_and_moderate(content, content_type="input"):
+    # Step 0: Sanitize input
+    content = sanitize_input(content)
+
+    # Step 1: Check for prompt injection
+    is_valid, error_message = detect_prompt_injection(content)
+    if not is_valid:
+        return False, error_message
+
+    # Step 2: Perform content moderation, unless the policy or a cached verdict makes it unnecessary
+    if not needs_remote_moderation(content, content_type):
+        _count('skipped')
+        return True, None
+
+    key = hashlib.sha256(f'{content_type}\0{content}'.encode('utf-8')).hexdigest()
+    verdict = moderation_cache.get(key)
+    if verdict is not None:
+        _count('cached')
+        return verdict
+
+    _count('remote')
+    verdict = moderate_content(content, content_type)
+    # Errors are not cached so that a transient failure does not stick
+    if verdict[1] != MODERATION_ERROR_MESSAGE:
+        moderation_cache.set(key, verdict)
+    return verdict
+
+
+def moderation_stats():
+    with _counts_lock:
+        counts = dict(moderation_counts)
+    return {**counts, 'cache': moderation_cache.stats()}
+
+
+registry.register_stats('aiq_moderation', moderation_stats)
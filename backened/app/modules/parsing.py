@@ -0,0 +1,35 @@
+import os
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+
+# Kept free of the vector store and API clients: bulk ingestion imports this module in parser processes
+
+# Initialize text splitter for consistent chunking
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+# Loader class names in langchain_community, imported only when a file is parsed
+LOADERS = {
+    '.pdf': 'PyPDFLoader',
+    '.ppt': 'UnstructuredPowerPointLoader',
+    '.pptx': 'UnstructuredPowerPointLoader',
+}
+
+
+def is_supported(path):
+    return os.path.splitext(path)[1].lower() in LOADERS
+
+
+def split_lazily(docs):
+    """Splits documents one at a time as the loader yields them."""
+    for doc in docs:
+        yield from text_splitter.split_documents([doc])
+
+
+def parse_file(path):
+    """Loads and chunks a PDF or PowerPoint file. Runs in a worker process during bulk ingestion."""
+    from langchain_community import document_loaders
+
+    loader = getattr(document_loaders, LOADERS[os.path.splitext(path)[1].lower()])
+    return list(split_lazily(loader(path).lazy_load()))
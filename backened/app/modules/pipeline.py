@@ -0,0 +1,130 @@
+import time, random, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .tokens import count_tokens
+
+
+def retryable_errors():
+    # Imported on demand: only a failed embedding call needs the openai exception types
+    from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+    return RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+
+
+class EmbeddingPipeline:
+    """Embeds chunk batches concurrently and writes each batch to Chroma as soon as it is ready.
+
+    Records are consumed lazily and only a bounded number of batches is in flight,
+    so memory stays flat regardless of how many chunks a document produces. At most
+    ``concurrency`` embedding requests are made at once across all concurrent runs,
+    so parallel ingestion jobs share a single rate budget.
+    """
+
+    def __init__(self, embeddings, collection, batch_size=128, max_batch_tokens=50000,
+                 concurrency=4, max_retries=6, keyword_index=None):
+        self.embeddings = embeddings
+        self.collection = collection
+        self.keyword_index = keyword_index
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def batches(self, records):
+        """Groups (id, text, metadata) records into batches capped by count and token budget."""
+        batch, batch_tokens = [], 0
+        for record in records:
+            tokens = count_tokens(record[1])
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(record)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def _embed(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts), attempt
+            except retryable_errors() as e:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(retry_delay(e, attempt))
+
+    def _embed_and_write(self, batch, collection, keyword_index):
+        ids = [record[0] for record in batch]
+        texts = [record[1] for record in batch]
+        metadatas = [record[2] for record in batch]
+
+        start = time.perf_counter()
+        with self._slots:
+            vectors, retries = self._embed(texts)
+        embedded = time.perf_counter()
+        collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        if keyword_index is not None:
+            keyword_index.add(batch)
+        written = time.perf_counter()
+
+        return ids, retries, embedded - start, written - embedded
+
+    def run(self, records, on_batch=None, collection=None, keyword_index=None):
+        """Runs the records through the embedding and write stages.
+
+        ``collection`` and ``keyword_index`` override the pipeline's targets for this run,
+        so one pipeline, and its rate budget, serves every document collection.
+        ``on_batch`` is called with the ids of every batch once it has been written.
+        If a batch fails, the batches already in flight are still collected before
+        the error is raised, so callers know exactly what reached the store.
+        """
+        collection = collection if collection is not None else self.collection
+        keyword_index = keyword_index if keyword_index is not None else self.keyword_index
+        stats = {'batches': 0, 'written': 0, 'retries': 0, 'embed_seconds': 0.0, 'write_seconds': 0.0}
+        errors = []
+
+        def collect(done):
+            for future in done:
+                try:
+                    ids, retries, embed_seconds, write_seconds = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                stats['batches'] += 1
+                stats['written'] += len(ids)
+                stats['retries'] += retries
+                stats['embed_seconds'] += embed_seconds
+                stats['write_seconds'] += write_seconds
+                if on_batch:
+                    on_batch(ids)
+
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='embed') as executor:
+            for batch in self.batches(records):
+                # Backpressure: stop reading the loader while enough batches are in flight
+                while len(pending) >= self.concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if errors:
+                    break
+                pending.add(executor.submit(self._embed_and_write, batch, collection, keyword_index))
+
+            done, _ = wait(pending)
+            collect(done)
+
+        if errors:
+            raise errors[0]
+
+        stats['embed_seconds'] = round(stats['embed_seconds'], 4)
+        stats['write_seconds'] = round(stats['write_seconds'], 4)
+        return stats
+
+
+def retry_delay(error, attempt):
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        if retry_after:
+            return float(retry_after)
+    except ValueError:
+        pass
+    # Exponential backoff with jitter
+    return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
@@ -0,0 +1,96 @@
+import re, hashlib, threading
+import numpy as np
+from langchain_core.messages import HumanMessage
+from .lru import LRUCache
+
+
+# Pronouns and references that usually point back into the conversation
+REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|theirs|this|that|these|those|he|him|his|she|her|hers|"
+    r"there|former|latter|above|previous|same)\b",
+    re.IGNORECASE
+)
+
+# Elliptical follow-ups such as "and the second one?" or "what about pricing?"
+ELLIPSIS_PATTERN = re.compile(
+    r"^\s*(and|or|but|also|so|then|what about|how about|why not|more|again|else)\b",
+    re.IGNORECASE
+)
+
+
+class RephraseGate:
+    """Only sends questions that depend on the conversation to the history-aware rewrite LLM call.
+
+    Local heuristics (references, ellipsis, very short questions and, optionally, embedding
+    similarity to the previous question) decide whether a rewrite is needed. Rewrites are
+    cached per (history window, question).
+    """
+
+    def __init__(self, rephrase_chain, embeddings=None, similarity_threshold=0.9, min_words=4, cache_size=2000):
+        self.rephrase_chain = rephrase_chain
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.min_words = min_words
+        self.cache = LRUCache(cache_size)
+        self.counts = {'no_history': 0, 'skipped': 0, 'rewritten': 0, 'cached': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def _similarity(self, first, second):
+        vectors = np.asarray(self.embeddings.embed_documents([first, second]), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        if not norms.all():
+            return 0.0
+        return float(vectors[0] @ vectors[1] / (norms[0] * norms[1]))
+
+    def needs_rewrite(self, question, chat_history, use_embeddings=True):
+        """Returns whether the question needs rewriting, and why."""
+        if not chat_history:
+            return False, 'no_history'
+        if REFERENCE_PATTERN.search(question) or ELLIPSIS_PATTERN.search(question):
+            return True, 'reference'
+        if len(question.split()) < self.min_words:
+            return True, 'short'
+
+        if use_embeddings and self.embeddings is not None:
+            previous = next((message.content for message in reversed(chat_history)
+                             if isinstance(message, HumanMessage)), None)
+            if previous and self._similarity(question, previous) >= self.similarity_threshold:
+                return True, 'similar_to_previous'
+
+        return False, 'self_contained'
+
+    def standalone_question(self, question, chat_history, use_embeddings=True, config=None):
+        """Returns the question itself, or its rewrite when it depends on the chat history.
+
+        ``config`` is passed on to the rewrite chain, so callbacks of the caller see the call.
+        """
+        needed, reason = self.needs_rewrite(question, chat_history, use_embeddings)
+        if not needed:
+            self._count('no_history' if reason == 'no_history' else 'skipped')
+            return question
+
+        window = '\0'.join(f'{message.type}:{message.content}' for message in chat_history)
+        key = hashlib.sha256(f'{window}\0\0{question}'.encode('utf-8')).hexdigest()
+        rewrite = self.cache.get(key)
+        if rewrite is not None:
+            self._count('cached')
+            return rewrite
+
+        self._count('rewritten')
+        rewrite = self.rephrase_chain.invoke({'input': question, 'chat_history': chat_history}, config)
+        self.cache.set(key, rewrite)
+        return rewrite
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        with_history = counts['skipped'] + counts['rewritten'] + counts['cached']
+        return {
+            **counts,
+            'skip_rate': counts['skipped'] / with_history if with_history else 0.0,
+            'cache': self.cache.stats(),
+        }
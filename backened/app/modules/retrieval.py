@@ -0,0 +1,80 @@
+from typing import Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from .document_collections import DEFAULT_COLLECTION
+
+
+RETRIEVAL_MODES = ('hybrid', 'vector', 'keyword')
+VECTOR_BACKENDS = ('chroma', 'quantized')
+
+# Keyword and vector searches of a hybrid query run side by side
+search_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='search')
+
+
+def document_key(doc):
+    return doc.metadata.get('id') or doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists, k=60):
+    """Merges ranked lists of documents, scoring each by the sum of 1 / (k + rank)."""
+    scores, documents = {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retrieves chunks with BM25 keyword search, vector search, or both fused with RRF.
+
+    ``keyword`` mode never calls the embedding model, which makes it the cheapest
+    option for exact terms such as part numbers, acronyms and slide titles. Searches
+    stay inside one document ``collection`` and, when ``sources`` is set, are filtered
+    to the chunks of those sources. With the ``quantized`` vector backend, vector search
+    runs on ``vector_indexes`` and falls back to Chroma while an index is being rebuilt.
+    """
+
+    collections: Any
+    collection: str = DEFAULT_COLLECTION
+    sources: Optional[List[str]] = None
+    mode: str = 'hybrid'
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    vector_backend: str = 'chroma'
+    vector_indexes: Any = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.sources is not None and not self.sources:
+            return []
+        with self.collections.use(self.collection) as handle:
+            return self._search(handle, query)
+
+    def _vector_search(self, handle, query, k):
+        if self.vector_backend == 'quantized':
+            embedding = handle.vector_store.embeddings.embed_query(query)
+            chunk_ids = self.vector_indexes.search(handle, embedding, k, self.sources)
+            if chunk_ids is not None:
+                # The chunk texts and metadata are read from the keyword index, which holds every chunk
+                return handle.keyword_index.get(chunk_ids)
+            return handle.vector_store.similarity_search_by_vector(embedding, k=k, filter=self._source_filter())
+        return handle.vector_store.similarity_search(query, k=k, filter=self._source_filter())
+
+    def _source_filter(self):
+        return {'source': {'$in': self.sources}} if self.sources else None
+
+    def _search(self, handle, query):
+        if self.mode == 'keyword':
+            return handle.keyword_index.search(query, self.k, self.sources)
+        if self.mode == 'vector':
+            return self._vector_search(handle, query, self.k)
+
+        keyword_future = search_executor.submit(handle.keyword_index.search, query, self.fetch_k, self.sources)
+        vector_results = self._vector_search(handle, query, self.fetch_k)
+        fused = reciprocal_rank_fusion([vector_results, keyword_future.result()], k=self.rrf_k)
+        return fused[:self.k]
@@ -0,0 +1,123 @@
+import time, importlib, threading
+from collections import OrderedDict
+from .metrics import registry
+
+
+class Service:
+    """A shared object that is built on first use and then reused by every thread of the process.
+
+    Calling the service returns the object, building it exactly once. API clients, SQLite
+    connections and background threads are therefore only created in the process that
+    serves requests, after a preloading server has forked its workers. Services marked
+    ``fork_safe`` hold plain data only and may be built before the fork to be shared.
+    """
+
+    def __init__(self, name, factory, fork_safe=False):
+        self.name = name
+        self.factory = factory
+        self.fork_safe = fork_safe
+        self.build_seconds = None
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    start = time.perf_counter()
+                    self._value = self.factory()
+                    self.build_seconds = time.perf_counter() - start
+                    self._ready = True
+        return self._value
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def set(self, value):
+        """Replaces the object, e.g. with a local fake in the benchmarks."""
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+
+_services = OrderedDict()
+_preload_modules = []
+
+
+def service(name, fork_safe=False):
+    """Registers the decorated factory as a lazily built service named ``name``."""
+    def register(factory):
+        _services[name] = Service(name, factory, fork_safe)
+        return _services[name]
+    return register
+
+
+def preload(*module_names):
+    """Declares libraries a module only imports when a service is built.
+
+    A preloading server imports them before it forks, so the workers share their memory.
+    """
+    _preload_modules.extend(name for name in module_names if name not in _preload_modules)
+
+
+def when_ready(svc, method):
+    """Returns a function that calls ``method`` of a built service and reports nothing before it is built.
+
+    Used for statistics, so that scraping /metrics never builds a service.
+    """
+    def call():
+        return getattr(svc(), method)() if svc.ready else {}
+    return call
+
+
+def preload_modules():
+    """Imports the declared libraries. Returns the seconds spent per module."""
+    timings = {}
+    for name in list(_preload_modules):
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Error preloading {name}: {e}")
+            continue
+        timings[name] = round(time.perf_counter() - start, 4)
+    return timings
+
+
+def warm_up(names='all', fork_safe_only=False):
+    """Builds the named services now instead of on first use. Returns the seconds spent per service.
+
+    ``names`` is ``all``, ``none`` or a comma-separated list of service names. A service
+    that fails to build is reported and retried on first use.
+    """
+    if names == 'none':
+        return {}
+    selected = list(_services) if names == 'all' else [name.strip() for name in names.split(',') if name.strip()]
+    if fork_safe_only:
+        selected = [name for name in selected if name in _services and _services[name].fork_safe]
+    timings = {}
+    for name in selected:
+        svc = _services.get(name)
+        if svc is None:
+            print(f"Unknown service in warm-up: {name}")
+            continue
+        start = time.perf_counter()
+        try:
+            svc()
+        except Exception as e:
+            print(f"Error warming up {name}: {e}")
+            continue
+        timings[name] = round(time.perf_counter() - start, 4)
+    return timings
+
+
+def service_stats():
+    return {
+        name: {'ready': svc.ready, 'build_seconds': round(svc.build_seconds or 0.0, 4)}
+        for name, svc in list(_services.items())
+    }
+
+
+registry.register_stats('aiq_services', service_stats)
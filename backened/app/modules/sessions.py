@@ -0,0 +1,207 @@
+import os, sqlite3, threading, time
+from collections import deque
+from config import (
+    SESSION_BACKEND, SESSION_DB_PATH, SESSION_WINDOW, SESSION_MAX_HISTORY, SESSION_IDLE_TIMEOUT
+)
+
+
+# Idle sessions are swept at most this often, on the back of regular calls
+EVICTION_INTERVAL = 60
+
+
+class InMemorySessionStore:
+    """Per-session conversation windows and chat history kept in process memory.
+
+    ``window`` holds the last few turns fed to the chain as chat history, ``history``
+    the messages shown to the user. Both are bounded, and sessions that stay idle for
+    longer than ``idle_timeout`` seconds are dropped.
+    """
+
+    def __init__(self, window=5, max_history=200, idle_timeout=3600):
+        self.window_size = window
+        self.max_history = max_history
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+
+    def _session(self, session_id):
+        now = time.time()
+        if now - self._last_eviction > EVICTION_INTERVAL:
+            self._evict_idle(now)
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {
+                'window': deque(maxlen=self.window_size),
+                'history': deque(maxlen=self.max_history),
+            }
+            self._sessions[session_id] = session
+        session['last_seen'] = now
+        return session
+
+    def _evict_idle(self, now):
+        self._last_eviction = now
+        idle = [key for key, session in self._sessions.items() if now - session['last_seen'] > self.idle_timeout]
+        for key in idle:
+            del self._sessions[key]
+
+    def append_turn(self, session_id, question, answer):
+        with self._lock:
+            session = self._session(session_id)
+            session['window'].append((question, answer))
+            session['history'].append({"role": "user", "content": question})
+            session['history'].append({"role": "assistant", "content": answer})
+
+    def window(self, session_id):
+        """Returns the most recent (question, answer) turns of the current conversation."""
+        with self._lock:
+            return list(self._session(session_id)['window'])
+
+    def history(self, session_id, page=1, page_size=50):
+        """Returns one page of messages, page 1 being the most recent, in chronological order."""
+        with self._lock:
+            messages = list(self._session(session_id)['history'])
+        end = max(len(messages) - (page - 1) * page_size, 0)
+        return messages[max(end - page_size, 0):end], len(messages)
+
+    def clear_history(self, session_id):
+        with self._lock:
+            self._session(session_id)['history'].clear()
+
+    def clear_window(self, session_id):
+        with self._lock:
+            self._session(session_id)['window'].clear()
+
+    def session_count(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """SQLite implementation of the session store, shared by every worker on the host.
+
+    Each message has a sequence number; a session's window and history are the
+    messages after its ``window_start`` and ``history_start`` markers.
+    """
+
+    def __init__(self, path, window=5, max_history=200, idle_timeout=3600):
+        self.window_size = window
+        self.max_history = max_history
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'session_id TEXT PRIMARY KEY, window_start INTEGER NOT NULL DEFAULT 0, '
+            'history_start INTEGER NOT NULL DEFAULT 0, last_seen REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, '
+            'role TEXT NOT NULL, content TEXT NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq)')
+        self._conn.commit()
+
+    def _touch(self, session_id):
+        now = time.time()
+        if now - self._last_eviction > EVICTION_INTERVAL:
+            self._last_eviction = now
+            idle = 'SELECT session_id FROM sessions WHERE last_seen < ?'
+            self._conn.execute(f'DELETE FROM messages WHERE session_id IN ({idle})', (now - self.idle_timeout,))
+            self._conn.execute('DELETE FROM sessions WHERE last_seen < ?', (now - self.idle_timeout,))
+
+        self._conn.execute(
+            'INSERT INTO sessions (session_id, last_seen) VALUES (?, ?) '
+            'ON CONFLICT(session_id) DO UPDATE SET last_seen = excluded.last_seen',
+            (session_id, now)
+        )
+        return self._conn.execute(
+            'SELECT window_start, history_start FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+
+    def _last_seq(self, session_id):
+        return self._conn.execute(
+            'SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?', (session_id,)
+        ).fetchone()[0]
+
+    def append_turn(self, session_id, question, answer):
+        with self._lock:
+            self._touch(session_id)
+            self._conn.executemany(
+                'INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)',
+                [(session_id, 'user', question), (session_id, 'assistant', answer)]
+            )
+            # Keep at most max_history messages per session
+            self._conn.execute(
+                'DELETE FROM messages WHERE session_id = ? AND seq <= ('
+                'SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)',
+                (session_id, session_id, self.max_history)
+            )
+            self._conn.commit()
+
+    def window(self, session_id):
+        with self._lock:
+            window_start, _ = self._touch(session_id)
+            rows = self._conn.execute(
+                'SELECT role, content FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq DESC LIMIT ?',
+                (session_id, window_start, self.window_size * 2)
+            ).fetchall()
+            self._conn.commit()
+
+        rows.reverse()
+        turns = []
+        for index in range(len(rows) - 1):
+            if rows[index][0] == 'user' and rows[index + 1][0] == 'assistant':
+                turns.append((rows[index][1], rows[index + 1][1]))
+        return turns
+
+    def history(self, session_id, page=1, page_size=50):
+        with self._lock:
+            _, history_start = self._touch(session_id)
+            total = self._conn.execute(
+                'SELECT COUNT(*) FROM messages WHERE session_id = ? AND seq > ?', (session_id, history_start)
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                'SELECT role, content FROM messages WHERE session_id = ? AND seq > ? '
+                'ORDER BY seq DESC LIMIT ? OFFSET ?',
+                (session_id, history_start, page_size, (page - 1) * page_size)
+            ).fetchall()
+            self._conn.commit()
+
+        return [{"role": role, "content": content} for role, content in reversed(rows)], total
+
+    def clear_history(self, session_id):
+        with self._lock:
+            self._touch(session_id)
+            self._conn.execute(
+                'UPDATE sessions SET history_start = ? WHERE session_id = ?', (self._last_seq(session_id), session_id)
+            )
+            self._conn.commit()
+
+    def clear_window(self, session_id):
+        with self._lock:
+            self._touch(session_id)
+            self._conn.execute(
+                'UPDATE sessions SET window_start = ? WHERE session_id = ?', (self._last_seq(session_id), session_id)
+            )
+            self._conn.commit()
+
+    def session_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+
+def create_session_store():
+    if SESSION_BACKEND == 'sqlite':
+        return SQLiteSessionStore(
+            SESSION_DB_PATH, window=SESSION_WINDOW, max_history=SESSION_MAX_HISTORY, idle_timeout=SESSION_IDLE_TIMEOUT
+        )
+    return InMemorySessionStore(
+        window=SESSION_WINDOW, max_history=SESSION_MAX_HISTORY, idle_timeout=SESSION_IDLE_TIMEOUT
+    )
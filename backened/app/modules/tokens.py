@@ -0,0 +1,25 @@
+import threading
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception:
+                # tiktoken may be missing or unable to fetch its vocabulary offline
+                _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """Counts tokens with the OpenAI tokenizer, falling back to a character estimate."""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
@@ -0,0 +1,376 @@
+import io, os, re, json, time, wave, sqlite3, tempfile, threading, subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from langchain_core.documents import Document
+from config import (
+    OPENAI_API_KEY, TRANSCRIPTION_MODEL, TRANSCRIPT_CACHE_PATH, TRANSCRIPTION_CONCURRENCY,
+    TRANSCRIPTION_SEGMENT_SECONDS, TRANSCRIPTION_MIN_SEGMENT_SECONDS, TRANSCRIPTION_MAX_RETRIES
+)
+from .metrics import external_call, registry
+from .parsing import CHUNK_SIZE, CHUNK_OVERLAP
+from .pipeline import retryable_errors, retry_delay
+from .services import service, preload, when_ready
+
+preload('openai', 'yt_dlp')
+
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+# Cuts are placed in the middle of the quietest stretch of this length
+PAUSE_SECONDS = 0.5
+# Segments whose loudest stretch stays below this RMS (16-bit PCM) are silence and not sent to Whisper
+SILENCE_RMS = 100
+# Whisper accepts files of up to 25 MB, about 13 minutes of 16 kHz, 16-bit mono WAV
+MAX_SEGMENT_SECONDS = 780
+
+VIDEO_ID_PATTERN = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})')
+
+TRANSCRIBED_SECONDS = registry.counter(
+    'aiq_transcribed_audio_seconds_total', 'Seconds of video audio sent to the transcription API.'
+)
+
+
+@service('transcription_client')
+def client():
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+def video_source(url, video):
+    """Returns the URL a video is indexed under: the same for every form of a YouTube link,
+    e.g. youtu.be/<id> or watch?v=<id>&t=5, and the URL itself for other sites."""
+    if VIDEO_ID_PATTERN.search(url):
+        return f'https://www.youtube.com/watch?v={video}'
+    return url
+
+
+def video_id(url):
+    """Returns the YouTube id of a video URL, asking YouTube only when the URL does not contain it."""
+    match = VIDEO_ID_PATTERN.search(url)
+    if match:
+        return match.group(1)
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'noplaylist': True}) as ydl:
+        return ydl.extract_info(url, download=False)['id']
+
+
+def download_audio(url, directory):
+    """Downloads the best audio stream of a video into ``directory`` and returns its path."""
+    import yt_dlp
+
+    options = {
+        'format': 'bestaudio/best',
+        'outtmpl': os.path.join(directory, '%(id)s.%(ext)s'),
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.prepare_filename(ydl.extract_info(url, download=True))
+
+
+def decode_audio(path, sample_rate=SAMPLE_RATE):
+    """Decodes an audio file with ffmpeg into mono 16-bit PCM samples."""
+    completed = subprocess.run(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', path, '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-'],
+        capture_output=True, check=True
+    )
+    return np.frombuffer(completed.stdout, dtype='<i2')
+
+
+def frame_energy(samples, sample_rate=SAMPLE_RATE):
+    """RMS of every FRAME_SECONDS frame, computed a block at a time to keep memory flat on long tracks."""
+    frame = int(sample_rate * FRAME_SECONDS)
+    frames = len(samples) // frame
+    energy = np.empty(frames, dtype=np.float32)
+    block = 4096
+    for first in range(0, frames, block):
+        part = samples[first * frame:min(first + block, frames) * frame].astype(np.float32).reshape(-1, frame)
+        energy[first:first + len(part)] = np.sqrt(np.mean(part ** 2, axis=1))
+    return energy
+
+
+def split_at_silences(samples, sample_rate=SAMPLE_RATE, max_seconds=300.0, min_seconds=120.0):
+    """Splits a track into (start, end) sample ranges of at most ``max_seconds``.
+
+    Each cut is placed in the quietest PAUSE_SECONDS stretch between ``min_seconds`` and
+    ``max_seconds`` after the previous one, so words are not cut in half and every
+    segment can be transcribed on its own. Segments that are silent throughout are left out.
+    """
+    max_seconds = min(max_seconds, MAX_SEGMENT_SECONDS)
+    min_seconds = min(min_seconds, max_seconds)
+    frame = int(sample_rate * FRAME_SECONDS)
+    energy = frame_energy(samples, sample_rate)
+    width = max(1, int(PAUSE_SECONDS / FRAME_SECONDS))
+    if len(energy) < width:
+        return [(0, len(samples))] if len(samples) and np.abs(samples).max() > SILENCE_RMS else []
+
+    # Mean energy of the stretch starting at each frame
+    cumulative = np.concatenate(([0.0], np.cumsum(energy, dtype=np.float64)))
+    stretches = (cumulative[width:] - cumulative[:-width]) / width
+
+    max_frames = max(int(max_seconds / FRAME_SECONDS), width * 2)
+    min_frames = max(int(min_seconds / FRAME_SECONDS), width)
+    cuts = [0]
+    while len(energy) - cuts[-1] > max_frames:
+        low = cuts[-1] + min_frames
+        high = min(cuts[-1] + max_frames - width, len(stretches))
+        quietest = low + int(np.argmin(stretches[low:high])) if high > low else cuts[-1] + max_frames
+        cuts.append(quietest + width // 2)
+    cuts.append(len(energy))
+
+    spans = []
+    for start, end in zip(cuts, cuts[1:]):
+        if stretches[min(start, len(stretches) - 1):max(end - width + 1, start + 1)].max() < SILENCE_RMS:
+            continue
+        spans.append((start * frame, len(samples) if end == len(energy) else end * frame))
+    return spans
+
+
+def wav_bytes(samples, sample_rate=SAMPLE_RATE):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def chunk_transcript(segments, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Groups timestamped segments into runs of about ``chunk_size`` characters.
+
+    Consecutive runs share up to ``chunk_overlap`` characters of whole segments, the
+    way the shared text splitter overlaps chunks, so every chunk keeps exact timestamps.
+    """
+    run, length = [], 0
+    for segment in segments:
+        size = len(segment['text']) + 1
+        if run and length + size > chunk_size:
+            yield run
+            overlap, overlap_length = [], 0
+            for previous in reversed(run):
+                previous_size = len(previous['text']) + 1
+                if overlap_length + previous_size > chunk_overlap or overlap_length + previous_size + size > chunk_size:
+                    break
+                overlap.insert(0, previous)
+                overlap_length += previous_size
+            run, length = overlap, overlap_length
+        run.append(segment)
+        length += size
+    if run:
+        yield run
+
+
+def transcript_documents(segments, source, video):
+    """Turns a transcript into chunk documents carrying the video id and their start and end in seconds."""
+    for run in chunk_transcript(segments):
+        yield Document(
+            page_content=' '.join(segment['text'] for segment in run),
+            metadata={'source': source, 'video_id': video, 'start': run[0]['start'], 'end': run[-1]['end']}
+        )
+
+
+class TranscriptStore:
+    """SQLite cache of video transcripts keyed by video id.
+
+    Segments are saved as soon as they are transcribed, so a failed or interrupted
+    job only transcribes the rest when it is retried.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS transcripts ('
+            'video_id TEXT PRIMARY KEY, model TEXT NOT NULL, duration REAL NOT NULL, '
+            'segments TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS transcript_parts ('
+            'video_id TEXT NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL, segments TEXT NOT NULL, '
+            'PRIMARY KEY (video_id, start, end))'
+        )
+        self._conn.commit()
+
+    def get(self, video):
+        with self._lock:
+            row = self._conn.execute('SELECT segments FROM transcripts WHERE video_id = ?', (video,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def parts(self, video):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT start, end, segments FROM transcript_parts WHERE video_id = ?', (video,)
+            ).fetchall()
+        return {(start, end): json.loads(segments) for start, end, segments in rows}
+
+    def add_part(self, video, start, end, segments):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO transcript_parts VALUES (?, ?, ?, ?)', (video, start, end, json.dumps(segments))
+            )
+            self._conn.commit()
+
+    def set(self, video, model, duration, segments):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?)',
+                (video, model, duration, json.dumps(segments), time.time())
+            )
+            self._conn.execute('DELETE FROM transcript_parts WHERE video_id = ?', (video,))
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM transcripts').fetchone()[0]
+
+
+class Transcriber:
+    """Transcribes videos by splitting their audio at silences and sending the segments to Whisper concurrently.
+
+    At most ``concurrency`` transcription requests are made at once across all
+    videos, and a video that is already being transcribed is waited for instead
+    of being transcribed a second time.
+    """
+
+    def __init__(self, store, model='whisper-1', concurrency=8, segment_seconds=300.0,
+                 min_segment_seconds=120.0, max_retries=4):
+        self.store = store
+        self.model = model
+        self.concurrency = concurrency
+        self.segment_seconds = segment_seconds
+        self.min_segment_seconds = min_segment_seconds
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._videos = {}
+        self.counts = {'videos': 0, 'cached': 0, 'segments': 0, 'resumed_segments': 0}
+
+    @contextmanager
+    def _video_lock(self, video):
+        with self._lock:
+            lock, users = self._videos.get(video, (threading.Lock(), 0))
+            self._videos[video] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._videos[video]
+                if users == 1:
+                    del self._videos[video]
+                else:
+                    self._videos[video] = (lock, users - 1)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def _request(self, audio, offset, duration):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with external_call('transcription'):
+                    response = client().audio.transcriptions.create(
+                        model=self.model, file=('segment.wav', audio, 'audio/wav'), response_format='verbose_json'
+                    )
+                break
+            except retryable_errors() as e:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(retry_delay(e, attempt))
+        segments = response.segments or []
+        if not segments and response.text.strip():
+            return [{'start': round(offset, 2), 'end': round(offset + duration, 2), 'text': response.text.strip()}]
+        return [
+            {'start': round(offset + segment.start, 2), 'end': round(offset + segment.end, 2), 'text': segment.text.strip()}
+            for segment in segments if segment.text.strip()
+        ]
+
+    def _transcribe_span(self, samples, start, end, sample_rate):
+        duration = (end - start) / sample_rate
+        with self._slots:
+            segments = self._request(wav_bytes(samples[start:end], sample_rate), start / sample_rate, duration)
+        TRANSCRIBED_SECONDS.inc(duration)
+        return segments
+
+    def transcribe(self, url, on_progress=None):
+        """Returns the timestamped transcript segments of a video and the stats of the run.
+
+        The transcript is served from the cache when the video was transcribed before.
+        ``on_progress`` is called with the fraction of segments done.
+        """
+        video = video_id(url)
+        with self._video_lock(video):
+            segments = self.store.get(video)
+            if segments is not None:
+                self._count('cached')
+                return video, segments, {'cached': True}
+            return video, *self._transcribe(url, video, on_progress)
+
+    def _transcribe(self, url, video, on_progress):
+        stats = {'cached': False}
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix='aiq-video-') as directory:
+            samples = decode_audio(download_audio(url, directory), SAMPLE_RATE)
+        stats['download_seconds'] = round(time.perf_counter() - start, 4)
+        stats['audio_seconds'] = round(len(samples) / SAMPLE_RATE, 2)
+
+        spans = split_at_silences(samples, SAMPLE_RATE, self.segment_seconds, self.min_segment_seconds)
+        done = self.store.parts(video)
+        parts = {span: done[span] for span in spans if span in done}
+        missing = [span for span in spans if span not in parts]
+        stats.update(segments=len(spans), resumed_segments=len(parts))
+        self._count('videos')
+        self._count('segments', len(spans))
+        self._count('resumed_segments', len(parts))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='transcribe') as executor:
+            futures = {
+                executor.submit(self._transcribe_span, samples, span_start, span_end, SAMPLE_RATE): (span_start, span_end)
+                for span_start, span_end in missing
+            }
+            errors = []
+            for future in as_completed(futures):
+                span = futures[future]
+                try:
+                    parts[span] = future.result()
+                except Exception as e:
+                    # The other segments are still saved, so a retry only transcribes the failed ones
+                    errors.append(e)
+                    continue
+                self.store.add_part(video, *span, parts[span])
+                if on_progress:
+                    on_progress(len(parts) / len(spans))
+        if errors:
+            raise errors[0]
+        stats['transcribe_seconds'] = round(time.perf_counter() - start, 4)
+
+        segments = [segment for span in spans for segment in parts[span]]
+        self.store.set(video, self.model, stats['audio_seconds'], segments)
+        return segments, stats
+
+    def stats(self):
+        with self._lock:
+            counts = {**self.counts, 'in_progress': len(self._videos)}
+        return {**counts, 'transcripts': self.store.count()}
+
+
+@service('transcriber')
+def transcriber():
+    return Transcriber(
+        TranscriptStore(TRANSCRIPT_CACHE_PATH),
+        model=TRANSCRIPTION_MODEL,
+        concurrency=TRANSCRIPTION_CONCURRENCY,
+        segment_seconds=TRANSCRIPTION_SEGMENT_SECONDS,
+        min_segment_seconds=TRANSCRIPTION_MIN_SEGMENT_SECONDS,
+        max_retries=TRANSCRIPTION_MAX_RETRIES
+    )
+
+
+registry.register_stats('aiq_transcription', when_ready(transcriber, 'stats'))
@@ -0,0 +1,276 @@
+import os, json, sqlite3, hashlib, threading, time
+from concurrent.futures import Future
+from langdetect import detect, DetectorFactory
+from langdetect.detector_factory import init_factory
+from config import (
+    OPENAI_API_KEY, TRANSLATION_CACHE_PATH, TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_MAX_ENTRIES,
+    TRANSLATION_BATCH_WINDOW_MS, TRANSLATION_MAX_BATCH
+)
+from .lru import LRUCache
+from .metrics import external_call, count_usage, registry
+from .services import service, preload
+
+preload('openai')
+
+
+@service('translation_client')
+def client():
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+# Make language detection deterministic between calls and workers
+DetectorFactory.seed = 0
+
+
+@service('language_profiles', fork_safe=True)
+def language_profiles():
+    # The profiles are loaded on first use, which is not thread-safe; load them once, under the service lock
+    init_factory()
+    return True
+
+languages = {
+    "en": "English", "es": "Spanish", "fr": "French", "ru": "Russian", "zh": "Chinese", "ar": "Arabic", "sw": "Swahili"
+}
+
+TRANSLATION_ERROR_MESSAGE = "An error occurred while translating the text. Please try again later."
+
+
+class TranslationStore:
+    """On-disk cache of translations keyed by text hash and target language."""
+
+    def __init__(self, path, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS translations ('
+            'key TEXT PRIMARY KEY, translation TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT translation FROM translations WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, translation):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO translations VALUES (?, ?, ?)', (key, translation, time.time()))
+            count = self._conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    'DELETE FROM translations WHERE key IN '
+                    '(SELECT key FROM translations ORDER BY created_at LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+
+def _request_translation(text, target_lang):
+    with external_call('translation'):
+        translation = client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": f"Translate the following text into {target_lang}."},
+                {"role": "user", "content": text}
+            ],
+            max_tokens=1000
+        )
+    count_usage(translation.model, translation.usage)
+    return translation.choices[0].message.content.strip()
+
+
+def _request_batch_translation(texts, target_lang):
+    """Translates several segments with a single chat completion."""
+    with external_call('translation'):
+        translation = client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": (
+                    f"Translate each string in the following JSON array into {target_lang}. "
+                    "Reply with only a JSON array of the translations, in the same order."
+                )},
+                {"role": "user", "content": json.dumps(texts, ensure_ascii=False)}
+            ],
+            max_tokens=min(4000, 1000 * len(texts))
+        )
+    count_usage(translation.model, translation.usage)
+    translations = json.loads(translation.choices[0].message.content)
+    if not isinstance(translations, list) or len(translations) != len(texts):
+        raise ValueError("Batch translation returned a different number of segments")
+    return [str(item).strip() for item in translations]
+
+
+class TranslationBatcher:
+    """Coalesces translations that are requested within a short window into one API call."""
+
+    def __init__(self, window=0.01, max_batch=8):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, text, target_lang):
+        future = Future()
+        with self._lock:
+            batch = self._pending.setdefault(target_lang, [])
+            batch.append((text, future))
+            if len(batch) >= self.max_batch:
+                ready = self._pending.pop(target_lang)
+            else:
+                ready = None
+                if len(batch) == 1:
+                    timer = threading.Timer(self.window, self._flush, (target_lang,))
+                    timer.daemon = True
+                    timer.start()
+
+        if ready:
+            threading.Thread(target=self._run, args=(target_lang, ready), daemon=True).start()
+        return future
+
+    def _flush(self, target_lang):
+        with self._lock:
+            batch = self._pending.pop(target_lang, None)
+        if batch:
+            self._run(target_lang, batch)
+
+    def _run(self, target_lang, batch):
+        texts = [text for text, _ in batch]
+        try:
+            if len(texts) == 1:
+                results = [_request_translation(texts[0], target_lang)]
+            else:
+                try:
+                    results = _request_batch_translation(texts, target_lang)
+                except ValueError:
+                    # The model did not return a usable array; fall back to one call per segment
+                    results = [_request_translation(text, target_lang) for text in texts]
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+memory_cache = LRUCache(TRANSLATION_CACHE_SIZE)
+batcher = TranslationBatcher(window=TRANSLATION_BATCH_WINDOW_MS / 1000, max_batch=TRANSLATION_MAX_BATCH)
+
+
+@service('translation_cache')
+def disk_cache():
+    return TranslationStore(TRANSLATION_CACHE_PATH, max_entries=TRANSLATION_CACHE_MAX_ENTRIES)
+
+
+translation_counts = {'skipped': 0, 'memory': 0, 'disk': 0, 'remote': 0}
+_counts_lock = threading.Lock()
+
+
+def _count(kind):
+    with _counts_lock:
+        translation_counts[kind] += 1
+
+
+def _cache_key(text, target_lang):
+    return hashlib.sha256(f'{target_lang}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def detect_language(text):
+    language_profiles()
+    return detect(text)
+
+
+def is_in_language(text, target_lang):
+    """Checks with langdetect whether the text is already written in the target language."""
+    try:
+        detected_lang = detect_language(text).split('-')[0]
+    except Exception:
+        return False
+    return languages.get(detected_lang) == target_lang
+
+
+def _cached_translation(text, target_lang):
+    key = _cache_key(text, target_lang)
+    translation = memory_cache.get(key)
+    if translation is not None:
+        _count('memory')
+        return key, translation
+
+    translation = disk_cache().get(key)
+    if translation is not None:
+        _count('disk')
+        memory_cache.set(key, translation)
+        return key, translation
+
+    return key, None
+
+
+def _remember(key, translation):
+    memory_cache.set(key, translation)
+    disk_cache().set(key, translation)
+
+
+def translate_text(text, target_lang='English'):
+    """Translates text to the specified target language."""
+    if not text.strip():
+        return text
+
+    if is_in_language(text, target_lang):
+        _count('skipped')
+        return text
+
+    key, translation = _cached_translation(text, target_lang)
+    if translation is not None:
+        return translation
+
+    try:
+        _count('remote')
+        translation = batcher.submit(text, target_lang).result()
+    except Exception:
+        return TRANSLATION_ERROR_MESSAGE
+
+    _remember(key, translation)
+    return translation
+
+
+def translate_many(texts, target_lang='English'):
+    """Translates several texts, sending all uncached ones in a single request."""
+    results = list(texts)
+    missing = {}
+    for index, text in enumerate(texts):
+        if not text.strip() or is_in_language(text, target_lang):
+            continue
+        key, translation = _cached_translation(text, target_lang)
+        if translation is not None:
+            results[index] = translation
+        else:
+            missing.setdefault(text, (key, []))[1].append(index)
+
+    if missing:
+        futures = {text: batcher.submit(text, target_lang) for text in missing}
+        _count('remote')
+        for text, future in futures.items():
+            key, indexes = missing[text]
+            try:
+                translation = future.result()
+            except Exception:
+                translation = TRANSLATION_ERROR_MESSAGE
+            else:
+                _remember(key, translation)
+            for index in indexes:
+                results[index] = translation
+
+    return results
+
+
+def translation_stats():
+    with _counts_lock:
+        counts = dict(translation_counts)
+    return {**counts, 'cache': memory_cache.stats()}
+
+
+registry.register_stats('aiq_translation', translation_stats)
@@ -0,0 +1,229 @@
+import os, re, json, uuid, hashlib, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    OPENAI_API_KEY, TTS_MODEL, TTS_VOICE, TTS_CACHE_DIRECTORY, TTS_CACHE_MAX_ENTRIES, TTS_CONCURRENCY
+)
+from .metrics import external_call, registry
+from .services import service, preload
+
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?。！？])\s+|\n+')
+CLIP_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+STREAM_BLOCK_SIZE = 16 * 1024
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+class SentenceBuffer:
+    """Collects streamed answer tokens and releases text one complete sentence at a time.
+
+    Sentences shorter than ``min_chars`` are held back and spoken with the next one,
+    so abbreviations and very short fragments do not become separate clips. With
+    ``strip`` off, the released pieces keep their whitespace and add up to the text fed.
+    """
+
+    def __init__(self, min_chars=20, strip=True):
+        self.min_chars = min_chars
+        self.strip = strip
+        self._text = ''
+
+    def feed(self, token):
+        self._text += token
+        boundaries = [match.end() for match in SENTENCE_BOUNDARY.finditer(self._text)]
+        for end in reversed(boundaries):
+            if len(self._text[:end].strip()) >= self.min_chars:
+                sentence, self._text = self._text[:end], self._text[end:]
+                return [sentence.strip() if self.strip else sentence]
+        return []
+
+    def flush(self):
+        sentence, self._text = self._text, ''
+        if not sentence.strip():
+            return []
+        return [sentence.strip() if self.strip else sentence]
+
+
+class TTSCache:
+    """Content-addressed store of synthesized clips, named by the hash of the voice settings and text.
+
+    The speech manifests of multi-sentence replies live next to the clips and are evicted
+    with them: once clips are removed, so are the manifests last used before them.
+    """
+
+    def __init__(self, directory, max_entries=5000):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._entries = sum(1 for name in os.listdir(directory) if name.endswith('.mp3'))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, clip_id):
+        return os.path.join(self.directory, f'{clip_id}.mp3')
+
+    def get(self, clip_id):
+        path = self.path(clip_id)
+        try:
+            # Touch the clip so that eviction removes the least recently used ones first
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, clip_id, data):
+        path = self.path(clip_id)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        # A clip synthesized again, e.g. by two requests at once, replaces the file without adding an entry
+        existed = os.path.exists(path)
+        os.replace(temp_path, path)
+        with self._lock:
+            if not existed:
+                self._entries += 1
+            evict = self._entries > self.max_entries
+        if evict:
+            self._evict()
+        return path
+
+    def _evict(self):
+        entries = list(os.scandir(self.directory))
+        clips = [entry for entry in entries if entry.name.endswith('.mp3')]
+        clips.sort(key=lambda entry: entry.stat().st_mtime)
+        excess = len(clips) - int(self.max_entries * 0.9)
+        evicted = clips[:max(excess, 0)]
+        if evicted:
+            # Manifests not read since the newest evicted clip was last used go with the clips
+            cutoff = evicted[-1].stat().st_mtime
+            evicted += [entry for entry in entries if entry.name.endswith('.json') and entry.stat().st_mtime <= cutoff]
+        for entry in evicted:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._entries = len(clips) - max(excess, 0)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': self._entries,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+class SpeechSynthesizer:
+    """Synthesizes speech sentence by sentence, so playback can start after the first sentence.
+
+    Clips are cached by content, and up to ``concurrency`` sentences are synthesized
+    ahead of the one being delivered.
+    """
+
+    def __init__(self, client, cache, model='tts-1', voice='shimmer', concurrency=3):
+        self.client = client
+        self.cache = cache
+        self.model = model
+        self.voice = voice
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tts')
+
+    def clip_id(self, text):
+        return hashlib.sha256(f'{self.model}\0{self.voice}\0{text}'.encode('utf-8')).hexdigest()
+
+    def clip(self, text):
+        """Returns the id of the clip for ``text``, synthesizing it unless it is cached."""
+        clip_id = self.clip_id(text)
+        if self.cache.get(clip_id) is None:
+            with external_call('tts'):
+                response = self.client.audio.speech.create(
+                    model=self.model, voice=self.voice, input=text, response_format='mp3'
+                )
+            self.cache.put(clip_id, response.content)
+        return clip_id
+
+    def submit(self, text):
+        return self.executor.submit(self.clip, text)
+
+    def clips(self, sentences):
+        """Yields clip ids in order while synthesizing the following sentences in the background."""
+        pending = deque()
+        for sentence in sentences:
+            pending.append(self.submit(sentence))
+            if len(pending) > self.concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def save_speech(self, sentences, clip_ids):
+        """Records a multi-sentence reply so it can be fetched again as one audio stream."""
+        speech_id = hashlib.sha256('\0'.join(clip_ids).encode('utf-8')).hexdigest()
+        path = os.path.join(self.cache.directory, f'{speech_id}.json')
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'clips': [{'id': clip_id, 'text': text} for clip_id, text in zip(clip_ids, sentences)]}, f)
+        os.replace(temp_path, path)
+        return speech_id
+
+    def load_speech(self, speech_id):
+        path = os.path.join(self.cache.directory, f'{speech_id}.json')
+        try:
+            # Touched like the clips, so eviction keeps the manifests that are still being fetched
+            os.utime(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['clips']
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def read_clip(self, clip_id, text=None):
+        """Yields the audio of a clip in blocks, synthesizing it again if it was evicted."""
+        path = self.cache.path(clip_id)
+        if not os.path.exists(path):
+            if text is None:
+                return
+            self.clip(text)
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(STREAM_BLOCK_SIZE), b'')
+
+    def stream_text(self, text):
+        """Yields MP3 audio for ``text`` as a chunked stream, one sentence after another."""
+        sentences = split_sentences(text)
+        for sentence, clip_id in zip(sentences, self.clips(sentences)):
+            yield from self.read_clip(clip_id, sentence)
+
+    def stream_speech(self, clips):
+        for clip in clips:
+            yield from self.read_clip(clip['id'], clip['text'])
+
+
+def audio_url(audio_id):
+    return f'/speech/audio/{audio_id}'
+
+
+preload('openai')
+
+
+@service('synthesizer')
+def synthesizer():
+    from openai import OpenAI
+    return SpeechSynthesizer(
+        OpenAI(api_key=OPENAI_API_KEY),
+        TTSCache(TTS_CACHE_DIRECTORY, TTS_CACHE_MAX_ENTRIES),
+        model=TTS_MODEL,
+        voice=TTS_VOICE,
+        concurrency=TTS_CONCURRENCY
+    )
+
+
+registry.register_stats('aiq_tts_cache', lambda: synthesizer().cache.stats() if synthesizer.ready else {})
@@ -0,0 +1,71 @@
+import os, uuid, hashlib
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from config import UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES
+
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class SpooledUpload:
+    """Writable file for one uploaded part, created in UPLOAD_DIRECTORY and hashed as it arrives.
+
+    Unless it is claimed with ``persist``, the file is removed when the request closes it.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.path = os.path.join(directory, f'{uuid.uuid4().hex}.part')
+        self._file = open(self.path, 'w+b')
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._max_bytes = max_bytes
+        self._claimed = False
+
+    def write(self, data):
+        self._size += len(data)
+        if self._max_bytes and self._size > self._max_bytes:
+            # The parser drops the part on error, so nothing else would remove the file
+            self.close()
+            raise RequestEntityTooLarge()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def persist(self, path):
+        """Moves the spooled file to ``path`` without copying it and returns its sha256 digest."""
+        self._file.close()
+        os.replace(self.path, path)
+        self._claimed = True
+        return self._digest.hexdigest()
+
+    def close(self):
+        self._file.close()
+        if not self._claimed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request that spools multipart files straight into the upload directory instead of a temporary file."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload(UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES)
+
+
+def copy_stream(stream, path, max_bytes=MAX_UPLOAD_BYTES):
+    """Copies a stream to ``path`` in blocks, hashing it on the way. Returns the sha256 digest."""
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(path, 'wb') as f:
+            for block in iter(lambda: stream.read(COPY_BLOCK_SIZE), b''):
+                size += len(block)
+                if max_bytes and size > max_bytes:
+                    raise RequestEntityTooLarge()
+                digest.update(block)
+                f.write(block)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return digest.hexdigest()
@@ -0,0 +1,288 @@
+import os, json, mmap, time, uuid, shutil, argparse, threading
+import numpy as np
+from config import VECTOR_INDEX_DTYPE, VECTOR_INDEX_RESCORE_FACTOR
+from .answer_cache import current_index_version
+from .document_collections import DEFAULT_COLLECTION, vector_index_directory, validate_collection_name
+from .keyword_index import REBUILD_PAGE_SIZE
+from .metrics import registry
+from .services import service, when_ready
+
+
+VECTOR_INDEX_DTYPES = ('int8', 'float16')
+
+# Quantized rows are widened to float32 this many at a time; a block that stays in the CPU cache
+# makes the scan about twice as fast as widening larger blocks or the whole matrix
+SCAN_BLOCK_ROWS = 256
+
+
+def map_rows(path):
+    """Maps a .npy file for reading a few scattered rows at a time.
+
+    Read-ahead is turned off for it, so a rescoring pass on a cold cache reads the rows
+    it needs instead of the kernel's read-ahead window around each one.
+    """
+    header = np.load(path, mmap_mode='r')
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_RANDOM'):
+        mapped.madvise(mmap.MADV_RANDOM)
+    return np.ndarray(header.shape, header.dtype, buffer=mapped, offset=header.offset)
+
+
+class QuantizedIndex:
+    """Read-only snapshot of a Chroma collection's vectors in memory-mapped NumPy files.
+
+    Queries scan an int8 (one scale per row) or float16 copy of the vectors, then rescore
+    the best ``k * rescore_factor`` candidates against the float32 vectors and return the
+    ids of the top ``k``. Only the quantized matrix is read in full, so the float32 file
+    mostly stays on disk. Rankings use the distance of the Chroma collection.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.version = meta['version']
+        self.metric = meta['metric']
+        self.dtype = meta['dtype']
+        self.count = meta['count']
+        self.dimensions = meta['dimensions']
+        self.source_codes = {source: code for code, source in enumerate(meta['sources'])}
+        if self.count:
+            load = lambda name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')[:self.count]
+            self.ids = load('ids')
+            self.codes = load('sources')
+            self.vectors = load('vectors')
+            self.exact = map_rows(os.path.join(directory, 'exact.npy'))[:self.count]
+            self.offsets = np.asarray(load('offsets'))
+            self.scales = np.asarray(load('scales')) if self.dtype == 'int8' else None
+
+    @classmethod
+    def build(cls, collection, directory, dtype='int8', version=0):
+        """Writes a snapshot of a Chroma collection to ``directory`` and returns it loaded."""
+        if dtype not in VECTOR_INDEX_DTYPES:
+            raise ValueError(f'Vector index dtype must be one of {", ".join(VECTOR_INDEX_DTYPES)}.')
+        metric = (collection.metadata or {}).get('hnsw:space', 'l2')
+        total = collection.count()
+        os.makedirs(directory, exist_ok=True)
+
+        rows, dimensions, ids, sources, codes, arrays = 0, 0, [], {}, [], {}
+        while rows < total:
+            page = collection.get(
+                include=['embeddings', 'metadatas'], limit=min(REBUILD_PAGE_SIZE, total - rows), offset=rows
+            )
+            if not page['ids']:
+                break
+            embeddings = np.asarray(page['embeddings'], dtype=np.float32)
+            if not arrays:
+                dimensions = embeddings.shape[1]
+                arrays = cls._create_arrays(directory, dtype, total, dimensions)
+            if metric == 'cosine':
+                embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            end = rows + len(embeddings)
+            arrays['exact'][rows:end] = embeddings
+            if dtype == 'int8':
+                scales = np.abs(embeddings).max(axis=1) / 127
+                scales[scales == 0] = 1
+                arrays['vectors'][rows:end] = np.rint(embeddings / scales[:, None]).astype(np.int8)
+                arrays['scales'][rows:end] = scales
+            else:
+                arrays['vectors'][rows:end] = embeddings.astype(np.float16)
+            # Ranking by q.v - |v|^2 / 2 is ranking by L2 distance, without the query's own norm
+            if metric == 'l2':
+                arrays['offsets'][rows:end] = 0.5 * np.einsum('ij,ij->i', embeddings, embeddings)
+            ids.extend(page['ids'])
+            codes.extend(sources.setdefault((metadata or {}).get('source'), len(sources)) for metadata in page['metadatas'])
+            rows = end
+
+        for array in arrays.values():
+            array.flush()
+        if rows:
+            arrays['sources'][:rows] = codes
+            np.save(os.path.join(directory, 'ids.npy'), np.array(ids))
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': version, 'metric': metric, 'dtype': dtype, 'count': rows, 'dimensions': dimensions,
+                'sources': list(sources),
+            }, f)
+        return cls(directory)
+
+    @staticmethod
+    def _create_arrays(directory, dtype, rows, dimensions):
+        def create(name, array_dtype, shape):
+            return np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), 'w+', array_dtype, shape)
+
+        arrays = {
+            'vectors': create('vectors', dtype, (rows, dimensions)),
+            'exact': create('exact', np.float32, (rows, dimensions)),
+            'offsets': create('offsets', np.float32, (rows,)),
+            'sources': create('sources', np.int32, (rows,)),
+        }
+        if dtype == 'int8':
+            arrays['scales'] = create('scales', np.float32, (rows,))
+        return arrays
+
+    def search(self, embedding, k=4, sources=None, rescore_factor=8):
+        """Returns the ids of the ``k`` nearest vectors, optionally only those of ``sources``."""
+        if not self.count or sources is not None and not sources:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.metric == 'cosine':
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        scores = np.empty(self.count, dtype=np.float32)
+        widened = np.empty((SCAN_BLOCK_ROWS, self.dimensions), dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            block = self.vectors[start:start + SCAN_BLOCK_ROWS]
+            np.copyto(widened[:len(block)], block, casting='unsafe')
+            np.dot(widened[:len(block)], query, out=scores[start:start + len(block)])
+        if self.scales is not None:
+            scores *= self.scales
+        scores -= self.offsets
+        if sources is not None:
+            wanted = [self.source_codes[source] for source in sources if source in self.source_codes]
+            scores[~np.isin(self.codes, wanted)] = -np.inf
+
+        candidates = min(k * max(rescore_factor, 1), self.count)
+        top = np.argpartition(scores, self.count - candidates)[self.count - candidates:]
+        top = np.sort(top[np.isfinite(scores[top])])
+        exact = self.exact[top] @ query - self.offsets[top]
+        best = top[np.argsort(-exact, kind='stable')[:k]]
+        return [str(chunk_id) for chunk_id in self.ids[best]]
+
+    def stats(self):
+        return {
+            'rows': self.count,
+            'quantized_bytes': self.vectors.nbytes if self.count else 0,
+            'exact_bytes': self.exact.nbytes if self.count else 0,
+        }
+
+
+class VectorIndexes:
+    """Quantized indexes of the document collections, kept in step with their Chroma collections.
+
+    An index is a snapshot taken at one collection version. A search against a collection
+    whose index is missing or older than the collection gets None, and a rebuild starts in
+    the background; the caller searches Chroma meanwhile. Snapshots live in numbered
+    directories on disk, so every worker process maps the same files and only one of them
+    needs to build each version.
+    """
+
+    def __init__(self, dtype='int8', rescore_factor=8):
+        if dtype not in VECTOR_INDEX_DTYPES:
+            raise ValueError(f'Vector index dtype must be one of {", ".join(VECTOR_INDEX_DTYPES)}.')
+        self.dtype = dtype
+        self.rescore_factor = rescore_factor
+        self._indexes = {}
+        self._building = set()
+        self._lock = threading.Lock()
+        self.counts = {'searches': 0, 'fallbacks': 0, 'builds': 0, 'build_failures': 0}
+
+    def get(self, handle):
+        """Returns the index of an open collection if it matches the collection's version, otherwise None."""
+        version = current_index_version(handle.name)
+        with self._lock:
+            index = self._indexes.get(handle.name)
+            if index is None or index.version != version:
+                index = self._load(handle.name, version)
+            if index is not None:
+                self.counts['searches'] += 1
+                return index
+            self.counts['fallbacks'] += 1
+            if handle.name not in self._building:
+                self._building.add(handle.name)
+                threading.Thread(
+                    target=self._rebuild, args=(handle.name, handle.vector_store._collection, version),
+                    name=f'vector-index-{handle.name}', daemon=True
+                ).start()
+        return None
+
+    def search(self, handle, embedding, k=4, sources=None):
+        """Returns the ids of the nearest chunks, or None while the collection has no current index."""
+        index = self.get(handle)
+        if index is None:
+            return None
+        return index.search(embedding, k, sources, self.rescore_factor)
+
+    def _load(self, name, version):
+        directory = os.path.join(vector_index_directory(name), f'{version}-{self.dtype}')
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            return None
+        self._indexes[name] = QuantizedIndex(directory)
+        return self._indexes[name]
+
+    def _rebuild(self, name, collection, version):
+        start = time.perf_counter()
+        try:
+            index = self.build(name, collection, version)
+            with self._lock:
+                self._indexes[name] = index
+                self.counts['builds'] += 1
+            print(f'Built the {self.dtype} vector index of {name}: {index.count} vectors in {time.perf_counter() - start:.1f}s')
+        except Exception as e:
+            with self._lock:
+                self.counts['build_failures'] += 1
+            print(f'Error building the vector index of {name}: {e}')
+        finally:
+            with self._lock:
+                self._building.discard(name)
+
+    def build(self, name, collection, version=None):
+        """Snapshots a Chroma collection into a new index directory and removes older snapshots."""
+        if version is None:
+            version = current_index_version(name)
+        parent = vector_index_directory(name)
+        directory = os.path.join(parent, f'{version}-{self.dtype}')
+        staging = os.path.join(parent, f'.building-{uuid.uuid4().hex}')
+        try:
+            QuantizedIndex.build(collection, staging, self.dtype, version)
+            os.rename(staging, directory)
+        except OSError:
+            # Another process finished the same version first
+            if not os.path.exists(os.path.join(directory, 'meta.json')):
+                raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        # Mapped files of older snapshots stay readable until whoever has them open lets go
+        for entry in os.scandir(parent):
+            if entry.is_dir() and entry.path != directory and not entry.name.startswith('.'):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        return QuantizedIndex(directory)
+
+    def stats(self):
+        with self._lock:
+            indexes = [index.stats() for index in self._indexes.values()]
+            return {
+                'collections': len(indexes),
+                'rows': sum(index['rows'] for index in indexes),
+                'quantized_bytes': sum(index['quantized_bytes'] for index in indexes),
+                'building': len(self._building),
+                **self.counts,
+            }
+
+
+@service('vector_indexes')
+def vector_indexes():
+    return VectorIndexes(dtype=VECTOR_INDEX_DTYPE, rescore_factor=VECTOR_INDEX_RESCORE_FACTOR)
+
+
+registry.register_stats('aiq_vector_index', when_ready(vector_indexes, 'stats'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the quantized vector index of a collection from Chroma.')
+    parser.add_argument('--collection', default=DEFAULT_COLLECTION, help='document collection to index')
+    args = parser.parse_args(argv)
+
+    # Imported here: only the command line needs the Chroma client
+    from .document_processing import collection_manager
+
+    name = validate_collection_name(args.collection)
+    with collection_manager().use(name) as handle:
+        start = time.perf_counter()
+        index = vector_indexes().build(name, handle.vector_store._collection)
+    print(json.dumps({**index.stats(), 'directory': index.directory, 'seconds': round(time.perf_counter() - start, 2)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+import uuid, queue, asyncio, threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .tts import split_sentences, synthesizer, audio_url
+from .translation import translate_many
+
+
+SAMPLE_WIDTH = 2  # 16-bit little-endian PCM, mono
+
+# Only utterances this short are checked locally for the stop word
+STOP_WORD_MAX_SECONDS = 1.5
+
+# Closed sessions stay readable for a while so clients can drain their last events
+CLOSED_SESSIONS_KEPT = 256
+
+GREETING = "Hello! How can I help you today?"
+RETRY_PROMPT = "I didn't catch that. Could you please repeat?"
+GOODBYE = "Goodbye! I'll be here if you need me."
+
+
+def frame_energy(frame):
+    """Root mean square amplitude of a PCM16 frame, on the same scale as speech_recognition's energy threshold."""
+    samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+
+class Endpointer:
+    """Cuts a continuous PCM16 stream into utterances with an energy gate.
+
+    ``feed`` returns ``('start', audio)``, ``('audio', audio)`` and ``('end', None)`` events.
+    A short pre-roll is kept so that the first syllable is not lost, and an utterance
+    ends after ``pause_seconds`` of silence or ``max_seconds`` of audio.
+    """
+
+    def __init__(self, sample_rate=16000, energy_threshold=300, pause_seconds=0.8, max_seconds=30,
+                 frame_ms=30, pre_roll_seconds=0.3, min_speech_frames=3):
+        self.frame_bytes = sample_rate * frame_ms // 1000 * SAMPLE_WIDTH
+        self.energy_threshold = energy_threshold
+        self.pause_frames = max(int(pause_seconds * 1000 / frame_ms), 1)
+        self.max_frames = int(max_seconds * 1000 / frame_ms)
+        self.min_speech_frames = min_speech_frames
+        self.pre_roll = deque(maxlen=max(int(pre_roll_seconds * 1000 / frame_ms), min_speech_frames))
+        self._buffer = bytearray()
+        self.in_speech = False
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._frames = 0
+
+    def is_voiced(self, frame):
+        return frame_energy(frame) >= self.energy_threshold
+
+    def feed(self, pcm):
+        self._buffer.extend(pcm)
+        events = []
+        offset = 0
+        while len(self._buffer) - offset >= self.frame_bytes:
+            frame = bytes(self._buffer[offset:offset + self.frame_bytes])
+            offset += self.frame_bytes
+            voiced = self.is_voiced(frame)
+
+            if not self.in_speech:
+                self.pre_roll.append(frame)
+                self._voiced_run = self._voiced_run + 1 if voiced else 0
+                if self._voiced_run >= self.min_speech_frames:
+                    self.in_speech = True
+                    self._silent_run = 0
+                    self._frames = len(self.pre_roll)
+                    events.append(('start', b''.join(self.pre_roll)))
+                    self.pre_roll.clear()
+                continue
+
+            events.append(('audio', frame))
+            self._frames += 1
+            self._silent_run = 0 if voiced else self._silent_run + 1
+            if self._silent_run >= self.pause_frames or self._frames >= self.max_frames:
+                self.in_speech = False
+                self._voiced_run = 0
+                events.append(('end', None))
+
+        del self._buffer[:offset]
+        return events
+
+
+class VoiceSession:
+    def __init__(self, session_id, chat_session_id, input_lang, output_lang):
+        self.id = session_id
+        self.chat_session_id = chat_session_id
+        self.input_lang = input_lang
+        self.output_lang = output_lang
+        self.state = 'waiting'
+        self.frames = asyncio.Queue()
+        self.events = queue.Queue()
+        self.task = None
+
+    def emit(self, event, data=None):
+        self.events.put((event, data or {}))
+
+
+class VoiceEngine:
+    """Runs voice sessions as tasks on one asyncio loop in a background thread.
+
+    Clients push PCM16 audio with ``feed`` and read events with ``events``. Each session
+    keeps its own wake-word state, streams every utterance to the recognizer while the
+    user is still speaking, and only blocks a worker thread for answering and speech
+    synthesis, so one process serves many concurrent voice sessions.
+
+    ``recognizer.transcribe(chunks, sample_rate)`` is a coroutine that consumes an async
+    iterator of audio and returns the transcription; ``respond(text, session)`` answers
+    a question and returns ``process_query``'s result.
+
+    With a ``spotter`` that has templates for the wake word, waiting-mode utterances are
+    checked locally and only reach the recognizer when the local result is uncertain, so
+    in practice only audio after the wake word is transcribed. Short utterances in
+    conversation mode are checked for the stop word too.
+    """
+
+    def __init__(self, recognizer, respond, wake_word='assistant', stop_word='stop', sample_rate=16000,
+                 energy_threshold=300, pause_seconds=0.8, max_utterance_seconds=30, idle_timeout=120, workers=8,
+                 spotter=None):
+        self.recognizer = recognizer
+        self.spotter = spotter
+        self.respond = respond
+        self.wake_word = wake_word
+        self.stop_word = stop_word
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.pause_seconds = pause_seconds
+        self.max_utterance_seconds = max_utterance_seconds
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self._closed = OrderedDict()
+        self.counts = {
+            'utterances': 0, 'local_checks': 0, 'recognitions': 0, 'confirmations': 0, 'wakes': 0, 'local_stops': 0
+        }
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='voice')
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name='voice-loop', daemon=True).start()
+
+    def create_session(self, chat_session_id='default', input_lang='auto-detect', output_lang='English'):
+        session_id = uuid.uuid4().hex
+        if self.spotter is not None:
+            # Loads or creates the keyword templates once, in the background
+            self.executor.submit(self.spotter.prepare, [self.wake_word, self.stop_word])
+
+        async def start():
+            session = VoiceSession(session_id, chat_session_id, input_lang, output_lang)
+            self.sessions[session_id] = session
+            session.task = asyncio.create_task(self._run(session))
+
+        asyncio.run_coroutine_threadsafe(start(), self.loop).result()
+        return session_id
+
+    def has_session(self, session_id, include_closed=False):
+        return session_id in self.sessions or (include_closed and session_id in self._closed)
+
+    def feed(self, session_id, audio):
+        """Queues audio for a session from any thread. Returns False for unknown sessions."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        self.loop.call_soon_threadsafe(session.frames.put_nowait, bytes(audio))
+        return True
+
+    def close(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        self.loop.call_soon_threadsafe(session.frames.put_nowait, None)
+        return True
+
+    def events(self, session_id, keepalive=15):
+        """Yields (event, data) tuples for a session, and None as a keep-alive, until it closes."""
+        session = self.sessions.get(session_id) or self._closed.get(session_id)
+        if session is None:
+            return
+        while True:
+            try:
+                event = session.events.get(timeout=keepalive)
+            except queue.Empty:
+                yield None
+                continue
+            yield event
+            if event[0] == 'closed':
+                return
+
+    def stats(self):
+        states = [session.state for session in list(self.sessions.values())]
+        return {
+            'sessions': len(states),
+            'active': states.count('active'),
+            'waiting': states.count('waiting'),
+            'local_wake_word': self._spots(self.wake_word),
+            **self.counts,
+        }
+
+    def _spots(self, keyword):
+        return self.spotter is not None and self.spotter.has_templates(keyword)
+
+    async def _call(self, func, *args):
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def _run(self, session):
+        endpointer = Endpointer(
+            self.sample_rate, self.energy_threshold, self.pause_seconds, self.max_utterance_seconds
+        )
+        audio, recognition, utterance = None, None, bytearray()
+        max_stop_bytes = int(STOP_WORD_MAX_SECONDS * self.sample_rate) * 2
+        try:
+            # Fixed prompts are translated once per session and then served from the translation cache
+            prompts = await self._call(translate_many, [GREETING, RETRY_PROMPT, GOODBYE], session.output_lang)
+            session.emit('state', {'state': session.state})
+
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(session.frames.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if chunk is None:
+                    break
+
+                for kind, data in endpointer.feed(chunk):
+                    if kind == 'start':
+                        self.counts['utterances'] += 1
+                        utterance = bytearray(data)
+                        # Waiting-mode speech is checked for the wake word locally, without the recognizer
+                        if session.state == 'active' or not self._spots(self.wake_word):
+                            # Recognition starts while the user is still speaking
+                            self.counts['recognitions'] += 1
+                            audio = asyncio.Queue()
+                            recognition = asyncio.create_task(
+                                self.recognizer.transcribe(_drain(audio), self.sample_rate)
+                            )
+                            audio.put_nowait(data)
+                        continue
+
+                    if kind == 'audio':
+                        utterance.extend(data)
+                        if audio is not None:
+                            audio.put_nowait(data)
+                        continue
+
+                    if recognition is None:
+                        self.counts['local_checks'] += 1
+                        result = await self._call(self.spotter.classify, self.wake_word, bytes(utterance))
+                        if result == 'uncertain':
+                            self.counts['confirmations'] += 1
+                            transcription = await self.recognizer.transcribe(_chunks(bytes(utterance)), self.sample_rate)
+                            result = 'match' if transcription and self.wake_word in transcription.lower() else 'no'
+                        if result == 'match':
+                            await self._wake(session, prompts[0])
+                        continue
+
+                    audio.put_nowait(None)
+                    if (session.state == 'active' and len(utterance) <= max_stop_bytes
+                            and self._spots(self.stop_word)):
+                        self.counts['local_checks'] += 1
+                        if await self._call(self.spotter.classify, self.stop_word, bytes(utterance)) == 'match':
+                            self.counts['local_stops'] += 1
+                            recognition.cancel()
+                            audio, recognition = None, None
+                            await self._stop(session, prompts[2])
+                            continue
+
+                    transcription = await recognition
+                    audio, recognition = None, None
+                    await self._handle(session, transcription, *prompts)
+        except Exception as e:
+            print(f"Error in voice session {session.id}: {e}")
+            session.emit('error', {'message': str(e)})
+        finally:
+            if recognition is not None:
+                recognition.cancel()
+            self.sessions.pop(session.id, None)
+            self._closed[session.id] = session
+            while len(self._closed) > CLOSED_SESSIONS_KEPT:
+                self._closed.popitem(last=False)
+            session.emit('closed')
+
+    async def _handle(self, session, transcription, greeting, retry_prompt, goodbye):
+        if session.state == 'waiting':
+            # Waiting mode: only the wake word matters
+            if transcription and self.wake_word in transcription.lower():
+                await self._wake(session, greeting)
+            return
+
+        if not transcription:
+            await self._speak(session, retry_prompt)
+            return
+
+        if self.stop_word in transcription.lower():
+            await self._stop(session, goodbye)
+            return
+
+        session.emit('transcript', {'text': transcription})
+        response = await self._call(self.respond, transcription, session)
+        if response["status"] == "error":
+            error_message = response.get("message", "An error occurred")
+            session.emit('error', {'message': error_message})
+            await self._speak(session, f"I'm sorry, but {error_message} Let's try again.")
+            return
+
+        session.emit('answer', {
+            'userMessage': response["userMessage"],
+            'assistantResponse': response["assistantResponse"],
+        })
+        await self._speak(session, response["assistantResponse"])
+
+    async def _wake(self, session, greeting):
+        self.counts['wakes'] += 1
+        session.state = 'active'
+        session.emit('state', {'state': session.state})
+        await self._speak(session, greeting)
+
+    async def _stop(self, session, goodbye):
+        session.state = 'waiting'
+        session.emit('state', {'state': session.state})
+        await self._speak(session, goodbye)
+
+    async def _speak(self, session, text):
+        """Emits one audio event per sentence, in order, while later sentences are still being synthesized.
+
+        A final ``spoken`` event carries the URL of the whole reply.
+        """
+        sentences = split_sentences(text)
+        futures = [asyncio.wrap_future(synthesizer().submit(sentence)) for sentence in sentences]
+        clip_ids = []
+        try:
+            for future in futures:
+                clip_ids.append(await future)
+                session.emit('audio', {'url': audio_url(clip_ids[-1])})
+            speech_id = await self._call(synthesizer().save_speech, sentences, clip_ids)
+            session.emit('spoken', {'url': audio_url(speech_id)})
+        except Exception as e:
+            session.emit('error', {'message': f'Speech synthesis failed: {e}'})
+
+
+async def _chunks(audio):
+    yield audio
+
+
+async def _drain(audio):
+    while True:
+        chunk = await audio.get()
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,203 @@
+import os, re, uuid, threading
+from functools import lru_cache
+import numpy as np
+
+
+# OpenAI voices used to synthesize keyword templates when none have been recorded
+TEMPLATE_VOICES = ('alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer')
+TTS_PCM_SAMPLE_RATE = 24000
+
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+N_FFT = 512
+N_MELS = 26
+N_MFCC = 13
+
+KEYWORD_PATTERN = re.compile(r'^[a-z]+$')
+
+
+@lru_cache(maxsize=4)
+def _mel_filterbank(sample_rate):
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mel_points = np.linspace(hz_to_mel(0), hz_to_mel(sample_rate / 2), N_MELS + 2)
+    bins = np.floor((N_FFT + 1) * mel_to_hz(mel_points) / sample_rate).astype(int)
+    filterbank = np.zeros((N_MELS, N_FFT // 2 + 1), dtype=np.float32)
+    for m in range(1, N_MELS + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        filterbank[m - 1, left:center] = (np.arange(left, center) - left) / max(center - left, 1)
+        filterbank[m - 1, center:right] = (right - np.arange(center, right)) / max(right - center, 1)
+    return filterbank
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix():
+    n = np.arange(N_MELS)
+    k = np.arange(N_MFCC)[:, None]
+    return (np.cos(np.pi * k * (2 * n + 1) / (2 * N_MELS)) * np.sqrt(2 / N_MELS)).astype(np.float32)
+
+
+def pcm_to_samples(pcm):
+    return np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+
+
+def resample(samples, source_rate, target_rate):
+    if source_rate == target_rate:
+        return samples
+    duration = len(samples) / source_rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    return np.interp(target_times, np.arange(len(samples)) / source_rate, samples).astype(np.float32)
+
+
+def trim_silence(samples, sample_rate, relative_threshold=0.1):
+    """Cuts leading and trailing frames quieter than a fraction of the loudest frame."""
+    hop = int(sample_rate * HOP_SECONDS)
+    frames = len(samples) // hop
+    if frames == 0:
+        return samples
+    energy = np.sqrt(np.mean(samples[:frames * hop].reshape(frames, hop) ** 2, axis=1))
+    voiced = np.flatnonzero(energy >= energy.max() * relative_threshold)
+    if voiced.size == 0:
+        return samples
+    return samples[voiced[0] * hop:(voiced[-1] + 1) * hop]
+
+
+def mfcc(samples, sample_rate=16000):
+    """Mean-normalized, unit-length MFCC vectors (without c0), one per 10 ms hop."""
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    hop = int(sample_rate * HOP_SECONDS)
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+
+    emphasized = np.append(samples[0], samples[1:] - 0.97 * samples[:-1])
+    count = 1 + (len(emphasized) - frame_length) // hop
+    indices = np.arange(frame_length)[None, :] + hop * np.arange(count)[:, None]
+    frames = emphasized[indices] * np.hamming(frame_length)
+
+    power = np.abs(np.fft.rfft(frames, N_FFT)) ** 2 / N_FFT
+    log_mel = np.log(power @ _mel_filterbank(sample_rate).T + 1e-10)
+    cepstra = (log_mel @ _dct_matrix().T)[:, 1:]
+    cepstra -= cepstra.mean(axis=0)
+    norms = np.linalg.norm(cepstra, axis=1, keepdims=True)
+    return (cepstra / np.maximum(norms, 1e-8)).astype(np.float32)
+
+
+def subsequence_dtw(template, query):
+    """Average cost of the best alignment of the whole template to any part of the query.
+
+    Uses the (1,1), (1,2) and (2,1) step pattern, which bounds the speaking rate to
+    between half and twice the template's and lets every row be computed in one
+    vectorized step.
+    """
+    rows, columns = len(template), len(query)
+    if columns < rows // 2 + 1:
+        return np.inf
+    cost = 1.0 - template @ query.T
+    previous2 = None
+    previous = cost[0].copy()
+    for i in range(1, rows):
+        best = np.full(columns, np.inf, dtype=np.float32)
+        best[1:] = previous[:-1]
+        best[2:] = np.minimum(best[2:], previous[:-2])
+        if previous2 is not None:
+            best[1:] = np.minimum(best[1:], previous2[:-1])
+        previous2, previous = previous, cost[i] + best
+    return float(previous.min() / rows)
+
+
+class KeywordSpotter:
+    """Detects short keywords such as the wake word locally, by DTW template matching on MFCC features.
+
+    Templates are loaded from ``directory``; for keywords without any, ``template_source``
+    is asked for sample recordings (16 kHz float samples), e.g. synthesized speech.
+    Scores up to ``threshold`` are a match; scores up to ``confirm_threshold`` are
+    uncertain and worth confirming with full recognition. At most ``max_templates`` are
+    kept per keyword, the oldest being removed first, since every template adds to the
+    cost of each score.
+    """
+
+    def __init__(self, directory, threshold=0.3, confirm_threshold=0.45, sample_rate=16000, template_source=None,
+                 max_templates=20):
+        self.directory = directory
+        self.threshold = threshold
+        self.confirm_threshold = confirm_threshold
+        self.sample_rate = sample_rate
+        self.template_source = template_source
+        self.max_templates = max_templates
+        self.templates = {}
+        self._lock = threading.Lock()
+        self._prepared = set()
+
+    def has_templates(self, keyword):
+        return bool(self.templates.get(keyword))
+
+    def add_template(self, keyword, samples, save=True):
+        samples = trim_silence(samples, self.sample_rate)
+        if save:
+            directory = os.path.join(self.directory, keyword)
+            os.makedirs(directory, exist_ok=True)
+            np.save(os.path.join(directory, f'{uuid.uuid4().hex}.npy'), (samples * 32767).astype('<i2'))
+            for path in _stored_templates(directory)[:-self.max_templates]:
+                os.remove(path)
+        with self._lock:
+            templates = self.templates.setdefault(keyword, [])
+            templates.append(mfcc(samples, self.sample_rate))
+            del templates[:-self.max_templates]
+
+    def prepare(self, keywords):
+        """Loads the stored templates of each keyword, creating them from ``template_source`` if there are none."""
+        for keyword in keywords:
+            with self._lock:
+                if keyword in self._prepared:
+                    continue
+                self._prepared.add(keyword)
+
+            directory = os.path.join(self.directory, keyword)
+            stored = _stored_templates(directory)[-self.max_templates:]
+            for path in stored:
+                samples = np.load(path).astype(np.float32) / 32768.0
+                self.add_template(keyword, samples, save=False)
+
+            if not stored and self.template_source is not None:
+                try:
+                    for samples in self.template_source(keyword):
+                        self.add_template(keyword, samples)
+                except Exception as e:
+                    print(f"Error creating templates for '{keyword}': {e}")
+
+    def score(self, keyword, samples):
+        """Lowest alignment cost between the audio and any template of the keyword."""
+        with self._lock:
+            templates = list(self.templates.get(keyword, []))
+        if not templates:
+            return np.inf
+        features = mfcc(samples, self.sample_rate)
+        return min(subsequence_dtw(template, features) for template in templates)
+
+    def classify(self, keyword, pcm):
+        """Returns 'match', 'uncertain' or 'no' for a PCM16 utterance."""
+        score = self.score(keyword, pcm_to_samples(pcm))
+        if score <= self.threshold:
+            return 'match'
+        return 'uncertain' if score <= self.confirm_threshold else 'no'
+
+
+def _stored_templates(directory):
+    """Paths of the recorded templates in a keyword directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.npy')]
+    return [entry.path for entry in sorted(entries, key=lambda entry: (entry.stat().st_mtime_ns, entry.name))]
+
+
+def synthesized_templates(client, model='tts-1', voices=TEMPLATE_VOICES, sample_rate=16000):
+    """Template source that speaks the keyword in several voices with OpenAI text-to-speech."""
+    def source(keyword):
+        for voice in voices:
+            response = client.audio.speech.create(model=model, voice=voice, input=keyword, response_format='pcm')
+            yield resample(pcm_to_samples(response.content), TTS_PCM_SAMPLE_RATE, sample_rate)
+    return source
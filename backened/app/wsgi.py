@@ -0,0 +1,4 @@
+from __init__ import create_app
+
+# Entry point for gunicorn (see gunicorn.conf.py): background work starts in each worker after the fork
+app = create_app(background=False)
@@ -0,0 +1,167 @@
+"""Web crawl benchmark against a local fixture site.
+
+Serves a synthetic site from a local HTTP server that answers after a fixed delay and
+supports ETag and Last-Modified, then crawls it with the app's Crawler: once one page at
+a time, once concurrently over the pooled session, and once more after some pages
+changed, where unchanged pages come back as 304. Reports pages per second and the
+number of connections the server saw. Run from the repository root:
+
+    python backened/benchmarks/crawl.py --pages 200 --depth 3
+    python backened/benchmarks/crawl.py --latency-ms 100 --changed 0.2 --json results.json
+"""
+import os, sys, json, time, random, socket, argparse, threading
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+APP_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'app')
+sys.path.insert(0, os.path.abspath(APP_DIRECTORY))
+
+WORDS = (
+    'the', 'service', 'stores', 'documents', 'and', 'answers', 'questions', 'about', 'them', 'with', 'sources',
+    'across', 'several', 'languages', 'for', 'teams', 'that', 'need', 'fast', 'reliable', 'search', 'results'
+)
+
+
+class FixtureSite:
+    """A tree of ``pages`` HTML pages with ``fanout`` links each, plus navigation, external and PDF links."""
+
+    def __init__(self, pages, fanout, latency, seed):
+        self.pages = pages
+        self.fanout = fanout
+        self.latency = latency
+        self.versions = [0] * pages
+        self.modified = [time.time() - 86400] * pages
+        self.rng = random.Random(seed)
+        self.paragraphs = [' '.join(self.rng.choices(WORDS, k=120)) for _ in range(pages)]
+        self.counts = {'requests': 0, 'connections': 0}
+        self.lock = threading.Lock()
+
+    def change(self, fraction):
+        for page in self.rng.sample(range(self.pages), int(self.pages * fraction)):
+            self.versions[page] += 1
+            self.modified[page] = time.time()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def html(self, page):
+        children = range(page * self.fanout + 1, min(page * self.fanout + self.fanout, self.pages - 1) + 1)
+        links = ''.join(f'<li><a href="/page/{child}#top">Page {child}</a></li>' for child in children)
+        return (
+            f'<html><head><title>Page {page}</title><style>body {{ margin: 0 }}</style></head><body>'
+            f'<nav>Menu <a href="/page/0">Home</a> Search</nav>'
+            f'<h1>Page {page} version {self.versions[page]}</h1><p>{self.paragraphs[page]}</p>'
+            f'<p>Read more at https://example.com/page/{page} [1]</p><ul>{links}</ul>'
+            f'<a href="https://other.example.org/">Elsewhere</a> <a href="/files/{page}.pdf">PDF</a>'
+            f'<footer>Copyright 2024</footer><script>var tracking = true;</script></body></html>'
+        ).encode('utf-8')
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so a pooled client reuses its connections
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body are written separately; without this, delayed ACKs add 40 ms per response
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            site.count('connections')
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body=b'', headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            site.count('requests')
+            time.sleep(site.latency)
+            parts = self.path.strip('/').split('/')
+            if parts[0] == 'files':
+                return self.reply(200, b'%PDF-1.4\n', [('Content-Type', 'application/pdf')])
+            if len(parts) != 2 or parts[0] != 'page' or not parts[1].isdigit() or int(parts[1]) >= site.pages:
+                return self.reply(404)
+            page = int(parts[1])
+            etag = f'"{page}-{site.versions[page]}"'
+            last_modified = formatdate(site.modified[page], usegmt=True)
+            if self.headers.get('If-None-Match') == etag:
+                return self.reply(304, headers=[('ETag', etag)])
+            self.reply(200, site.html(page), [
+                ('Content-Type', 'text/html; charset=utf-8'), ('ETag', etag), ('Last-Modified', last_modified)
+            ])
+
+    return Handler
+
+
+def crawl(crawler, seed, depth, max_pages, known=None):
+    counts = {'fetched': 0, 'not_modified': 0, 'skipped': 0, 'failed': 0}
+    pages = {}
+    start = time.perf_counter()
+    for page in crawler.crawl(seed, depth, max_pages, known=(lambda url: known.get(url)) if known else None):
+        counts[page['status']] += 1
+        if page['status'] in ('fetched', 'not_modified'):
+            pages[page['url']] = {'etag': page['etag'], 'last_modified': page['last_modified'], 'links': page['links']}
+    seconds = time.perf_counter() - start
+    total = sum(counts.values())
+    return {**counts, 'pages': total, 'seconds': round(seconds, 3), 'pages_per_second': round(total / seconds, 1)}, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pages', type=int, default=200, help='pages on the fixture site')
+    parser.add_argument('--fanout', type=int, default=4, help='links from each page to new pages')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=50, help='server delay per request')
+    parser.add_argument('--changed', type=float, default=0.1, help='share of pages changed before the re-crawl')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    from config import CRAWL_CONCURRENCY
+    from modules.crawler import Crawler, http_session
+
+    site = FixtureSite(args.pages, args.fanout, args.latency_ms / 1000, args.seed)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    seed = f'http://127.0.0.1:{server.server_address[1]}/page/0'
+    results = {}
+
+    def run(name, concurrency, known=None):
+        before = dict(site.counts)
+        results[name], validators = crawl(
+            Crawler(http_session(), concurrency=concurrency), seed, args.depth, args.pages, known
+        )
+        results[name]['requests'] = site.counts['requests'] - before['requests']
+        results[name]['connections'] = site.counts['connections'] - before['connections']
+        return validators
+
+    try:
+        run('serial', 1)
+        validators = run('concurrent', CRAWL_CONCURRENCY)
+        site.change(args.changed)
+        run('re-crawl', CRAWL_CONCURRENCY, validators)
+    finally:
+        server.shutdown()
+
+    print(f"{args.pages} pages, {args.latency_ms:g} ms per request, concurrency {CRAWL_CONCURRENCY}")
+    print(f"{'run':<11} {'pages':>6} {'fetched':>8} {'304':>5} {'skipped':>8} {'seconds':>8} {'pages/s':>8} {'conns':>6}")
+    for name, result in results.items():
+        print(f"{name:<11} {result['pages']:>6} {result['fetched']:>8} {result['not_modified']:>5} "
+              f"{result['skipped']:>8} {result['seconds']:>8.3f} {result['pages_per_second']:>8.1f} {result['connections']:>6}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
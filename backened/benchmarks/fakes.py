@@ -0,0 +1,230 @@
+"""Local stand-ins for the OpenAI API and Google Speech-to-Text with deterministic latency.
+
+The OpenAI fake is an httpx transport, so the real ``openai`` and LangChain clients build
+and parse every request as they would against the API; only the network is replaced.
+Embeddings are hashed bags of words, so related texts stay close and retrieval, the
+answer cache and the rephrase gate behave much as they do with real vectors.
+"""
+import io, re, json, time, wave, zlib, asyncio, hashlib, threading
+import httpx
+import numpy as np
+from openai import OpenAI
+
+
+# Milliseconds: a fixed cost per call plus a cost per input item (texts, tokens or bytes)
+DEFAULT_LATENCY = {
+    'embeddings': (40, 0.5),         # per text
+    'chat': (300, 15),               # time to first token, then per token
+    'moderations': (60, 0),
+    'speech': (150, 0.5),            # per character
+    'transcription': (200, 0),       # after the end of the utterance
+    'whisper': (500, 25),            # per second of audio
+}
+
+ANSWER = (
+    "The documents describe the requested topic in detail. "
+    "They cover the main points and the supporting figures. "
+    "Further context is given in the later sections."
+)
+
+WORD_PATTERN = re.compile(r'\w+')
+FILLER_WORDS = (
+    'the', 'speaker', 'explains', 'how', 'the', 'system', 'handles', 'requests', 'and', 'why', 'latency',
+    'matters', 'for', 'users', 'across', 'regions', 'with', 'several', 'examples', 'from', 'production'
+)
+
+
+def hashed_embedding(text, dimensions=256):
+    """Unit vector of hashed word counts; texts that share words have a high cosine similarity."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        h = zlib.crc32(word.encode('utf-8'))
+        vector[h % dimensions] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+def synthetic_speech(text, sample_rate=24000):
+    """Deterministic speech-like audio for ``text``: one harmonic syllable per vowel group."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:4], 'little')
+    rng = np.random.default_rng(seed)
+    syllables = max(len(re.findall(r'[aeiouy]+', text.lower())), 1)
+    parts = []
+    for _ in range(syllables):
+        duration = rng.uniform(0.15, 0.3)
+        t = np.arange(int(duration * sample_rate)) / sample_rate
+        f0, f1 = rng.uniform(120, 300, size=2)
+        phase = 2 * np.pi * np.cumsum(f0 + (f1 - f0) * t / duration) / sample_rate
+        parts.append(sum(np.sin(k * phase) / k for k in range(1, 8)) * np.hanning(len(t)) * 0.3)
+    return np.concatenate(parts).astype(np.float32)
+
+
+class Latency:
+    """Sleeps for the configured cost of a call, scaled by ``scale`` (0 disables all delays)."""
+
+    def __init__(self, table=None, scale=1.0):
+        self.table = {**DEFAULT_LATENCY, **(table or {})}
+        self.scale = scale
+
+    def seconds(self, kind, items=0):
+        base, per_item = self.table[kind]
+        return (base + per_item * items) * self.scale / 1000
+
+    def sleep(self, kind, items=0):
+        delay = self.seconds(kind, items)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeOpenAITransport(httpx.BaseTransport):
+    """Answers the OpenAI endpoints the app uses: embeddings, chat completions, moderations, speech and Whisper."""
+
+    def __init__(self, latency, dimensions=256, answer=ANSWER):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.answer = answer
+        self.calls = {'embeddings': 0, 'chat': 0, 'moderations': 0, 'speech': 0, 'whisper': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def handle_request(self, request):
+        path = request.url.path
+        if path.endswith('/audio/transcriptions'):
+            return self._transcription(request.read())
+        body = json.loads(request.content or b'{}')
+        if path.endswith('/embeddings'):
+            return self._embeddings(body)
+        if path.endswith('/chat/completions'):
+            return self._chat(body)
+        if path.endswith('/moderations'):
+            return self._moderations(body)
+        if path.endswith('/audio/speech'):
+            return self._speech(body)
+        return httpx.Response(404, json={'error': {'message': f'Not faked: {path}'}})
+
+    def _embeddings(self, body):
+        texts = body['input'] if isinstance(body['input'], list) else [body['input']]
+        self._count('embeddings')
+        self.latency.sleep('embeddings', len(texts))
+        return httpx.Response(200, json={
+            'object': 'list',
+            'model': body.get('model', 'text-embedding-ada-002'),
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': hashed_embedding(str(text), self.dimensions).tolist()}
+                for i, text in enumerate(texts)
+            ],
+            'usage': {'prompt_tokens': 0, 'total_tokens': 0},
+        })
+
+    def _reply(self, messages):
+        system = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        user = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        if 'question-answering' in system:
+            return self.answer
+        # Translations (single or JSON batches) and question rewrites come back unchanged
+        return user
+
+    def _chat(self, body):
+        self._count('chat')
+        content = self._reply(body['messages'])
+        tokens = re.findall(r'\S+\s*', content)
+        created = int(time.time())
+        base = {'id': 'chatcmpl-benchmark', 'created': created, 'model': body.get('model', 'gpt-3.5-turbo')}
+
+        if not body.get('stream'):
+            self.latency.sleep('chat', len(tokens))
+            return httpx.Response(200, json={
+                **base, 'object': 'chat.completion',
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(tokens), 'total_tokens': len(tokens)},
+            })
+
+        def events():
+            self.latency.sleep('chat')
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(self.latency.table['chat'][1] * self.latency.scale / 1000)
+                delta = {'content': token, **({'role': 'assistant'} if i == 0 else {})}
+                chunk = {**base, 'object': 'chat.completion.chunk',
+                         'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+                yield f'data: {json.dumps(chunk)}\n\n'.encode('utf-8')
+            chunk = {**base, 'object': 'chat.completion.chunk',
+                     'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+            yield f'data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n'.encode('utf-8')
+
+        return httpx.Response(200, headers={'content-type': 'text/event-stream'}, content=events())
+
+    def _moderations(self, body):
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        self._count('moderations')
+        self.latency.sleep('moderations')
+        return httpx.Response(200, json={
+            'id': 'modr-benchmark',
+            'model': body.get('model', 'omni-moderation-latest'),
+            'results': [{'flagged': False, 'categories': {}, 'category_scores': {}} for _ in inputs],
+        })
+
+    def _speech(self, body):
+        text = body['input']
+        self._count('speech')
+        self.latency.sleep('speech', len(text))
+        if body.get('response_format') == 'pcm':
+            # Raw 24 kHz PCM16, as OpenAI returns it; used for the wake word templates
+            return httpx.Response(200, content=(synthetic_speech(text) * 32767).astype('<i2').tobytes())
+        # Not a playable MP3, but sized like one (about 6 kB per second of speech at 48 kbit/s)
+        size = 6000 * max(len(text) // 15, 1)
+        return httpx.Response(200, content=hashlib.sha256(text.encode('utf-8')).digest() * (size // 32))
+
+
+    def _transcription(self, content):
+        # The multipart body carries one 16-bit WAV file; answer with a segment per 5 seconds of it
+        with wave.open(io.BytesIO(content[content.index(b'RIFF'):])) as f:
+            duration = f.getnframes() / f.getframerate()
+        self._count('whisper')
+        self.latency.sleep('whisper', duration)
+        rng = np.random.default_rng(zlib.crc32(content[-4096:]))
+        segments = []
+        for i, start in enumerate(np.arange(0, duration, 5.0)):
+            words = [rng.choice(FILLER_WORDS) for _ in range(12)]
+            segments.append({'id': i, 'seek': 0, 'start': float(start), 'end': float(min(start + 5, duration)),
+                             'text': ' ' + ' '.join(words) + '.', 'tokens': [], 'temperature': 0.0,
+                             'avg_logprob': -0.2, 'compression_ratio': 1.2, 'no_speech_prob': 0.01})
+        return httpx.Response(200, json={
+            'task': 'transcribe', 'language': 'english', 'duration': duration,
+            'text': ''.join(segment['text'] for segment in segments), 'segments': segments,
+        })
+
+
+def fake_openai_client(transport):
+    return OpenAI(api_key='benchmark', http_client=httpx.Client(transport=transport), max_retries=0)
+
+
+class FakeRecognizer:
+    """Stands in for GoogleStreamingRecognizer: consumes the audio and returns a fixed transcript.
+
+    Utterances shorter than ``keyword_seconds`` are taken to be the wake word, longer ones
+    to be ``question``.
+    """
+
+    def __init__(self, latency, question='what do the documents say about the topic',
+                 wake_word='assistant', keyword_seconds=1.5):
+        self.latency = latency
+        self.question = question
+        self.wake_word = wake_word
+        self.keyword_seconds = keyword_seconds
+        self.calls = 0
+
+    async def transcribe(self, chunks, sample_rate=16000):
+        self.calls += 1
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+        await asyncio.sleep(self.latency.seconds('transcription'))
+        return self.wake_word if size / 2 / sample_rate < self.keyword_seconds else self.question
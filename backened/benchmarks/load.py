@@ -0,0 +1,393 @@
+"""Load test of the Flask app against local stand-ins for OpenAI and Google Speech-to-Text.
+
+Runs the real application (vector store, caches, job queue, voice engine) in a temporary
+directory, with every external call answered by ``fakes`` after a fixed, configurable
+delay, so results are comparable between runs and need no network or API keys.
+Run from the repository root:
+
+    python backened/benchmarks/load.py --concurrency 8 --requests 200
+    python backened/benchmarks/load.py --scenarios ask --latency-scale 0 --json before.json
+
+Scenarios:
+  documents   upload PDFs to /document/upload-pdf and wait for their ingestion jobs
+  ask         POST /chatbot/ask, with the Server-Timing stages as the breakdown
+  ask-stream  POST /chatbot/ask-stream with speech; time to first token and to the end
+  voice       full voice sessions: wake word, one question, spoken answer, close
+"""
+import io, os, sys, json, time, queue, shutil, random, argparse, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+APP_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'app')
+sys.path.insert(0, os.path.abspath(APP_DIRECTORY))
+sys.path.insert(0, BENCHMARK_DIRECTORY)
+
+from fakes import Latency, FakeOpenAITransport, FakeRecognizer, fake_openai_client, synthetic_speech
+
+
+SCENARIOS = ('documents', 'ask', 'ask-stream', 'voice')
+
+TOPICS = (
+    'revenue', 'pricing', 'security', 'deployment', 'latency', 'storage', 'compliance', 'onboarding',
+    'billing', 'support', 'roadmap', 'training', 'hardware', 'licensing', 'backups', 'networking'
+)
+FILLER = (
+    'the', 'report', 'describes', 'how', 'team', 'handles', 'quarterly', 'results', 'and', 'plans',
+    'for', 'customers', 'with', 'detailed', 'figures', 'across', 'regions', 'over', 'several', 'years'
+)
+
+
+def make_pdf(pages, rng):
+    """A minimal text PDF, one topic per page, that PyPDFLoader can parse."""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for _ in range(pages):
+        topic = rng.choice(TOPICS)
+        lines = [' '.join([topic] + rng.choices(FILLER, k=12)) for _ in range(40)]
+        text = ' T* '.join(f'({line}) Tj' for line in lines)
+        stream = f'BT /F1 10 Tf 14 TL 40 760 Td {text} ET'.encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 3 0 R >> >> >>' % (len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % kid for kid in kids), pages)
+
+    out, offsets = bytearray(b'%PDF-1.4\n'), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_questions(count, repeat_ratio, rng):
+    """Questions about the document topics; a share of them repeat earlier ones, as users do."""
+    questions = []
+    for _ in range(count):
+        if questions and rng.random() < repeat_ratio:
+            questions.append(rng.choice(questions))
+        else:
+            topic, detail = rng.choice(TOPICS), rng.choice(FILLER[5:])
+            questions.append(f'What does the report say about {topic} {detail} number {rng.randrange(1000)}?')
+    return questions
+
+
+def pcm(samples, source_rate, sample_rate):
+    from modules.wake_word import resample
+    return (resample(samples, source_rate, sample_rate) * 32767).astype('<i2').tobytes()
+
+
+def silence(seconds, sample_rate):
+    return bytes(int(seconds * sample_rate) * 2)
+
+
+class Recorder:
+    """Collects per-request latencies, errors and stage timings for one scenario."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.stages = {}
+        self.errors = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency, stages=None, ok=True):
+        with self._lock:
+            if not ok:
+                self.errors += 1
+                return
+            self.latencies.append(latency)
+            for stage, duration in (stages or {}).items():
+                self.stages.setdefault(stage, []).append(duration)
+
+    def summary(self):
+        def percentiles(values):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values else (0.0, 0.0, 0.0)
+            return {'p50': round(float(p50), 1), 'p95': round(float(p95), 1), 'p99': round(float(p99), 1)}
+
+        return {
+            'requests': len(self.latencies) + self.errors,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 3),
+            'throughput': round(len(self.latencies) / self.seconds, 2) if self.seconds else 0.0,
+            'latency_ms': percentiles(self.latencies),
+            'stages_ms': {stage: percentiles(values) for stage, values in sorted(self.stages.items())},
+        }
+
+
+def run_concurrently(recorder, func, items, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(func, item) for item in items]:
+            try:
+                future.result()
+            except Exception as e:
+                print(f'{recorder.name}: {e}')
+                recorder.record(None, ok=False)
+    recorder.seconds = time.perf_counter() - start
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in filter(None, (part.strip() for part in (header or '').split(','))):
+        name, _, duration = part.partition(';dur=')
+        if duration:
+            stages[name] = float(duration)
+    return stages
+
+
+def read_sse(response):
+    """Yields (event, data) pairs from a streamed test-client response as they arrive."""
+    buffer = ''
+    for chunk in response.response:
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        while '\n\n' in buffer:
+            block, buffer = buffer.split('\n\n', 1)
+            event, data = 'message', None
+            for line in block.split('\n'):
+                if line.startswith('event: '):
+                    event = line[7:]
+                elif line.startswith('data: '):
+                    data = json.loads(line[6:])
+            if data is not None:
+                yield event, data
+
+
+def bench_documents(app, args, rng):
+    recorder = Recorder('documents')
+    files = [(f'report-{i}.pdf', make_pdf(args.pages, rng)) for i in range(args.documents)]
+
+    def upload(file):
+        client = app.test_client()
+        name, data = file
+        start = time.perf_counter()
+        response = client.post('/document/upload-pdf', data={'pdf': (io.BytesIO(data), name)},
+                               content_type='multipart/form-data')
+        if response.status_code != 202:
+            raise RuntimeError(f'{name}: {response.status_code} {response.get_json()}')
+        job_id = response.get_json()['job_id']
+        while True:
+            job = client.get(f'/document/jobs/{job_id}').get_json()
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.01)
+        stages = {stage: seconds * 1000 for stage, seconds in job['timings'].items()}
+        stages['queued'] = (job['queued_seconds'] or 0) * 1000
+        recorder.record((time.perf_counter() - start) * 1000, stages, ok=job['status'] == 'done')
+
+    run_concurrently(recorder, upload, files, args.concurrency)
+    return recorder
+
+
+def bench_ask(app, args, rng):
+    recorder = Recorder('ask')
+    local = threading.local()
+
+    def ask(question):
+        if not hasattr(local, 'client'):
+            # One conversation per worker, so the history and the rephrase gate are exercised
+            local.client, local.session = app.test_client(), f'bench-{threading.get_ident()}'
+        start = time.perf_counter()
+        response = local.client.post('/chatbot/ask', json={'question': question},
+                                     headers={'X-Session-Id': local.session})
+        latency = (time.perf_counter() - start) * 1000
+        recorder.record(latency, parse_server_timing(response.headers.get('Server-Timing')),
+                        ok=response.status_code == 200)
+
+    run_concurrently(recorder, ask, make_questions(args.requests, args.repeat_ratio, rng), args.concurrency)
+    return recorder
+
+
+def bench_ask_stream(app, args, rng):
+    recorder = Recorder('ask-stream')
+
+    def ask(question):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/chatbot/ask-stream', json={'question': question, 'speak': True},
+                               headers={'X-Session-Id': f'bench-stream-{threading.get_ident()}'}, buffered=False)
+        stages, done = {}, False
+        try:
+            for event, data in read_sse(response) if response.status_code == 200 else ():
+                elapsed = (time.perf_counter() - start) * 1000
+                # Cached answers arrive in the final event, without sources or tokens
+                if event in ('sources', 'token', 'audio'):
+                    stages.setdefault(f'first_{event}', elapsed)
+                done = done or event == 'done'
+        finally:
+            response.close()
+        recorder.record((time.perf_counter() - start) * 1000, stages, ok=done)
+
+    run_concurrently(recorder, ask, make_questions(args.requests, args.repeat_ratio, rng), args.concurrency)
+    return recorder
+
+
+def bench_voice(app, args, rng):
+    from config import VOICE_SAMPLE_RATE
+    from modules.audio_processing import keyword_spotter, voice_engine, WAKE_WORD, STOP_WORD
+
+    recorder = Recorder('voice')
+    rate = VOICE_SAMPLE_RATE
+    # Templates are created once per deployment; do it up front so it is not timed
+    keyword_spotter().prepare([WAKE_WORD, STOP_WORD])
+    wake = silence(0.5, rate) + pcm(synthetic_speech(WAKE_WORD), 24000, rate) + silence(1.2, rate)
+    question_audio = pcm(synthetic_speech(voice_engine().recognizer.question), 24000, rate) + silence(1.2, rate)
+    chunk_bytes = int(rate * 0.25) * 2
+
+    def push(client, session_id, audio):
+        for offset in range(0, len(audio), chunk_bytes):
+            client.post(f'/speech/voice/{session_id}/audio', data=audio[offset:offset + chunk_bytes],
+                        content_type='application/octet-stream')
+            if args.realtime:
+                time.sleep(0.25)
+
+    def converse(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        session_id = client.post('/speech/voice', json={}).get_json()['voiceSessionId']
+        stages = {'create': (time.perf_counter() - start) * 1000}
+        events = queue.Queue()
+
+        def read():
+            response = client.get(f'/speech/voice/{session_id}/events', buffered=False)
+            try:
+                for event in read_sse(response):
+                    events.put(event)
+            finally:
+                response.close()
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+
+        def wait_for(predicate, timeout=30):
+            deadline = time.perf_counter() + timeout
+            while True:
+                event, data = events.get(timeout=max(deadline - time.perf_counter(), 0.001))
+                if event == 'error':
+                    raise RuntimeError(data.get('message'))
+                if predicate(event, data):
+                    return (time.perf_counter() - pushed) * 1000
+
+        pushed = time.perf_counter()
+        wait_for(lambda event, data: event == 'state' and data['state'] == 'waiting')
+        push(client, session_id, wake)
+        pushed = time.perf_counter()
+        stages['wake'] = wait_for(lambda event, data: event == 'state' and data['state'] == 'active')
+        wait_for(lambda event, data: event == 'spoken')
+
+        push(client, session_id, question_audio)
+        pushed = time.perf_counter()
+        stages['answer'] = wait_for(lambda event, data: event == 'answer')
+        stages['first_audio'] = wait_for(lambda event, data: event == 'audio')
+        stages['spoken'] = wait_for(lambda event, data: event == 'spoken')
+
+        client.delete(f'/speech/voice/{session_id}')
+        wait_for(lambda event, data: event == 'closed')
+        reader.join(timeout=5)
+        recorder.record((time.perf_counter() - start) * 1000, stages)
+
+    run_concurrently(recorder, converse, range(args.sessions), args.concurrency)
+    return recorder
+
+
+BENCHMARKS = {'documents': bench_documents, 'ask': bench_ask, 'ask-stream': bench_ask_stream, 'voice': bench_voice}
+
+
+def install_fakes(latency, dimensions):
+    """Points every external client of the app at the local fakes."""
+    from langchain_openai import OpenAIEmbeddings
+    from modules import document_processing, chatbot, moderation, translation, tts, audio_processing
+    from modules.wake_word import synthesized_templates
+    import httpx
+
+    transport = FakeOpenAITransport(latency, dimensions=dimensions)
+    client = fake_openai_client(transport)
+    # Token-level length checks would need the tiktoken vocabulary, which is downloaded on first use
+    document_processing.embedding_function().embeddings = OpenAIEmbeddings(
+        api_key='benchmark', http_client=httpx.Client(transport=transport), check_embedding_ctx_length=False,
+        max_retries=0
+    )
+    chatbot.llm().root_client = client
+    chatbot.llm().client = client.chat.completions
+    moderation.client.set(client)
+    translation.client.set(client)
+    tts.synthesizer().client = client
+    audio_processing.keyword_spotter().template_source = synthesized_templates(
+        client, sample_rate=audio_processing.keyword_spotter().sample_rate
+    )
+    audio_processing.voice_engine.set(
+        audio_processing.create_voice_engine(FakeRecognizer(latency, wake_word=audio_processing.WAKE_WORD))
+    )
+    return transport
+
+
+def print_report(results, calls):
+    for name, summary in results.items():
+        latency = summary['latency_ms']
+        print(f"\n{name}: {summary['requests']} requests, {summary['errors']} errors, "
+              f"{summary['throughput']}/s over {summary['seconds']} s")
+        print(f"  {'total':<20} p50 {latency['p50']:>9.1f}  p95 {latency['p95']:>9.1f}  p99 {latency['p99']:>9.1f} ms")
+        for stage, values in summary['stages_ms'].items():
+            print(f"  {stage:<20} p50 {values['p50']:>9.1f}  p95 {values['p95']:>9.1f}  p99 {values['p99']:>9.1f} ms")
+    print(f"\nbackend calls: {calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='questions per ask scenario')
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=5, help='pages per uploaded PDF')
+    parser.add_argument('--sessions', type=int, default=16, help='voice sessions')
+    parser.add_argument('--repeat-ratio', type=float, default=0.3, help='share of repeated questions')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for all fake latencies')
+    parser.add_argument('--dimensions', type=int, default=256, help='embedding size')
+    parser.add_argument('--realtime', action='store_true', help='push voice audio at its real pace')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    # The app keeps its stores under relative paths; its clients are built, then faked, before the app starts
+    workspace = tempfile.mkdtemp(prefix='ai-info-query-bench-')
+    json_path = os.path.abspath(args.json) if args.json else None
+    os.chdir(workspace)
+    os.environ['OPENAI_API_KEY'] = 'benchmark'
+    os.environ['ANONYMIZED_TELEMETRY'] = 'False'
+
+    try:
+        from __init__ import create_app
+        transport = install_fakes(Latency(scale=args.latency_scale), args.dimensions)
+        app = create_app()
+        rng = random.Random(args.seed)
+
+        scenarios = list(args.scenarios)
+        if 'documents' not in scenarios and set(scenarios) & {'ask', 'ask-stream', 'voice'}:
+            # Questions need something to retrieve; index a corpus first without timing it
+            quick = argparse.Namespace(**{**vars(args), 'documents': max(args.documents // 4, 2)})
+            bench_documents(app, quick, rng)
+
+        results = {}
+        for name in scenarios:
+            results[name] = BENCHMARKS[name](app, args, rng).summary()
+
+        print_report(results, transport.calls)
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump({'arguments': vars(args), 'results': results, 'calls': transport.calls}, f, indent=2)
+    finally:
+        os.chdir(BENCHMARK_DIRECTORY)
+        shutil.rmtree(workspace, ignore_errors=True)
+    # Daemon threads of the job queue and voice engine stay blocked on their queues
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
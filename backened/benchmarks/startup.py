@@ -0,0 +1,115 @@
+"""Startup cost of the app: import time, memory and the slowest imports.
+
+Starts a fresh interpreter that imports the app with ``python -X importtime`` and builds
+it, optionally warms up services, then reports boot time, peak RSS, the number of loaded
+modules and the imports that took longest. No request is served and no API is called.
+Run from the repository root:
+
+    python backened/benchmarks/startup.py
+    python backened/benchmarks/startup.py --warm-up all --top 30
+"""
+import os, re, sys, json, argparse, tempfile, subprocess
+
+APP_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+CHILD = '''
+import sys, json, time, resource
+start = time.perf_counter()
+from __init__ import create_app
+app = create_app(background=False)
+boot_seconds = time.perf_counter() - start
+
+from modules.services import preload_modules, warm_up
+preload = preload_modules() if sys.argv[2] == 'yes' else {}
+warm_up_seconds = warm_up(sys.argv[1])
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'boot_seconds': round(boot_seconds, 4),
+    'peak_rss_mb': round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    'modules': len(sys.modules),
+    'preload_seconds': preload,
+    'warm_up_seconds': warm_up_seconds,
+}))
+'''
+
+
+def parse_import_times(stderr):
+    """Returns (module, self_ms, cumulative_ms, depth) for each ``-X importtime`` line."""
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            imports.append((module, int(own) / 1000, int(cumulative) / 1000, len(indent) // 2))
+    return imports
+
+
+def package_totals(imports):
+    """Sums the import time of each top-level package (its own modules, not what they import from elsewhere)."""
+    totals = {}
+    for module, own, _, _ in imports:
+        package = module.split('.')[0]
+        totals[package] = totals.get(package, 0.0) + own
+    return totals
+
+
+def profile(warm_up='none', preload=False):
+    env = {**os.environ, 'PYTHONPATH': APP_DIRECTORY}
+    env.setdefault('OPENAI_API_KEY', 'benchmark')
+    env['ANONYMIZED_TELEMETRY'] = 'False'
+    # The app keeps its stores under relative paths
+    with tempfile.TemporaryDirectory(prefix='ai-info-query-startup-') as workspace:
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD, warm_up, 'yes' if preload else 'no'],
+            cwd=workspace, env=env, capture_output=True, text=True
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f'App failed to start:\n{completed.stderr[-4000:]}')
+    summary = json.loads(completed.stdout.strip().splitlines()[-1])
+    return summary, parse_import_times(completed.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--warm-up', default='none', help='services to build after startup: all, none or a list')
+    parser.add_argument('--preload', action='store_true', help='also import the libraries services load lazily')
+    parser.add_argument('--top', type=int, default=20, help='number of slowest imports and packages to list')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    summary, imports = profile(args.warm_up, args.preload)
+    app_modules = sorted(
+        ((module, cumulative) for module, _, cumulative, _ in imports if module.startswith('modules.')),
+        key=lambda item: item[1], reverse=True
+    )
+    packages = sorted(package_totals(imports).items(), key=lambda item: item[1], reverse=True)
+
+    print(f"boot {summary['boot_seconds']:.3f} s, peak RSS {summary['peak_rss_mb']} MB, "
+          f"{summary['modules']} modules loaded")
+    print("\napp modules (cumulative import time):")
+    for module, cumulative in app_modules[:args.top]:
+        print(f"  {module:<40} {cumulative:>9.1f} ms")
+    print("\npackages (own import time):")
+    for package, own in packages[:args.top]:
+        print(f"  {package:<40} {own:>9.1f} ms")
+    for title, key in (('preloaded modules', 'preload_seconds'), ('warmed-up services', 'warm_up_seconds')):
+        if summary[key]:
+            print(f"\n{title}:")
+            for name, seconds in summary[key].items():
+                print(f"  {name:<40} {seconds * 1000:>9.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                **summary,
+                'app_modules_ms': dict(app_modules),
+                'packages_ms': {package: round(own, 1) for package, own in packages},
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
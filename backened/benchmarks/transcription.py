@@ -0,0 +1,139 @@
+"""Video transcription benchmark: serial fixed-length segments against parallel silence cuts.
+
+Transcribes a synthetic talk (bursts of speech-like noise separated by pauses) with the
+app's Transcriber against the local Whisper fake, which answers after a fixed delay per
+second of audio. The download is skipped; everything after it runs as in the app.
+Run from the repository root:
+
+    python backened/benchmarks/transcription.py --minutes 60
+    python backened/benchmarks/transcription.py --minutes 60 --latency-scale 0.1 --json results.json
+
+Runs:
+  serial    one request at a time on fixed 13-minute segments, like the previous loader
+  parallel  silence cuts, TRANSCRIPTION_CONCURRENCY requests at a time
+  cached    the same video again, served from the transcript cache
+"""
+import os, sys, json, time, shutil, argparse, tempfile
+import numpy as np
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+APP_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'app')
+sys.path.insert(0, os.path.abspath(APP_DIRECTORY))
+sys.path.insert(0, BENCHMARK_DIRECTORY)
+
+from fakes import Latency, FakeOpenAITransport, fake_openai_client
+
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_talk(minutes, rng):
+    """Speech-like bursts of 2-12 s separated by pauses of 0.2-1.5 s. Returns the samples and the bursts."""
+    samples = np.zeros(int(minutes * 60 * SAMPLE_RATE), dtype='<i2')
+    utterances = []
+    position = int(rng.uniform(0.2, 1.0) * SAMPLE_RATE)
+    while position < len(samples):
+        length = min(int(rng.uniform(2, 12) * SAMPLE_RATE), len(samples) - position)
+        # Noise shaped into syllables, loud enough to be told apart from the background
+        envelope = np.abs(np.sin(np.arange(length) * np.pi * 4 / SAMPLE_RATE)) * rng.uniform(2000, 6000)
+        samples[position:position + length] = (rng.standard_normal(length) * envelope).clip(-32000, 32000)
+        utterances.append((position, position + length))
+        position += length + int(rng.uniform(0.2, 1.5) * SAMPLE_RATE)
+    samples += (rng.standard_normal(len(samples)) * 30).astype('<i2')
+    return samples, utterances
+
+
+def cuts_inside_speech(spans, utterances):
+    """Counts the cuts between segments that fall inside an utterance."""
+    starts = np.array([start for start, _ in utterances])
+    ends = np.array([end for _, end in utterances])
+    count = 0
+    for _, cut in spans[:-1]:
+        i = np.searchsorted(starts, cut, side='right') - 1
+        count += int(i >= 0 and cut < ends[i])
+    return count
+
+
+def run(transcription, transcriber, url, on_progress=None):
+    start = time.perf_counter()
+    video, segments, stats = transcriber.transcribe(url, on_progress)
+    return {
+        'seconds': round(time.perf_counter() - start, 3),
+        'segments': stats.get('segments', 0),
+        'transcript_segments': len(segments),
+        'chunks': sum(1 for _ in transcription.transcript_documents(segments, url, video)),
+        'cached': stats['cached'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--minutes', type=float, default=60, help='length of the synthetic talk')
+    parser.add_argument('--latency-scale', type=float, default=0.1, help='scales the Whisper fake delay (0 disables it)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix='ai-info-query-transcription-')
+    json_path = os.path.abspath(args.json) if args.json else None
+    os.chdir(workspace)
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+    try:
+        from config import TRANSCRIPTION_CONCURRENCY, TRANSCRIPTION_SEGMENT_SECONDS, TRANSCRIPTION_MIN_SEGMENT_SECONDS
+        from modules import transcription
+
+        rng = np.random.default_rng(args.seed)
+        samples, utterances = synthetic_talk(args.minutes, rng)
+        transport = FakeOpenAITransport(Latency(scale=args.latency_scale))
+        transcription.client.set(fake_openai_client(transport))
+        transcription.download_audio = lambda url, directory: 'talk.wav'
+        transcription.decode_audio = lambda path, sample_rate=SAMPLE_RATE: samples
+
+        store = transcription.TranscriptStore(os.path.join(workspace, 'transcripts.sqlite3'))
+        serial = transcription.Transcriber(
+            store, concurrency=1,
+            segment_seconds=transcription.MAX_SEGMENT_SECONDS, min_segment_seconds=transcription.MAX_SEGMENT_SECONDS
+        )
+        parallel = transcription.Transcriber(
+            store, concurrency=TRANSCRIPTION_CONCURRENCY,
+            segment_seconds=TRANSCRIPTION_SEGMENT_SECONDS, min_segment_seconds=TRANSCRIPTION_MIN_SEGMENT_SECONDS
+        )
+
+        results = {}
+        split_start = time.perf_counter()
+        spans = {
+            'serial': transcription.split_at_silences(
+                samples, SAMPLE_RATE, transcription.MAX_SEGMENT_SECONDS, transcription.MAX_SEGMENT_SECONDS
+            ),
+            'parallel': transcription.split_at_silences(
+                samples, SAMPLE_RATE, TRANSCRIPTION_SEGMENT_SECONDS, TRANSCRIPTION_MIN_SEGMENT_SECONDS
+            ),
+        }
+        split_seconds = (time.perf_counter() - split_start) / 2
+        results['serial'] = run(transcription, serial, 'https://www.youtube.com/watch?v=serialtalk1')
+        results['parallel'] = run(transcription, parallel, 'https://www.youtube.com/watch?v=paralleltk1')
+        calls = transport.calls['whisper']
+        results['cached'] = run(transcription, parallel, 'https://youtu.be/paralleltk1')
+        for name in ('serial', 'parallel'):
+            results[name]['cuts_inside_speech'] = cuts_inside_speech(spans[name], utterances)
+
+        print(f"{args.minutes:g} minutes of audio, {len(utterances)} utterances, "
+              f"silence detection {split_seconds * 1000:.0f} ms per pass")
+        print(f"{'run':<10} {'seconds':>9} {'segments':>9} {'cut in speech':>14} {'chunks':>7}  speed-up")
+        for name, result in results.items():
+            speed_up = results['serial']['seconds'] / max(result['seconds'], 1e-6)
+            print(f"{name:<10} {result['seconds']:>9.3f} {result['segments']:>9} "
+                  f"{result.get('cuts_inside_speech', '-'):>14} {result['chunks']:>7}  {speed_up:>7.1f}x")
+        print(f"Whisper calls: {transport.calls['whisper']} ({transport.calls['whisper'] - calls} for the cached run)")
+
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump({'minutes': args.minutes, 'latency_scale': args.latency_scale, 'runs': results}, f, indent=2)
+    finally:
+        os.chdir(BENCHMARK_DIRECTORY)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Vector index benchmark: Chroma against the quantized, memory-mapped index.
+
+Fills a Chroma collection with clustered synthetic embeddings, builds int8 and float16
+indexes from it the way the app does, then queries every backend in a fresh process
+with vectors near stored ones, with and without a source filter. Reports the memory each
+backend adds (process memory, and pages of memory-mapped files, which the page cache
+shares between workers), query latency, and recall@k against an exact float32 search.
+Run from the repository root:
+
+    python backened/benchmarks/vector_index.py --vectors 20000 --dimensions 1536
+    python backened/benchmarks/vector_index.py --vectors 50000 --queries 500 --json results.json
+
+Backends:
+  chroma       Chroma's HNSW index, as used by the app by default
+  int8         VECTOR_INDEX_DTYPE=int8 with exact rescoring
+  int8-direct  the int8 scan alone, without rescoring (rescore factor 1)
+  float16      VECTOR_INDEX_DTYPE=float16 with exact rescoring
+"""
+import os, sys, json, time, shutil, argparse, importlib, tempfile, subprocess
+import numpy as np
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+APP_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'app')
+sys.path.insert(0, os.path.abspath(APP_DIRECTORY))
+
+BACKENDS = ('chroma', 'int8', 'int8-direct', 'float16')
+ADD_BATCH_SIZE = 5000
+
+
+def resident_bytes():
+    """Resident anonymous memory and resident pages of mapped files, from /proc on Linux."""
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            fields = dict(line.split(':', 1) for line in f if line.startswith(('RssAnon', 'RssFile', 'RssShmem')))
+        kilobytes = {name: int(value.split()[0]) for name, value in fields.items()}
+        return kilobytes['RssAnon'] * 1024, (kilobytes['RssFile'] + kilobytes['RssShmem']) * 1024
+    except (OSError, KeyError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 0
+
+
+def clustered_vectors(count, dimensions, clusters, rng):
+    """Unit vectors scattered around ``clusters`` centres, like embeddings of documents on a few topics."""
+    centres = rng.standard_normal((clusters, dimensions), dtype=np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + rng.standard_normal((count, dimensions), dtype=np.float32) * 0.8
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_neighbours(vectors, queries, k, mask=None):
+    distances = (vectors ** 2).sum(axis=1)[None, :] - 2 * queries @ vectors.T
+    if mask is not None:
+        distances[:, ~mask] = np.inf
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def chroma_client(workspace):
+    import chromadb
+    from chromadb.config import Settings
+    return chromadb.PersistentClient(path=os.path.join(workspace, 'chroma'), settings=Settings(anonymized_telemetry=False))
+
+
+def prepare(workspace, args):
+    rng = np.random.default_rng(args.seed)
+    vectors = clustered_vectors(args.vectors, args.dimensions, args.clusters, rng)
+    sources = rng.integers(0, args.sources, args.vectors)
+    picked = rng.choice(args.vectors, args.queries)
+    queries = vectors[picked] + rng.standard_normal((args.queries, args.dimensions), dtype=np.float32) * 0.02
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    filtered = [f'source-{source}' for source in rng.choice(args.sources, args.filter_sources, replace=False)]
+    mask = np.isin(sources, [int(source.split('-')[1]) for source in filtered])
+
+    timings = {}
+    start = time.perf_counter()
+    client = chroma_client(workspace)
+    collection = client.create_collection('langchain')
+    for offset in range(0, args.vectors, ADD_BATCH_SIZE):
+        end = min(offset + ADD_BATCH_SIZE, args.vectors)
+        collection.add(
+            ids=[str(i) for i in range(offset, end)],
+            embeddings=vectors[offset:end].tolist(),
+            metadatas=[{'source': f'source-{source}'} for source in sources[offset:end]],
+            documents=[''] * (end - offset)
+        )
+    timings['chroma'] = time.perf_counter() - start
+
+    from modules.vector_index import QuantizedIndex
+    for dtype in ('int8', 'float16'):
+        start = time.perf_counter()
+        QuantizedIndex.build(collection, os.path.join(workspace, dtype), dtype)
+        timings[dtype] = time.perf_counter() - start
+
+    np.save(os.path.join(workspace, 'queries.npy'), queries)
+    np.save(os.path.join(workspace, 'truth.npy'), exact_neighbours(vectors, queries, args.k))
+    np.save(os.path.join(workspace, 'truth-filtered.npy'), exact_neighbours(vectors, queries, args.k, mask))
+    with open(os.path.join(workspace, 'filter.json'), 'w', encoding='utf-8') as f:
+        json.dump(filtered, f)
+    return timings
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measure(workspace, backend, k):
+    """Runs in its own process, so the resident memory is that of one backend alone."""
+    # Libraries are imported before the baseline, so only the index itself is measured
+    importlib.import_module('chromadb')
+    from modules.vector_index import QuantizedIndex
+
+    queries = np.load(os.path.join(workspace, 'queries.npy'))
+    with open(os.path.join(workspace, 'filter.json'), 'r', encoding='utf-8') as f:
+        filtered = json.load(f)
+    baseline = resident_bytes()
+
+    if backend == 'chroma':
+        collection = chroma_client(workspace).get_collection('langchain')
+
+        def search(query, sources):
+            where = {'source': {'$in': sources}} if sources else None
+            return collection.query(query_embeddings=[query.tolist()], n_results=k, where=where, include=[])['ids'][0]
+    else:
+        index = QuantizedIndex(os.path.join(workspace, backend.split('-')[0]))
+        rescore_factor = 1 if backend.endswith('-direct') else 8
+
+        def search(query, sources):
+            return index.search(query, k, sources, rescore_factor)
+
+    result = {}
+    for name, sources, truth_file in (('all', None, 'truth.npy'), ('filtered', filtered, 'truth-filtered.npy')):
+        truth = np.load(os.path.join(workspace, truth_file))
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = search(query, sources)
+            latencies.append(time.perf_counter() - start)
+            hits += len({int(chunk_id) for chunk_id in found} & set(expected.tolist()))
+        # The first query loads the index; it is reported apart from the steady state
+        result[name] = {
+            'first_ms': round(latencies[0] * 1000, 2),
+            'p50_ms': round(float(np.percentile(latencies[1:], 50)) * 1000, 3),
+            'p95_ms': round(float(np.percentile(latencies[1:], 95)) * 1000, 3),
+            'recall': round(hits / (len(queries) * k), 4),
+        }
+    anonymous, mapped = resident_bytes()
+    result['anonymous_mb'] = round((anonymous - baseline[0]) / 2 ** 20, 1)
+    result['mapped_mb'] = round((mapped - baseline[1]) / 2 ** 20, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--vectors', type=int, default=20000)
+    parser.add_argument('--dimensions', type=int, default=1536, help='1536 for text-embedding-ada-002')
+    parser.add_argument('--clusters', type=int, default=50)
+    parser.add_argument('--sources', type=int, default=200, help='documents the vectors belong to')
+    parser.add_argument('--filter-sources', type=int, default=10, help='sources in the filtered queries')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--measure', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--workspace', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.workspace, args.measure, args.k)))
+        return
+
+    workspace = tempfile.mkdtemp(prefix='ai-info-query-vector-index-')
+    try:
+        build_seconds = prepare(workspace, args)
+        results = {}
+        for backend in BACKENDS:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--measure', backend, '--workspace', workspace, '-k', str(args.k)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results[backend] = json.loads(output.strip().splitlines()[-1])
+            directory = os.path.join(workspace, backend.split('-')[0])
+            results[backend]['disk_mb'] = round(directory_bytes(directory) / 2 ** 20, 1)
+            results[backend]['build_seconds'] = round(build_seconds[backend.split('-')[0]], 2)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"{args.vectors} vectors of {args.dimensions} dimensions, {args.queries} queries, recall@{args.k}; "
+          f"filtered queries keep {args.filter_sources} of {args.sources} sources")
+    print(f"{'backend':<12} {'build s':>8} {'disk MB':>8} {'anon MB':>8} {'mapped MB':>10} {'first ms':>9} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'recall':>7} {'filtered p50':>13} {'recall':>7}")
+    for backend, result in results.items():
+        print(f"{backend:<12} {result['build_seconds']:>8.2f} {result['disk_mb']:>8.1f} {result['anonymous_mb']:>8.1f} "
+              f"{result['mapped_mb']:>10.1f} "
+              f"{result['all']['first_ms']:>9.1f} {result['all']['p50_ms']:>7.2f} {result['all']['p95_ms']:>7.2f} "
+              f"{result['all']['recall']:>7.3f} {result['filtered']['p50_ms']:>13.2f} {result['filtered']['recall']:>7.3f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
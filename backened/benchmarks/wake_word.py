@@ -0,0 +1,171 @@
+"""CPU cost and accuracy of the local voice pipeline.
+
+Measures the energy endpointer over a continuous stream and keyword spotting over
+speech-like utterances, using synthetic audio so that no microphone, model or API
+key is needed. It then scores labelled utterances, a keyword spoken at other speeds
+and pitches and phrases without it, and reports false accepts and false rejects at
+the match and confirm thresholds. Run from the repository root:
+
+    python backened/benchmarks/wake_word.py --seconds 60 --templates 6
+    python backened/benchmarks/wake_word.py --recordings recordings/
+
+A recordings directory holds 16 kHz, 16-bit mono PCM files (``*.pcm``) in
+``templates/``, ``keyword/`` and ``other/``, and replaces the synthetic utterances
+of the accuracy check. Synthetic audio only approximates speech, so thresholds are
+best checked against recordings.
+"""
+import os, sys, glob, time, argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+# The app modules read the API key from the environment; nothing here calls the API
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from modules.voice import Endpointer
+from modules.wake_word import KeywordSpotter, pcm_to_samples
+from config import WAKE_WORD_THRESHOLD, WAKE_WORD_CONFIRM_THRESHOLD
+
+
+SAMPLE_RATE = 16000
+
+
+# First and second formants of a few vowels, in Hz; they shape the spectrum that MFCCs describe
+VOWELS = ((730, 1090), (270, 2290), (300, 870), (530, 1840), (660, 1720), (490, 1350), (440, 1020), (570, 840))
+
+
+def syllable(duration, f0, f1, vowel, pitch=1.0):
+    """A voiced syllable: harmonics of a gliding pitch, weighted by the formants of a vowel."""
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    frequency = (f0 + (f1 - f0) * t / duration) * pitch
+    phase = 2 * np.pi * np.cumsum(frequency) / SAMPLE_RATE
+    formant1, formant2 = VOWELS[vowel]
+    samples = np.zeros(len(t))
+    for k in range(1, int(4000 / frequency.max()) + 1):
+        harmonic = k * frequency
+        weight = np.exp(-((harmonic - formant1) / 120) ** 2) + 0.7 * np.exp(-((harmonic - formant2) / 150) ** 2) + 0.02
+        samples += weight * np.sin(k * phase)
+    return samples / max(np.abs(samples).max(), 1e-9) * np.hanning(len(t)) * 0.3
+
+
+def word(rng, count=3):
+    """Lengths, pitch contours and vowels of a made-up keyword, to be spoken by ``speak``."""
+    return [(rng.uniform(0.15, 0.3), *rng.uniform(120, 300, size=2), int(rng.integers(len(VOWELS)))) for _ in range(count)]
+
+
+def syllables(rng, seconds):
+    """Random syllables, a rough stand-in for speech."""
+    parts, total = [], 0
+    while total < seconds * SAMPLE_RATE:
+        parts.append(syllable(*word(rng, 1)[0]))
+        total += len(parts[-1])
+    return np.concatenate(parts)[:int(seconds * SAMPLE_RATE)].astype(np.float32)
+
+
+def speak(syllable_params, rng, tempo=1.0, pitch=1.0):
+    """Renders a keyword at another speed and pitch, with a little noise, like another speaker would say it."""
+    samples = np.concatenate([
+        syllable(duration / tempo, f0, f1, vowel, pitch) for duration, f0, f1, vowel in syllable_params
+    ])
+    return (samples + rng.normal(0, 0.005, len(samples))).astype(np.float32)
+
+
+def labelled_utterances(rng, keyword, count):
+    """Utterances with the keyword, alone or between other syllables, and as many without it."""
+    positives, negatives = [], []
+    for _ in range(count):
+        spoken = speak(keyword, rng, tempo=rng.uniform(0.8, 1.25), pitch=rng.uniform(0.85, 1.15))
+        if rng.random() < 0.5:
+            spoken = np.concatenate([syllables(rng, rng.uniform(0.2, 0.6)), spoken, syllables(rng, rng.uniform(0.2, 0.6))])
+        positives.append(spoken)
+        negatives.append(syllables(rng, rng.uniform(0.5, 2.0)))
+    return positives, negatives
+
+
+def load_recordings(directory, name):
+    paths = sorted(glob.glob(os.path.join(directory, name, '*.pcm')))
+    return [pcm_to_samples(open(path, 'rb').read()) for path in paths]
+
+
+def error_rates(positive_scores, negative_scores, threshold):
+    """Share of keyword utterances scored above ``threshold`` and of others scored at or below it."""
+    return float(np.mean(positive_scores > threshold)), float(np.mean(negative_scores <= threshold))
+
+
+def stream(rng, seconds, speech_ratio=0.3):
+    """Background noise with bursts of speech-like audio, as 16-bit PCM."""
+    samples = rng.normal(0, 0.003, int(seconds * SAMPLE_RATE)).astype(np.float32)
+    position = 0
+    while position < len(samples):
+        position += int(rng.uniform(1, 4) * SAMPLE_RATE * (1 - speech_ratio))
+        burst = syllables(rng, rng.uniform(0.5, 2.5) * speech_ratio * 2)
+        samples[position:position + len(burst)] += burst[:max(len(samples) - position, 0)]
+        position += len(burst)
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=60.0, help='seconds of audio to process')
+    parser.add_argument('--templates', type=int, default=6, help='templates per keyword')
+    parser.add_argument('--chunk-ms', type=int, default=250, help='size of the audio pushes from the client')
+    parser.add_argument('--utterances', type=int, default=100, help='labelled utterances of each kind')
+    parser.add_argument('--recordings', help='directory of labelled recordings for the accuracy check')
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    pcm = stream(rng, args.seconds)
+    chunk_bytes = SAMPLE_RATE * args.chunk_ms // 1000 * 2
+    endpointer = Endpointer(SAMPLE_RATE)
+    utterances, current = [], None
+    start = time.process_time()
+    for offset in range(0, len(pcm), chunk_bytes):
+        for kind, data in endpointer.feed(pcm[offset:offset + chunk_bytes]):
+            if kind == 'start':
+                current = bytearray(data)
+            elif kind == 'audio':
+                current.extend(data)
+            else:
+                utterances.append(bytes(current))
+    vad_seconds = time.process_time() - start
+
+    keyword = word(rng)
+    spotter = KeywordSpotter(os.devnull, sample_rate=SAMPLE_RATE, max_templates=max(args.templates, 1))
+    if args.recordings:
+        templates = load_recordings(args.recordings, 'templates')
+        positives = load_recordings(args.recordings, 'keyword')
+        negatives = load_recordings(args.recordings, 'other')
+    else:
+        templates = [
+            speak(keyword, rng, tempo=rng.uniform(0.9, 1.1), pitch=rng.uniform(0.9, 1.1)) for _ in range(args.templates)
+        ]
+        positives, negatives = labelled_utterances(rng, keyword, args.utterances)
+    for samples in templates:
+        spotter.add_template('assistant', samples, save=False)
+
+    utterance_seconds = sum(len(utterance) for utterance in utterances) / 2 / SAMPLE_RATE
+    start = time.process_time()
+    for utterance in utterances:
+        spotter.classify('assistant', utterance)
+    spotting_seconds = time.process_time() - start
+
+    print(f'audio:              {args.seconds:.1f} s, {len(utterances)} utterances ({utterance_seconds:.1f} s)')
+    print(f'endpointer:         {vad_seconds * 1000 / args.seconds:.2f} ms CPU per audio second')
+    if utterance_seconds:
+        print(f'keyword spotting:   {spotting_seconds * 1000 / utterance_seconds:.2f} ms CPU per utterance second '
+              f'({args.templates} templates)')
+    print(f'overall:            {(vad_seconds + spotting_seconds) * 1000 / args.seconds:.2f} ms CPU per audio second')
+
+    # A score up to the threshold is a match; up to the confirm threshold, cloud recognition decides.
+    # Keyword utterances above the confirm threshold are missed, other ones below it cost a cloud call.
+    print(f'accuracy:           {len(positives)} keyword and {len(negatives)} other utterances, '
+          f'{len(templates)} templates ({"recorded" if args.recordings else "synthetic"})')
+    positive_scores = np.array([spotter.score('assistant', samples) for samples in positives])
+    negative_scores = np.array([spotter.score('assistant', samples) for samples in negatives])
+    print(f'  median score       keyword {np.median(positive_scores):.3f}   other {np.median(negative_scores):.3f}')
+    for name, threshold in (('match', WAKE_WORD_THRESHOLD), ('confirm', WAKE_WORD_CONFIRM_THRESHOLD)):
+        false_reject, false_accept = error_rates(positive_scores, negative_scores, threshold)
+        print(f'  {name:<8} {threshold:.2f}    false rejects {false_reject:6.1%}   false accepts {false_accept:6.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import os, sys, tempfile
+
+APP_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, os.path.abspath(APP_DIRECTORY))
+
+# The app keeps its stores under relative paths and creates some on import, so the tests run in a scratch directory
+os.chdir(tempfile.mkdtemp(prefix='ai-info-query-tests-'))
+os.environ['ANONYMIZED_TELEMETRY'] = 'False'
@@ -0,0 +1,79 @@
+import pytest
+from langchain_core.documents import Document
+from modules import document_processing
+from modules.answer_cache import current_index_version
+from modules.document_processing import _index_chunks, content_hash, is_unchanged, load_manifest
+
+
+class FakePipeline:
+    def run(self, records, on_batch, collection, keyword_index):
+        ids = [chunk_id for chunk_id, _, _ in records]
+        if ids:
+            on_batch(ids)
+        return {'batches': int(bool(ids)), 'written': len(ids), 'retries': 0, 'embed_seconds': 0.0, 'write_seconds': 0.0}
+
+
+class FakeStore:
+    def __init__(self):
+        self.deleted = []
+        self._collection = None
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+
+class FakeHandle:
+    name = 'default'
+
+    def __init__(self):
+        self.vector_store = FakeStore()
+        self.keyword_index = FakeStore()
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    document_processing.embedding_pipeline.set(FakePipeline())
+
+
+def index(handle, texts, digest):
+    chunks = [Document(page_content=text) for text in texts]
+    return _index_chunks(handle, 'report.pdf', chunks, digest, None, {})
+
+
+def test_is_unchanged_matches_the_indexed_digest():
+    assert not is_unchanged('report.pdf', 'a')
+    index(FakeHandle(), ['first', 'second'], 'a')
+    assert is_unchanged('report.pdf', 'a')
+    assert not is_unchanged('report.pdf', 'b')
+    assert not is_unchanged('report.pdf', None)
+
+
+def test_reindexing_adds_new_chunks_and_removes_stale_ones():
+    handle = FakeHandle()
+    stats = index(handle, ['first', 'second', 'second'], 'a')
+    assert (stats['chunks'], stats['added']) == (2, 2)
+    version = current_index_version()
+
+    stats = index(handle, ['second', 'third'], 'b')
+    assert (stats['chunks'], stats['added'], stats['unchanged'], stats['removed']) == (2, 1, 1, 1)
+    stale = [content_hash('report.pdf', 'first')]
+    assert handle.vector_store.deleted == stale
+    assert handle.keyword_index.deleted == stale
+    assert load_manifest('report.pdf')['ids'] == sorted(content_hash('report.pdf', text) for text in ('second', 'third'))
+    assert current_index_version() > version
+
+
+def test_unchanged_content_leaves_the_index_version_alone():
+    handle = FakeHandle()
+    index(handle, ['first'], 'a')
+    version = current_index_version()
+    stats = index(handle, ['first'], 'a')
+    assert stats['added'] == 0
+    assert handle.vector_store.deleted == []
+    assert current_index_version() == version
+
+
+def test_a_source_without_content_is_an_error():
+    with pytest.raises(ValueError):
+        index(FakeHandle(), [], 'a')
@@ -0,0 +1,108 @@
+import json, time, threading
+import pytest
+from modules.jobs import JobQueue, process_token
+
+
+@pytest.fixture
+def queues(tmp_path):
+    created = []
+
+    def create():
+        queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+        created.append(queue)
+        return queue
+
+    yield create
+    for queue in created:
+        queue._executor.shutdown(wait=True)
+
+
+def insert(queue, job_id, status, owner=None):
+    with queue._lock:
+        queue._conn.execute(
+            'INSERT INTO jobs (id, kind, payload, status, progress, owner, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, 'count', json.dumps({}), status, 0.0, owner, time.time())
+        )
+        queue._conn.commit()
+
+
+def counting(queue, runs):
+    @queue.handler('count')
+    def count(job):
+        runs.append(job.id)
+        return {'ran': True}
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_enqueued_job_runs_and_reports_its_result(queues):
+    queue, runs = queues(), []
+    counting(queue, runs)
+    job = wait_for(queue, queue.enqueue('count', {}))
+    assert job['status'] == 'done'
+    assert job['result'] == {'ran': True}
+    assert runs == [job['id']]
+
+
+def test_a_job_is_claimed_once(queues):
+    first, second = queues(), queues()
+    insert(first, 'job', 'queued')
+    assert first._claim('job') is not None
+    assert second._claim('job') is None
+    assert first._claim('job') is None
+
+
+def test_process_token_tells_a_restarted_pid_apart():
+    pid, started = process_token().split(':')
+    assert int(pid) > 0 and started
+    assert process_token() == process_token()
+
+
+@pytest.mark.parametrize('owner', [
+    '999999999:1',      # the process is gone
+    '123',              # written as a bare pid before owners carried a start time
+    None,
+])
+def test_resume_requeues_jobs_of_dead_owners(queues, owner):
+    queue, runs = queues(), []
+    counting(queue, runs)
+    insert(queue, 'job', 'running', owner)
+    queue.resume()
+    assert wait_for(queue, 'job')['status'] == 'done'
+    assert runs == ['job']
+
+
+def test_resume_leaves_jobs_of_live_owners_alone(queues):
+    queue, runs = queues(), []
+    counting(queue, runs)
+    insert(queue, 'job', 'running', process_token())
+    queue.resume()
+    queue._executor.shutdown(wait=True)
+    assert queue.get('job')['status'] == 'running'
+    assert runs == []
+
+
+def test_workers_resuming_together_run_an_orphaned_job_once(queues):
+    workers = [queues() for _ in range(4)]
+    runs = []
+    for queue in workers:
+        counting(queue, runs)
+    insert(workers[0], 'job', 'running', '999999999:1')
+
+    threads = [threading.Thread(target=queue.resume) for queue in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert wait_for(workers[0], 'job')['status'] == 'done'
+    for queue in workers:
+        queue._executor.shutdown(wait=True)
+    assert runs == ['job']
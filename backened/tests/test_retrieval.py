@@ -0,0 +1,35 @@
+from langchain_core.documents import Document
+from modules.retrieval import reciprocal_rank_fusion
+
+
+def chunk(chunk_id, text=None):
+    return Document(page_content=text or chunk_id, metadata={'id': chunk_id})
+
+
+def ids(documents):
+    return [doc.metadata['id'] for doc in documents]
+
+
+def test_documents_found_by_both_searches_rank_first():
+    keyword = [chunk('a'), chunk('b'), chunk('c')]
+    vector = [chunk('d'), chunk('c'), chunk('e')]
+    assert ids(reciprocal_rank_fusion([keyword, vector])) == ['c', 'a', 'd', 'b', 'e']
+
+
+def test_fusion_keeps_one_copy_of_each_chunk():
+    keyword = [chunk('a', 'from keyword'), chunk('b')]
+    vector = [chunk('a', 'from vector'), chunk('b')]
+    fused = reciprocal_rank_fusion([keyword, vector])
+    assert ids(fused) == ['a', 'b']
+    assert fused[0].page_content == 'from keyword'
+
+
+def test_chunks_without_an_id_are_keyed_on_their_text():
+    fused = reciprocal_rank_fusion([[Document(page_content='same')], [Document(page_content='same')]])
+    assert [doc.page_content for doc in fused] == ['same']
+
+
+def test_a_single_list_keeps_its_order():
+    results = [chunk('x'), chunk('y'), chunk('z')]
+    assert ids(reciprocal_rank_fusion([results])) == ['x', 'y', 'z']
+    assert reciprocal_rank_fusion([[], []]) == []
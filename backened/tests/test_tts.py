@@ -0,0 +1,41 @@
+from modules.tts import split_sentences, SentenceBuffer
+
+
+def feed_words(buffer, text):
+    released = []
+    for word in text.split(' '):
+        released += buffer.feed(word + ' ')
+    return released
+
+
+def test_split_sentences_breaks_on_punctuation_and_newlines():
+    text = 'The index is ready. Did it finish?  Yes!\n\nNext part\nlast line'
+    assert split_sentences(text) == ['The index is ready.', 'Did it finish?', 'Yes!', 'Next part', 'last line']
+    assert split_sentences('  \n ') == []
+
+
+def test_buffer_releases_complete_sentences_only():
+    buffer = SentenceBuffer()
+    assert buffer.feed('The upload finished without') == []
+    assert buffer.feed(' errors. It took') == ['The upload finished without errors.']
+    assert buffer.flush() == ['It took']
+    assert buffer.flush() == []
+
+
+def test_buffer_holds_short_sentences_for_the_next_one():
+    released = feed_words(SentenceBuffer(), 'Dr. Smith went home. Ok. Then he slept well tonight. bye')
+    assert released == ['Dr. Smith went home.', 'Ok. Then he slept well tonight.']
+
+
+def test_buffer_without_strip_adds_up_to_the_text_fed():
+    text = 'First sentence is right here.  Second one follows!\nShort. Third sentence ends it.'
+    buffer = SentenceBuffer(strip=False)
+    pieces = feed_words(buffer, text) + buffer.flush()
+    assert len(pieces) > 1
+    assert ''.join(pieces) == text + ' '
+
+
+def test_flush_drops_whitespace_only_text():
+    buffer = SentenceBuffer(strip=False)
+    buffer.feed('   ')
+    assert buffer.flush() == []
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from modules.vector_index import QuantizedIndex
+
+
+class FakeCollection:
+    """The part of a Chroma collection that an index build reads."""
+
+    def __init__(self, embeddings, sources, metric='l2'):
+        self.embeddings = embeddings
+        self.sources = sources
+        self.metadata = {'hnsw:space': metric}
+
+    def count(self):
+        return len(self.embeddings)
+
+    def get(self, include, limit, offset):
+        rows = range(offset, min(offset + limit, len(self.embeddings)))
+        return {
+            'ids': [f'chunk-{row}' for row in rows],
+            'embeddings': self.embeddings[offset:offset + limit].tolist(),
+            'metadatas': [{'source': self.sources[row]} for row in rows],
+        }
+
+
+def exact_top_k(embeddings, query, k, metric='l2', rows=None):
+    rows = np.arange(len(embeddings)) if rows is None else rows
+    vectors = embeddings[rows]
+    if metric == 'cosine':
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        distances = -(vectors @ (query / np.linalg.norm(query)))
+    else:
+        distances = np.linalg.norm(vectors - query, axis=1)
+    return [f'chunk-{row}' for row in rows[np.argsort(distances, kind='stable')[:k]]]
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    generator = np.random.default_rng(7)
+    embeddings = generator.standard_normal((1500, 48)).astype(np.float32)
+    sources = [f'doc-{row % 5}.pdf' for row in range(len(embeddings))]
+    queries = generator.standard_normal((25, 48)).astype(np.float32)
+    return embeddings, sources, queries
+
+
+@pytest.mark.parametrize('metric', ['l2', 'cosine'])
+@pytest.mark.parametrize('dtype', ['int8', 'float16'])
+def test_rescored_top_k_matches_exact_search(tmp_path, corpus, dtype, metric):
+    embeddings, sources, queries = corpus
+    index = QuantizedIndex.build(FakeCollection(embeddings, sources, metric), str(tmp_path), dtype)
+    assert index.count == len(embeddings) and index.dtype == dtype and index.metric == metric
+    for query in queries:
+        assert index.search(query, k=10) == exact_top_k(embeddings, query, 10, metric)
+
+
+def test_search_keeps_to_the_requested_sources(tmp_path, corpus):
+    embeddings, sources, queries = corpus
+    index = QuantizedIndex.build(FakeCollection(embeddings, sources), str(tmp_path))
+    wanted = ['doc-1.pdf', 'doc-3.pdf', 'missing.pdf']
+    rows = np.array([row for row, source in enumerate(sources) if source in wanted])
+    for query in queries[:5]:
+        assert index.search(query, k=8, sources=wanted) == exact_top_k(embeddings, query, 8, rows=rows)
+    assert index.search(queries[0], k=8, sources=[]) == []
+    assert index.search(queries[0], k=8, sources=['missing.pdf']) == []
+
+
+def test_an_empty_collection_gives_an_empty_index(tmp_path):
+    index = QuantizedIndex.build(FakeCollection(np.empty((0, 0), dtype=np.float32), []), str(tmp_path))
+    assert index.count == 0
+    assert index.search(np.ones(48), k=4) == []
+
+
+def test_unknown_dtype_is_rejected(tmp_path, corpus):
+    embeddings, sources, _ = corpus
+    with pytest.raises(ValueError):
+        QuantizedIndex.build(FakeCollection(embeddings, sources), str(tmp_path), 'int4')
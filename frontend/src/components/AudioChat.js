@@ -1,69 +1,129 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import axios from 'axios';
 import { Mic, MicOff } from 'lucide-react';
 
+const API_URL = 'http://127.0.0.1:5000';
+const SEND_INTERVAL_MS = 250;
+
+// Converts Web Audio float samples to 16-bit PCM, the format the voice session expects
+const toPcm16 = (samples) => {
+  const pcm = new Int16Array(samples.length);
+  for (let i = 0; i < samples.length; i++) {
+    const sample = Math.max(-1, Math.min(1, samples[i]));
+    pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7fff;
+  }
+  return pcm;
+};
+
 const AudioChat = ({ onNewMessage, inputLanguage = 'auto-detect', outputLanguage = 'English' }) => {
   const [isListening, setIsListening] = useState(false);
   const [status, setStatus] = useState('');
-  // const [audioUrl, setAudioUrl] = useState('');
+  const voice = useRef(null);
+
+  // Clips arrive one sentence at a time and are played back in order
+  const playNext = (session) => {
+    if (session.playing || !session.clips.length) return;
+    session.playing = true;
+    const audio = new Audio(`${API_URL}${session.clips.shift()}`);
+    audio.onended = audio.onerror = () => {
+      session.playing = false;
+      playNext(session);
+    };
+    audio.play().catch(error => {
+      console.error("Failed to play audio:", error);
+      session.playing = false;
+      playNext(session);
+    });
+  };
+
+  const stopAudioChat = async () => {
+    const session = voice.current;
+    voice.current = null;
+    setIsListening(false);
+    setStatus('');
+    if (!session) return;
+
+    clearInterval(session.timer);
+    session.events?.close();
+    session.processor?.disconnect();
+    session.source?.disconnect();
+    session.stream?.getTracks().forEach(track => track.stop());
+    session.context?.close();
+    await axios.delete(`${API_URL}/speech/voice/${session.id}`).catch(() => {});
+  };
 
   const startAudioChat = async () => {
     setIsListening(true);
-    setStatus('Listening...');
+    setStatus('Connecting...');
 
     try {
-      // Initiate continuous audio chat
-      const response = await axios.post('http://127.0.0.1:5000/speech/speech_chat', {
+      const { data } = await axios.post(`${API_URL}/speech/voice`, {
         inputLanguage,
         outputLanguage
       });
+      const session = { id: data.voiceSessionId, chunks: [], clips: [], playing: false };
+      voice.current = session;
 
-      if (response.data.userMessage) {
-        // Display user's query
-        onNewMessage({
-          text: response.data.userMessage,
-          sender: 'user'
-        });
-      }
+      session.events = new EventSource(`${API_URL}/speech/voice/${session.id}/events`);
+      session.events.addEventListener('state', (event) => {
+        const { state } = JSON.parse(event.data);
+        setStatus(state === 'active' ? 'Listening...' : 'Say "assistant" to start');
+      });
+      session.events.addEventListener('transcript', () => setStatus('Thinking...'));
+      session.events.addEventListener('answer', (event) => {
+        const { userMessage, assistantResponse } = JSON.parse(event.data);
+        // Display user's query and the assistant's response
+        onNewMessage({ text: userMessage, sender: 'user' });
+        onNewMessage({ text: assistantResponse, sender: 'assistant' });
+        setStatus('Listening...');
+      });
+      session.events.addEventListener('audio', (event) => {
+        session.clips.push(JSON.parse(event.data).url);
+        playNext(session);
+      });
+      session.events.addEventListener('error', (event) => {
+        if (event.data) console.error('Voice session error:', JSON.parse(event.data).message);
+      });
+      session.events.addEventListener('closed', () => stopAudioChat());
 
-      if (response.data.assistantResponse) {
-        // Display assistant's response
-        onNewMessage({
-          text: response.data.assistantResponse,
-          sender: 'assistant'
-        });
+      // Stream microphone audio to the server as 16-bit PCM in short requests
+      session.stream = await navigator.mediaDevices.getUserMedia({ audio: { channelCount: 1, echoCancellation: true } });
+      session.context = new AudioContext({ sampleRate: data.sampleRate });
+      session.source = session.context.createMediaStreamSource(session.stream);
+      session.processor = session.context.createScriptProcessor(4096, 1, 1);
+      session.processor.onaudioprocess = (event) => {
+        session.chunks.push(toPcm16(event.inputBuffer.getChannelData(0)));
+      };
+      session.source.connect(session.processor);
+      session.processor.connect(session.context.destination);
 
-        const audioUrl = response.data.audioUrl;
-        if (audioUrl) {
-          const audio = new Audio(audioUrl);
-          audio.play().catch(error => {
-            console.error("Failed to play audio:", error);
-          });
+      session.timer = setInterval(() => {
+        if (!session.chunks.length) return;
+        const pcm = new Int16Array(session.chunks.reduce((total, chunk) => total + chunk.length, 0));
+        let offset = 0;
+        for (const chunk of session.chunks) {
+          pcm.set(chunk, offset);
+          offset += chunk.length;
         }
-      }
-
-      // Listen for another query after response
-      if (response.data.status !== 'stopped') {
-        startAudioChat();
-      }
-
-      setStatus('');
+        session.chunks = [];
+        axios.post(`${API_URL}/speech/voice/${session.id}/audio`, pcm.buffer, {
+          headers: { 'Content-Type': 'application/octet-stream' }
+        }).catch(() => stopAudioChat());
+      }, SEND_INTERVAL_MS);
     } catch (error) {
       console.error('Audio chat error:', error);
-      setStatus('Error occurred');
       onNewMessage({
         text: 'Sorry, there was an error processing your voice input.',
         sender: 'assistant'
       });
-    } finally {
-      setIsListening(false);
+      await stopAudioChat();
+      setStatus('Error occurred');
     }
   };
 
   return (
     <button
-      onClick={startAudioChat}
-      disabled={isListening}
+      onClick={isListening ? stopAudioChat : startAudioChat}
       className={`audio-button ${isListening ? '' : 'new-chat-button'}`}
     >
       { isListening ? (<Mic />) : (<MicOff />) }
@@ -73,4 +133,4 @@ const AudioChat = ({ onNewMessage, inputLanguage = 'auto-detect', outputLanguage
   );
 };
 
-export default AudioChat;
\ No newline at end of file
+export default AudioChat;
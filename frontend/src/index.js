@@ -3,6 +3,12 @@ import ReactDOM from 'react-dom/client';
 import './index.css';
 import App from './App';
 import reportWebVitals from './reportWebVitals';
+import axios from 'axios';
+
+// Give each browser its own conversation on the backend
+const sessionId = localStorage.getItem('sessionId') || crypto.randomUUID();
+localStorage.setItem('sessionId', sessionId);
+axios.defaults.headers.common['X-Session-Id'] = sessionId;
 
 const root = ReactDOM.createRoot(document.getElementById('root'));
 root.render(